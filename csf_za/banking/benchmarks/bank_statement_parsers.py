@@ -0,0 +1,129 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+"""
+Time the registered bank statement parsers on large generated statement exports, against the
+row-at-a-time strptime/float parsing they replaced.
+
+	bench --site <site> execute csf_za.banking.benchmarks.bank_statement_parsers.execute \\
+		--kwargs "{'rows': 1000000}"
+"""
+
+import csv
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import frappe
+
+from csf_za.overrides.accounts.bank_statement_parsers import (
+	OUTPUT_HEADERS,
+	get_bank_statement_parser,
+)
+
+
+def execute(rows=1000000, repeat=3, banks=None):
+	results = frappe._dict()
+	for bank in banks or frappe.get_hooks("bank_statement_parsers"):
+		parser = get_bank_statement_parser(bank)
+		results[bank] = frappe._dict()
+		with statement_fixture(parser, rows) as path:
+			for label, transform in (
+				("row by row", partial(legacy_transform, parser=parser)),
+				("batched", parser.transform),
+			):
+				results[bank][label] = measure(parser, transform, path, repeat)
+				print(
+					f"{bank:>24} {label:>10}: {results[bank][label].rows} rows, "
+					f"{results[bank][label].megabytes:.1f} MB, best of {repeat}: "
+					f"{results[bank][label].seconds:.3f}s, {results[bank][label].rows_per_second:,.0f} rows/s"
+				)
+
+	return results
+
+
+def measure(parser, transform, path, repeat):
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		count = sum(1 for _row in transform(parser.read(path), "Benchmark Bank Account"))
+		timings.append(time.perf_counter() - start)
+
+	seconds = min(timings)
+	return frappe._dict(
+		{
+			"seconds": seconds,
+			"rows": count - 1,
+			"rows_per_second": (count - 1) / seconds if seconds else 0,
+			"megabytes": os.path.getsize(path) / 1024 / 1024,
+		}
+	)
+
+
+def legacy_transform(rows, bank_account, parser):
+	"""
+	The row at a time parsing before batched column parsing, without its error handling
+	"""
+	for row_num, row in enumerate(rows, start=-parser.header_row):
+		if row_num < 0:
+			continue
+		if row_num == 0:
+			parser.validate_headers(row)
+			yield OUTPUT_HEADERS
+			continue
+
+		amount_value = float(row[parser.amount_index].replace(" ", ""))
+		try:
+			posting_date = datetime.strptime(row[parser.date_index], "%Y-%m-%d")
+		except ValueError:
+			posting_date = datetime.strptime(row[parser.date_index], "%Y/%m/%d")
+
+		yield [
+			posting_date.strftime("%Y-%m-%d"),
+			row[parser.description_index],
+			row[parser.reference_index],
+			0 if amount_value < 0 else amount_value,
+			amount_value * -1 if amount_value < 0 else 0,
+			bank_account,
+		]
+
+
+@contextmanager
+def statement_fixture(parser, rows):
+	"""
+	Yield the path of a temporary statement export in the format of the parser with the given
+	number of rows, removed on exit
+	"""
+	fd, path = tempfile.mkstemp(suffix=".csv")
+	try:
+		with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+			write_statement(f, parser, rows)
+		yield path
+	finally:
+		os.remove(path)
+
+
+def write_statement(f, parser, rows):
+	rng = random.Random(42)
+	width = max(len(parser.expected_headers), parser.amount_index + 1)
+	writer = csv.writer(f)
+
+	for i in range(parser.header_row):
+		writer.writerow([f"Statement line {i + 1}"])
+	writer.writerow(parser.expected_headers + [""] * (width - len(parser.expected_headers)))
+
+	posting_date = date(2020, 1, 1)
+	for i in range(rows):
+		if i % 50 == 0:
+			posting_date += timedelta(days=1)
+
+		row = [""] * width
+		row[parser.date_index] = posting_date.strftime("%Y/%m/%d")
+		row[parser.amount_index] = f"{rng.uniform(-10000, 10000):.2f}"
+		row[parser.description_index] = f"Transaction {i}"
+		row[parser.reference_index] = f"REF{i:08d}"
+		writer.writerow(row)
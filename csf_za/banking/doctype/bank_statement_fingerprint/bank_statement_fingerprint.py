@@ -0,0 +1,144 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+import hashlib
+from decimal import Decimal
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Concat
+from frappe.utils import now_datetime
+
+SKIPPED_ROWS_REPORTED = 100
+
+
+class BankStatementFingerprint(Document):
+	pass
+
+
+class BankStatementFingerprintIndex:
+	"""
+	Per Bank Account index of the bank statement rows already imported, fingerprinted by
+	(date, amount, reference, running balance)
+
+	`CustomBankStatementImport` records a fingerprint for every row it writes to the import file.
+	A row only counts as imported while the Bank Transaction imported from it exists and is not
+	cancelled, so rows that failed, are still pending, or whose Bank Transaction was cancelled or
+	deleted are not skipped when they are uploaded again.
+	"""
+
+	def __init__(self, bank_account, bank_statement_import):
+		self.bank_account = bank_account
+		self.bank_statement_import = bank_statement_import
+		self.skipped = 0
+		self.skipped_rows = []
+
+	def clear(self):
+		"""
+		Remove the fingerprints recorded by an earlier run for the same Bank Statement Import
+		"""
+		delete_fingerprints(self.bank_statement_import)
+
+	def get_fingerprint(self, posting_date, amount, reference, balance):
+		key = "|".join(
+			format_fingerprint_value(value)
+			for value in (self.bank_account, posting_date, amount, reference, balance)
+		)
+		return hashlib.md5(key.encode()).hexdigest()
+
+	def get_imported(self, fingerprints):
+		"""
+		Return the set of the given fingerprints that were already imported, with one query.
+
+		A fingerprint is imported when the row it was recorded for has a successful Data Import Log,
+		matched on the row number Frappe's Importer records in row_indexes, and the Bank Transaction
+		created for the row still exists and is not cancelled. log_index is not used, as the Importer
+		counts it per run instead of per row.
+		"""
+		if not fingerprints:
+			return set()
+
+		fingerprint = frappe.qb.DocType("Bank Statement Fingerprint")
+		import_log = frappe.qb.DocType("Data Import Log")
+		bank_transaction = frappe.qb.DocType("Bank Transaction")
+		return set(
+			(
+				frappe.qb.from_(fingerprint)
+				.inner_join(import_log)
+				.on(
+					(import_log.data_import == fingerprint.bank_statement_import)
+					& (import_log.row_indexes == Concat("[", fingerprint.row_num, "]"))
+				)
+				.inner_join(bank_transaction)
+				.on(bank_transaction.name == import_log.docname)
+				.select(fingerprint.fingerprint)
+				.distinct()
+				.where(
+					fingerprint.fingerprint.isin(list(set(fingerprints)))
+					& (fingerprint.bank_statement_import != self.bank_statement_import)
+					& (import_log.success == 1)
+					& (bank_transaction.docstatus != 2)
+				)
+			).run(pluck=True)
+		)
+
+	def skip(self, row_num):
+		self.skipped += 1
+		if len(self.skipped_rows) < SKIPPED_ROWS_REPORTED:
+			self.skipped_rows.append(row_num)
+
+	def record(self, rows):
+		"""
+		Record the fingerprints of the rows written to the import file, given as
+		(row_num, posting_date, fingerprint) tuples, with row_num the row of the import file, the
+		header row being row 1
+		"""
+		if not rows:
+			return
+
+		now = now_datetime()
+		user = frappe.session.user
+		frappe.db.bulk_insert(
+			"Bank Statement Fingerprint",
+			[
+				"name",
+				"fingerprint",
+				"bank_account",
+				"bank_statement_import",
+				"posting_date",
+				"row_num",
+				"owner",
+				"modified_by",
+				"creation",
+				"modified",
+			],
+			[
+				[
+					frappe.generate_hash(length=10),
+					fingerprint,
+					self.bank_account,
+					self.bank_statement_import,
+					posting_date,
+					row_num,
+					user,
+					user,
+					now,
+					now,
+				]
+				for row_num, posting_date, fingerprint in rows
+			],
+		)
+
+
+def format_fingerprint_value(value):
+	if value is None:
+		return ""
+	if isinstance(value, Decimal):
+		# The same amount as '100.5' or '100.50'
+		return f"{value.normalize():f}"
+
+	return str(value)
+
+
+def delete_fingerprints(bank_statement_import):
+	frappe.db.delete("Bank Statement Fingerprint", {"bank_statement_import": bank_statement_import})
@@ -0,0 +1,135 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+import csv
+import io
+from unittest.mock import patch
+
+import frappe
+from erpnext.accounts.doctype.bank_transaction.bank_transaction import BankTransaction
+from frappe.core.doctype.data_import.importer import Importer
+from frappe.tests.utils import FrappeTestCase
+
+from csf_za.banking.doctype.bank_statement_fingerprint.bank_statement_fingerprint import (
+	BankStatementFingerprintIndex,
+)
+from csf_za.overrides.accounts.bank_statement_parsers import BANK_ZERO, BankStatementParser
+
+
+class TestBankStatementFingerprint(FrappeTestCase):
+	def test_skip_imported_rows(self):
+		parser = BankStatementParser("Bank Zero", BANK_ZERO)
+		rows = [
+			BANK_ZERO.expected_headers,
+			["2024-03-01", "", "", "", "Card purchase", "REF1", "", "-100.50", "1 000.00"],
+			["2024-03-01", "", "", "", "Card purchase", "REF1", "", "-100.50", "899.50"],
+			["2024-03-02", "", "", "", "Deposit", "REF2", "", "200.00", "1 099.50"],
+		]
+
+		first_import = BankStatementFingerprintIndex("Bank Account 1", "BSI-1")
+		with patch.object(first_import, "get_imported", return_value=set()), patch.object(
+			first_import, "record"
+		) as mock_record:
+			self.assertEqual(len(list(parser.transform(rows, "Bank Account 1", first_import))), 4)
+
+		recorded = mock_record.call_args.args[0]
+		self.assertEqual([row_num for row_num, posting_date, fingerprint in recorded], [2, 3, 4])
+		# The same date, amount and reference, but another running balance
+		self.assertNotEqual(recorded[0][2], recorded[1][2])
+
+		# The first two rows were imported, the amounts are formatted differently this time
+		rows[1][7] = rows[2][7] = "-100.5"
+		second_import = BankStatementFingerprintIndex("Bank Account 1", "BSI-2")
+		with patch.object(
+			second_import,
+			"get_imported",
+			side_effect=lambda fingerprints: {recorded[0][2], recorded[1][2]} & set(fingerprints),
+		), patch.object(second_import, "record") as mock_record:
+			transformed = list(parser.transform(rows, "Bank Account 1", second_import))
+
+		self.assertEqual([row[2] for row in transformed[1:]], ["REF2"])
+		self.assertEqual(second_import.skipped, 2)
+		self.assertEqual(second_import.skipped_rows, [1, 2])
+		# Recorded with the row of the import file, as in the row_indexes of its Data Import Log
+		self.assertEqual([row[0] for row in mock_record.call_args.args[0]], [2])
+
+		# Fingerprints are per bank account
+		other_account = BankStatementFingerprintIndex("Bank Account 2", "BSI-3")
+		self.assertNotEqual(
+			other_account.get_fingerprint("2024-03-02", 200, "REF2", 1099.5),
+			second_import.get_fingerprint("2024-03-02", 200, "REF2", 1099.5),
+		)
+
+	def test_get_imported_after_data_import(self):
+		"""
+		Rows imported by Frappe's Importer, as Bank Statement Imports of up to IMPORT_CHUNK_SIZE
+		rows are, count as imported. A row that failed does not, whatever the row before it.
+		"""
+		bank_account = get_bank_account()
+		rows = [
+			BANK_ZERO.expected_headers,
+			["2024-03-01", "", "", "", "Card purchase", "REF1", "", "-100.50", "899.50"],
+			["2024-03-02", "", "", "", "Deposit", "REF2", "", "200.00", "1 099.50"],
+			["2024-03-03", "", "", "", "Deposit", "REF3", "", "300.00", "1 399.50"],
+		]
+		data_import = frappe.get_doc(
+			{
+				"doctype": "Data Import",
+				"reference_doctype": "Bank Transaction",
+				"import_type": "Insert New Records",
+			}
+		).insert()
+
+		first_import = BankStatementFingerprintIndex(bank_account, data_import.name)
+		content = io.StringIO()
+		csv.writer(content).writerows(
+			BankStatementParser("Bank Zero", BANK_ZERO).transform(rows, bank_account, first_import)
+		)
+		import_file = frappe.get_doc(
+			{
+				"doctype": "File",
+				"file_name": f"{data_import.name}.csv",
+				"content": content.getvalue(),
+				"is_private": 1,
+			}
+		).insert()
+		data_import.import_file = import_file.file_url
+		data_import.save()
+
+		def validate(doc):
+			if doc.reference_number == "REF2":
+				frappe.throw("Failed on purpose")
+
+		with patch.object(BankTransaction, "validate", autospec=True, side_effect=validate):
+			Importer("Bank Transaction", data_import=data_import).import_data()
+
+		fingerprints = frappe.get_all(
+			"Bank Statement Fingerprint",
+			filters={"bank_statement_import": data_import.name},
+			order_by="row_num",
+			pluck="fingerprint",
+		)
+		second_import = BankStatementFingerprintIndex(bank_account, "BSI-2")
+		self.assertEqual(
+			second_import.get_imported(fingerprints), {fingerprints[0], fingerprints[2]}
+		)
+
+
+def get_bank_account():
+	if not frappe.db.exists("Bank", "_Test Fingerprint Bank"):
+		frappe.get_doc({"doctype": "Bank", "bank_name": "_Test Fingerprint Bank"}).insert()
+
+	return (
+		frappe.db.get_value(
+			"Bank Account", {"account_name": "_Test Fingerprint", "bank": "_Test Fingerprint Bank"}
+		)
+		or frappe.get_doc(
+			{
+				"doctype": "Bank Account",
+				"account_name": "_Test Fingerprint",
+				"bank": "_Test Fingerprint Bank",
+			}
+		)
+		.insert()
+		.name
+	)
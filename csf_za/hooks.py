@@ -68,7 +68,7 @@ app_license = "mit"
 # ------------
 
 # before_install = "csf_za.install.before_install"
-# after_install = "csf_za.install.after_install"
+after_install = "csf_za.install.after_install"
 
 # Uninstallation
 # ------------
@@ -118,18 +118,29 @@ override_doctype_class = {
 	"Bank Statement Import": "csf_za.overrides.accounts.bank_statement_import.CustomBankStatementImport",
 }
 
+# Bank Statement Parsers
+# ----------------------
+# Parsers for the bank statement exports of each Bank, see csf_za.overrides.accounts.bank_statement_parsers
+
+bank_statement_parsers = {
+	"First National Bank": "csf_za.overrides.accounts.bank_statement_parsers.FIRST_NATIONAL_BANK",
+	"Bank Zero": "csf_za.overrides.accounts.bank_statement_parsers.BANK_ZERO",
+}
+
 
 # Document Events
 # ---------------
 # Hook on document methods and events
 
-# doc_events = {
-# 	"*": {
-# 		"on_update": "method",
-# 		"on_cancel": "method",
-# 		"on_trash": "method"
-# 	}
-# }
+doc_events = {
+	"*": {
+		"on_submit": "csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification.classify_voucher_gl_entries",
+		"on_cancel": "csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification.classify_voucher_gl_entries",
+	},
+	"Account": {
+		"on_update": "csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification.rebuild_account_gl_entry_classifications",
+	},
+}
 
 # Scheduled Tasks
 # ---------------
@@ -240,6 +251,10 @@ fixtures = [
 					"Account-custom_section_valueadded_tax_return_settings",
 					"Account-custom_vat_return_debit_classification",
 					"Account-custom_vat_return_credit_classification",
+					"Bank Statement Import-custom_source_file_hash",
+					"Bank Statement Import-custom_derived_import_file",
+					"Bank Statement Import-custom_skipped_duplicates",
+					"Bank Statement Import-custom_skipped_duplicate_rows",
 				),
 			]
 		],
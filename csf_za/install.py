@@ -0,0 +1,6 @@
+from csf_za.patches.add_vat_return_indexes import execute as add_vat_return_indexes
+
+
+def after_install():
+	# Patches are marked as completed on install instead of being run
+	add_vat_return_indexes()
@@ -5,14 +5,39 @@
 # Code mainly copied from erpnext/accounts/doctype/process_statement_of_accounts/process_statement_of_accounts.py
 # Modified to accept First National Bank statement type 'as is'
 
-from datetime import datetime
+import csv
+import hashlib
+import json
+import os
+import time
+from itertools import islice
 
 import frappe
 from erpnext.accounts.doctype.bank_statement_import.bank_statement_import import (
 	BankStatementImport,
+	update_mapping_db,
 )
 from frappe import _
-from frappe.utils.csvutils import read_csv_content, to_csv
+from frappe.model.naming import NamingSeries, getseries
+from frappe.query_builder.functions import Count
+from frappe.utils import cast, cint, get_files_path, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
+from frappe.utils.scheduler import is_scheduler_inactive
+
+from csf_za.banking.doctype.bank_statement_fingerprint.bank_statement_fingerprint import (
+	BankStatementFingerprintIndex,
+	delete_fingerprints,
+)
+from csf_za.overrides.accounts.bank_statement_parsers import (
+	OUTPUT_FIELDS,
+	get_bank_statement_parser,
+)
+
+FILE_CHUNK_SIZE = 1024 * 1024
+PREVIEW_CACHE_TTL = 60 * 60
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_CHUNK_JOB_TIMEOUT = 30 * 60
+IMPORT_ROW_SAVEPOINT = "bank_statement_import_row"
 
 
 class CustomBankStatementImport(BankStatementImport):
@@ -20,28 +45,53 @@ class CustomBankStatementImport(BankStatementImport):
 		self.modify_uploaded_bank_statement()
 		super().validate()
 
+	def on_trash(self):
+		if hasattr(super(), "on_trash"):
+			super().on_trash()
+		delete_fingerprints(self.name)
+
 	@frappe.whitelist()
 	def modify_uploaded_bank_statement(self):
 		"""
 		Perform a series of operations to modify an uploaded bank statement file if certain conditions are met.
-		If the bank is "First National Bank" or "Bank Zero", and the import file is not already marked as modified
-		(indicated by not having "_modified.csv" at the end of the file name), the function proceeds
-		to split the Amount column in the CSV file into separate Deposit and Withdrawal columns.
+		If a parser is registered for the bank with the `bank_statement_parsers` hook, and the import file is
+		not already marked as modified (indicated by not having "_modified.csv" at the end of the file name),
+		the function proceeds to split the Amount column in the CSV file into separate Deposit and Withdrawal columns.
+
+		The uploaded file is read once and a single derived file is written. The hash of the uploaded file,
+		bank and bank account is recorded, so a file that was already derived is reused instead.
 		"""
-		if self.import_file and self.import_file[-13:] != "_modified.csv":
-			if self.bank in ["First National Bank", "Bank Zero"]:
-				frappe.msgprint(
-					_("The uploaded file will be modified: the Amount column will be split in two")
-				)
+		if not self.import_file or self.import_file[-13:] == "_modified.csv":
+			return
+
+		parser = get_bank_statement_parser(self.bank)
+		if not parser:
+			return
 
-				self.remove_null_bytes()
-				file_doc = frappe.get_doc("File", {"file_url": self.import_file})
-				self.validate_import_file_is_csv(file_doc)
-				if self.bank == "First National Bank":
-					self.split_amount_column_in_csv_file_fnb(file_doc)
-				elif self.bank == "Bank Zero":
-					self.split_amount_column_in_csv_file_bankzero(file_doc)
-				return self.import_file
+		file_doc = frappe.get_doc("File", {"file_url": self.import_file})
+		self.validate_import_file_is_csv(file_doc)
+
+		source_file_hash = self.get_source_file_hash(file_doc)
+		if (
+			source_file_hash == self.get("custom_source_file_hash")
+			and self.get("custom_derived_import_file")
+			and frappe.db.exists("File", {"file_url": self.custom_derived_import_file})
+		):
+			self.import_file = self.custom_derived_import_file
+			return self.import_file
+
+		frappe.msgprint(_("The uploaded file will be modified: the Amount column will be split in two"))
+		self.split_amount_column_in_csv_file(file_doc, parser)
+		self.custom_source_file_hash = source_file_hash
+		self.custom_derived_import_file = self.import_file
+		return self.import_file
+
+	def get_source_file_hash(self, file_doc):
+		"""
+		Hash of the uploaded file's content, the bank and the bank account, which determine the derived file
+		"""
+		content_hash = file_doc.content_hash or get_file_hash(file_doc.get_full_path())
+		return hashlib.md5(f"{content_hash}:{self.bank}:{self.bank_account}".encode()).hexdigest()
 
 	def validate_import_file_is_csv(self, file_doc=None):
 		"""
@@ -55,180 +105,395 @@ class CustomBankStatementImport(BankStatementImport):
 		else:
 			frappe.throw(_("File doc not found"))
 
-	def split_amount_column_in_csv_file_fnb(self, file_doc):
+	def split_amount_column_in_csv_file(self, file_doc, parser):
 		"""
 		Process a given CSV file containing bank statement data, and modifies it to split
 		the "Amount" column into separate "Deposit" and "Withdrawal" columns.
 
-		The function assumes that the input CSV file has specific headers in the third row,
-		and it validates the format of the date and amount values in each row.
+		The header row, columns and the format of the date and amount values are those of the
+		bank's parser, see `bank_statement_parsers`. Null bytes are removed and the headers are
+		validated in the same pass. Rows already imported for the bank account are skipped, see
+		`BankStatementFingerprintIndex`.
 
-		Finally, the function saves the modified CSV file and updates the file URL.
+		Finally, the function saves the modified CSV file and updates the file URL. The file is read
+		and written one row at a time, so large statements are not held in memory.
 		"""
-		file_content = file_doc.get_content()
-		data = read_csv_content(file_content)
-
-		expected_headers = [
-			"Date",
-			"SERVICE FEE",
-			"Amount",
-			"DESCRIPTION",
-			"REFERENCE",
-			"Balance",
-			"CHEQUE NUMBER",
-			None,
-		]
-		if data[2][:6] != expected_headers[:6]:
-			frappe.throw(
-				f"Unexpected headers found in .csv file. Expected: {', '.join(expected_headers[:6])} in third row"
-			)
+		fingerprint_index = BankStatementFingerprintIndex(self.bank_account, self.name)
+		fingerprint_index.clear()
 
-		new_data = [["Date", "Description", "Reference Number", "Deposit", "Withdrawal", "Bank Account"]]
-		for row_num, row in enumerate(data[3:], start=1):
-			amount_value = None
-			try:
-				amount_value = float(row[2])
-			except ValueError:
-				frappe.throw(f"Invalid Amount value found in row {row_num}")
-
-			deposit, withdrawal = (0, 0)
-			bank_account = self.bank_account
-			date = None
-			if amount_value < 0:
-				withdrawal = amount_value * -1
-			else:
-				deposit = amount_value
-
-			# Parse date format as YYYY-MM-DD
-			try:
-				date = datetime.strptime(row[0], "%Y-%m-%d")
-			except ValueError:
-				try:
-					date = datetime.strptime(row[0], "%Y/%m/%d")
-				except ValueError:
-					frappe.throw(f"Invalid date value found in row {row_num}")
-
-			new_row = [date.strftime("%Y-%m-%d"), row[3], row[4], deposit, withdrawal, bank_account]
-			new_data.append(new_row)
-
-		file_data = to_csv(new_data)
 		file_name, extension = file_doc.get_extension()
-		_file = frappe.get_doc(
-			{
-				"doctype": "File",
-				"file_name": file_name + "_modified.csv",
-				"attached_to_doctype": "Bank Statement Import",
-				"attached_to_name": self.name,
-				"folder": "Home",
-				"content": file_data,
-				"is_private": 1,
-			}
+		self.import_file = write_csv_file(
+			file_name,
+			"_modified.csv",
+			parser.transform(
+				parser.read(file_doc.get_full_path()), self.bank_account, fingerprint_index
+			),
+			self.name,
 		)
-		_file.save()
-		self.import_file = _file.file_url
 
-	def split_amount_column_in_csv_file_bankzero(self, file_doc):
+		self.custom_skipped_duplicates = fingerprint_index.skipped
+		self.custom_skipped_duplicate_rows = json.dumps(fingerprint_index.skipped_rows)
+
+	@frappe.whitelist()
+	def start_import(self):
 		"""
-		Process a given CSV file containing bank statement data, and modifies it to split
-		the "Amount" column into separate "Deposit" and "Withdrawal" columns.
+		Import a derived import file of more than IMPORT_CHUNK_SIZE rows in parallel background jobs
+		of IMPORT_CHUNK_SIZE rows each, see `import_bank_transactions_chunk`. Other imports are left
+		to ERPNext, which imports all rows in one job.
+
+		Every job commits its own rows. The result of each row is logged in Data Import Log as ERPNext
+		does, so the form shows the progress and errors of all jobs, and the job finishing last sets
+		the status of the import. Rows imported by an earlier run are skipped. The jobs are enqueued
+		after the request commits.
+		"""
+		column_fields = self.get_import_column_fields()
+		total = count_import_file_rows(self.get_import_file_path()) if column_fields else 0
+		if total <= IMPORT_CHUNK_SIZE:
+			return super().start_import()
+
+		chunks = get_import_chunks(total)
+		if any(is_job_enqueued(get_import_chunk_job_id(self.name, start)) for start, end in chunks):
+			return False
+
+		run_now = frappe.flags.in_test or frappe.conf.developer_mode
+		if is_scheduler_inactive() and not run_now:
+			frappe.throw(_("Scheduler is inactive. Cannot import data."), title=_("Scheduler Inactive"))
+
+		update_mapping_db(self.bank, self.template_options)
+		frappe.db.delete("Data Import Log", {"data_import": self.name, "success": 0})
+		self.db_set("status", "Pending")
+
+		for start, end in chunks:
+			frappe.enqueue(
+				"csf_za.overrides.accounts.bank_statement_import.import_bank_transactions_chunk",
+				queue="long",
+				timeout=IMPORT_CHUNK_JOB_TIMEOUT,
+				job_id=get_import_chunk_job_id(self.name, start),
+				deduplicate=True,
+				enqueue_after_commit=True,
+				now=run_now,
+				bank_statement_import=self.name,
+				column_fields=column_fields,
+				start_row=start,
+				end_row=end,
+				total=total,
+			)
 
-		The function assumes that the input CSV file has specific headers in the first row,
-		and it validates the format of the date and amount values in each row.
+		return True
 
-		Finally, the function saves the modified CSV file and updates the file URL.
+	def get_import_column_fields(self):
 		"""
-		file_content = file_doc.get_content()
-		data = read_csv_content(file_content)
-
-		expected_headers = [
-			"Date",
-			"Day",
-			"Time",
-			"Type",
-			"Description 1",
-			"Description 2",
-			"Fee",
-			"Amount",
-			"Balance",
-			"Has Attachments",
-		]
-		if data[0][:9] != expected_headers[:9]:
-			frappe.throw(
-				f"Unexpected headers found in .csv file. Expected: {', '.join(expected_headers[:9])} in first row"
-			)
+		The Bank Transaction fieldnames the columns of a derived import file are imported into, with
+		the column mapping of the form applied. None if the import file is not a derived import file or
+		a column is mapped to a child table field.
+		"""
+		if not self.import_file or self.import_file != self.get("custom_derived_import_file"):
+			return None
 
-		new_data = [["Date", "Description", "Reference Number", "Deposit", "Withdrawal", "Bank Account"]]
-		for row_num, row in enumerate(data[1:], start=1):
-			amount_value = None
-			try:
-				amount_value = float(row[7].replace(" ", ""))
-			except ValueError:
-				frappe.throw(f"Invalid Amount value found in row {row_num}")
-
-			deposit, withdrawal = (0, 0)
-			bank_account = self.bank_account
-			date = None
-			if amount_value < 0:
-				withdrawal = amount_value * -1
-			else:
-				deposit = amount_value
-
-			# Parse date format as YYYY-MM-DD
-			try:
-				date = datetime.strptime(row[0], "%Y-%m-%d")
-			except ValueError:
-				try:
-					date = datetime.strptime(row[0], "%Y/%m/%d")
-				except ValueError:
-					frappe.throw(f"Invalid date value found in row {row_num}")
-
-			new_row = [date.strftime("%Y-%m-%d"), row[4], row[5], deposit, withdrawal, bank_account]
-			new_data.append(new_row)
-
-		file_data = to_csv(new_data)
-		file_name, extension = file_doc.get_extension()
-		_file = frappe.get_doc(
-			{
-				"doctype": "File",
-				"file_name": file_name + "_modified.csv",
-				"attached_to_doctype": "Bank Statement Import",
-				"attached_to_name": self.name,
-				"folder": "Home",
-				"content": file_data,
-				"is_private": 1,
-			}
-		)
-		_file.save()
-		self.import_file = _file.file_url
+		template_options = json.loads(self.template_options or "{}")
+		column_to_field_map = template_options.get("column_to_field_map") or {}
+		column_fields = []
+		for index, default_fieldname in enumerate(OUTPUT_FIELDS):
+			fieldname = column_to_field_map.get(str(index)) or default_fieldname
+			if fieldname == "Don't Import":
+				fieldname = None
+			elif "." in fieldname:
+				return None
 
-	def remove_null_bytes(self):
+			column_fields.append(fieldname)
+
+		return column_fields
+
+	def get_import_file_path(self):
+		return frappe.get_doc("File", {"file_url": self.import_file}).get_full_path()
+
+	def update_chunked_import_status(self, total, eta=None):
 		"""
-		Remove all null bytes from the input file and write the cleaned data to the output file.
+		Publish the progress of all chunks of the import, and set the status once every row is logged
 		"""
-		if (
-			self.import_file
-			and self.bank == "First National Bank"
-			and self.import_file[-12:] != "_cleaned.csv"
-		):
-			file_doc = frappe.get_doc("File", {"file_url": self.import_file})
-			file_content = file_doc.get_content()
+		log = frappe.qb.DocType("Data Import Log")
+		counts = dict(
+			frappe.qb.from_(log)
+			.select(log.success, Count("*"))
+			.where(log.data_import == self.name)
+			.groupby(log.success)
+			.run()
+		)
+		imported, failed = cint(counts.get(1)), cint(counts.get(0))
 
-			file_content = file_content.replace("\x00", "")
+		frappe.publish_realtime(
+			"data_import_progress",
+			{
+				"data_import": self.name,
+				"current": imported + failed,
+				"total": total,
+				"success": True,
+				"eta": eta or 0,
+			},
+			doctype=self.doctype,
+			docname=self.name,
+		)
+		if imported + failed < total:
+			return
 
-			file_name, extension = file_doc.get_extension()
-			_file = frappe.get_doc(
-				{
-					"doctype": "File",
-					"file_name": file_name + "_cleaned.csv",
-					"attached_to_doctype": "Bank Statement Import",
-					"attached_to_name": self.name,
-					"folder": "Home",
-					"content": file_content,
-					"is_private": 1,
-				}
+		status = "Success" if not failed else "Partial Success" if imported else "Error"
+		self.db_set("status", status)
+		frappe.publish_realtime(
+			"data_import_refresh", {"data_import": self.name}, doctype=self.doctype, docname=self.name
+		)
+
+
+def import_bank_transactions_chunk(bank_statement_import, column_fields, start_row, end_row, total):
+	"""
+	Background job for `CustomBankStatementImport.start_import`, importing rows `start_row` to
+	`end_row` of the import file and committing them. Each row is imported with a name reserved
+	for it and its result is logged in Data Import Log as Frappe's Importer logs it, see
+	`get_import_log_indexes`.
+
+	If the chunk fails, its rows are logged as failed, so the status set by the job finishing last
+	counts them.
+	"""
+	doc = frappe.get_doc("Bank Statement Import", bank_statement_import)
+	imported_rows = set(
+		frappe.get_all(
+			"Data Import Log",
+			filters={
+				"data_import": doc.name,
+				"success": 1,
+				"log_index": ["between", [start_row - 1, end_row - 1]],
+			},
+			pluck="log_index",
+		)
+	)
+	imported_rows = {log_index + 1 for log_index in imported_rows}
+	meta = frappe.get_meta("Bank Transaction")
+	started = time.monotonic()
+	logs = []
+
+	# Committed at once, so the jobs do not wait on each other for the naming series
+	names = reserve_names("Bank Transaction", end_row - start_row + 1)
+	frappe.db.commit()
+
+	frappe.flags.in_import = True
+	try:
+		for row_num, row in read_import_rows(doc.get_import_file_path(), start_row, end_row):
+			if row_num in imported_rows:
+				continue
+
+			logs.append(
+				import_bank_transaction(
+					get_bank_transaction_values(meta, column_fields, row),
+					get_reserved_name(names, row_num - start_row + 1),
+					cint(doc.submit_after_import),
+				)
+				| get_import_log_indexes(row_num)
 			)
-			_file.save()
-			self.import_file = _file.file_url
+
+		insert_import_logs(doc.name, logs)
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		doc.log_error("Bank Statement Import failed")
+		exception = frappe.get_traceback()
+		insert_import_logs(
+			doc.name,
+			[
+				{"success": 0, "exception": exception, **get_import_log_indexes(row_num)}
+				for row_num in range(start_row, end_row + 1)
+				if row_num not in imported_rows
+			],
+		)
+		frappe.db.commit()
+		doc.update_chunked_import_status(total)
+		raise
+	finally:
+		frappe.flags.in_import = False
+
+	# Rough estimate, as if the remaining rows were imported at the rate of this chunk one at a time
+	seconds_per_row = (time.monotonic() - started) / max(len(logs), 1)
+	doc.update_chunked_import_status(total, eta=int(seconds_per_row * (total - end_row)))
+
+
+def get_import_log_indexes(row_num):
+	"""
+	The log_index and row_indexes of the Data Import Log of data row `row_num`, counting from 1, as
+	Frappe's Importer logs a first run of the file: log_index is the 0-based position of the row
+	and row_indexes its row number in the file, with the header as row 1
+	"""
+	return {"log_index": row_num - 1, "row_indexes": json.dumps([row_num + 1])}
+
+
+def import_bank_transaction(values, name, submit):
+	"""
+	Insert, and submit, one Bank Transaction, returning the Data Import Log values of the row.
+	A row that fails is rolled back on its own.
+
+	As with Frappe's Importer, which also inserts every row with `Document.insert`, links, selects
+	and mandatory fields are validated on insert. Unlike the Importer, an invalid value fails its
+	row instead of holding back the whole import as a template warning.
+	"""
+	frappe.db.savepoint(IMPORT_ROW_SAVEPOINT)
+	try:
+		bank_transaction = frappe.get_doc({"doctype": "Bank Transaction", **values})
+		bank_transaction.insert(set_name=name)
+		if submit:
+			bank_transaction.submit()
+
+		return {"success": 1, "docname": bank_transaction.name}
+	except Exception:
+		frappe.db.rollback(save_point=IMPORT_ROW_SAVEPOINT)
+		return {
+			"success": 0,
+			"messages": json.dumps(frappe.local.message_log, default=str),
+			"exception": frappe.get_traceback(),
+		}
+	finally:
+		frappe.clear_messages()
+
+
+def get_bank_transaction_values(meta, column_fields, row):
+	"""
+	The values of a row of the import file, cast by fieldtype as Frappe's Importer parses them.
+	Blank values are left out.
+	"""
+	values = {}
+	for fieldname, value in zip(column_fields, row):
+		if not fieldname or value == "":
+			continue
+
+		df = meta.get_field(fieldname)
+		values[fieldname] = cast(df.fieldtype, value) if df else value
+
+	return values
+
+
+def insert_import_logs(bank_statement_import, logs):
+	if not logs:
+		return
+
+	now = now_datetime()
+	user = frappe.session.user
+	fields = ["success", "docname", "messages", "exception", "log_index", "row_indexes"]
+	frappe.db.bulk_insert(
+		"Data Import Log",
+		["name", "data_import", *fields, "owner", "modified_by", "creation", "modified"],
+		[
+			[
+				frappe.generate_hash(length=10),
+				bank_statement_import,
+				*(log.get(field) for field in fields),
+				user,
+				user,
+				now,
+				now,
+			]
+			for log in logs
+		],
+	)
+
+
+def count_import_file_rows(path):
+	"""
+	The number of rows of an import file, without the header row
+	"""
+	with open(path, newline="", encoding="utf-8") as f:
+		return max(sum(1 for row in csv.reader(f)) - 1, 0)
+
+
+def read_import_rows(path, start_row, end_row):
+	"""
+	Yield (row number, row) for rows `start_row` to `end_row` of an import file, the first row
+	after the header row being row 1
+	"""
+	with open(path, newline="", encoding="utf-8") as f:
+		yield from enumerate(islice(csv.reader(f), start_row, end_row + 1), start=start_row)
+
+
+def get_import_chunks(total):
+	"""
+	(start row, end row) of each chunk of IMPORT_CHUNK_SIZE rows
+	"""
+	return [
+		(start, min(start + IMPORT_CHUNK_SIZE - 1, total))
+		for start in range(1, total + 1, IMPORT_CHUNK_SIZE)
+	]
+
+
+def get_import_chunk_job_id(bank_statement_import, start_row):
+	return f"bank_statement_import::{bank_statement_import}::{start_row}"
+
+
+def reserve_names(doctype, count):
+	"""
+	Reserve `count` consecutive names of the default naming series of the doctype, to be given out
+	by `get_reserved_name`.
+
+	Inserting a document locks the row of its naming series until the transaction is committed, so
+	jobs inserting documents of the same series in parallel, each committing once, would wait on
+	each other. The series is updated with Frappe's naming helpers: `getseries` locks the row and
+	takes the first name, `NamingSeries.update_counter` moves the counter past the last.
+	"""
+	df = frappe.get_meta(doctype).get_field("naming_series")
+	naming_series = NamingSeries(df.default or (df.options or "").split("\n")[0])
+	prefix = naming_series.get_prefix()
+	digits = len(naming_series.series.rsplit(".", 1)[-1])
+
+	first = cint(getseries(prefix, digits))
+	naming_series.update_counter(first + count - 1)
+	return frappe._dict(prefix=prefix, digits=digits, current=first - 1)
+
+
+def get_reserved_name(names, number):
+	"""
+	The `number`th name, counting from 1, of those reserved by `reserve_names`
+	"""
+	return f"{names.prefix}{str(names.current + number).zfill(names.digits)}"
+
+
+def write_csv_file(file_name, suffix, rows, bank_statement_import):
+	"""
+	Write the rows to a new private File named `<file_name><suffix>` attached to the Bank Statement
+	Import one row at a time, and return its file_url
+	"""
+	file_name = file_name + suffix
+	if os.path.exists(get_files_path(file_name, is_private=1)):
+		file_name = file_name.removesuffix(suffix) + "-" + frappe.generate_hash(length=6) + suffix
+
+	path = get_files_path(file_name, is_private=1)
+	try:
+		with open(path, "w", newline="", encoding="utf-8") as f:
+			csv.writer(f, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+	except BaseException:
+		os.remove(path)
+		raise
+
+	_file = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"attached_to_doctype": "Bank Statement Import",
+			"attached_to_name": bank_statement_import,
+			"folder": "Home",
+			"is_private": 1,
+			"file_size": os.path.getsize(path),
+			"content_hash": get_file_hash(path),
+		}
+	)
+	_file.save()
+	return _file.file_url
+
+
+def get_file_hash(path):
+	"""
+	The content hash of a file on disk, as File.content_hash, read in chunks of FILE_CHUNK_SIZE
+	"""
+	content_hash = hashlib.md5()
+	with open(path, "rb") as f:
+		while chunk := f.read(FILE_CHUNK_SIZE):
+			content_hash.update(chunk)
+
+	return content_hash.hexdigest()
 
 
 @frappe.whitelist()
@@ -236,14 +501,65 @@ def custom_get_preview_from_template(data_import, import_file=None, google_sheet
 	"""
 	Override get_preview_from_template to only generate a preview of the bank statement import data
 	if there are no nulls in the content.
+
+	Previews of a file are cached for PREVIEW_CACHE_TTL seconds per content hash, bank and column mapping,
+	as the form asks for the preview again while the mapping is edited.
 	"""
+	bank_statement_import = frappe.get_doc("Bank Statement Import", data_import)
+	if not import_file:
+		return bank_statement_import.get_preview_from_template(import_file, google_sheets_url)
+
 	file_doc = frappe.get_doc("File", {"file_url": import_file})
-	file_content = file_doc.get_content()
-	contains_nulls = file_content.find("\x00")
+	path = file_doc.get_full_path()
+	cache_key = get_preview_cache_key(
+		file_doc.content_hash or get_file_hash(path),
+		bank_statement_import.bank,
+		bank_statement_import.template_options,
+	)
+	preview = frappe.cache.get_value(cache_key)
+	if preview is None:
+		if file_contains_null_bytes(path):
+			preview = {"columns": [], "data": [], "warnings": []}
+		else:
+			preview = bank_statement_import.get_preview_from_template(import_file, google_sheets_url)
 
-	if contains_nulls == -1:
-		return frappe.get_doc("Bank Statement Import", data_import).get_preview_from_template(
-			import_file, google_sheets_url
-		)
-	else:
-		return {"columns": [], "data": [], "warnings": []}
+		frappe.cache.set_value(cache_key, preview, expires_in_sec=PREVIEW_CACHE_TTL)
+
+	return add_skipped_duplicates_warning(preview, bank_statement_import)
+
+
+def add_skipped_duplicates_warning(preview, bank_statement_import):
+	"""
+	Report the rows of the uploaded statement that were skipped because they were already imported
+	"""
+	skipped = bank_statement_import.get("custom_skipped_duplicates")
+	if not skipped or not preview.get("columns"):
+		return preview
+
+	skipped_rows = json.loads(bank_statement_import.custom_skipped_duplicate_rows or "[]")
+	message = _("{0} rows of the uploaded statement were already imported and have been skipped").format(
+		skipped
+	)
+	if skipped_rows:
+		message += ": " + _("rows {0}").format(", ".join(str(row_num) for row_num in skipped_rows))
+		if skipped > len(skipped_rows):
+			message += ", ..."
+
+	return {**preview, "warnings": [*preview.get("warnings", []), {"message": message}]}
+
+
+def get_preview_cache_key(content_hash, bank, template_options):
+	column_mapping = hashlib.md5((template_options or "").encode()).hexdigest()
+	return f"bank_statement_import_preview::{content_hash}::{bank}::{column_mapping}"
+
+
+def file_contains_null_bytes(path):
+	"""
+	Scan the file for null bytes in chunks of FILE_CHUNK_SIZE, stopping at the first one found
+	"""
+	with open(path, "rb") as f:
+		while chunk := f.read(FILE_CHUNK_SIZE):
+			if b"\x00" in chunk:
+				return True
+
+	return False
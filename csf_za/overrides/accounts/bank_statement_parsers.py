@@ -0,0 +1,295 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+"""
+Bank statement parsers for CustomBankStatementImport.
+
+A parser is declared as a spec per bank and registered with the `bank_statement_parsers` hook:
+
+	bank_statement_parsers = {
+		"First National Bank": "csf_za.overrides.accounts.bank_statement_parsers.FIRST_NATIONAL_BANK",
+	}
+
+A spec describes the export of the bank:
+
+	header_row: index of the header row, rows before it are skipped
+	expected_headers: the leading headers the header row must have
+	columns: index of the "date", "amount", "description", "reference" and "balance" columns
+	amount_parser: function parsing an amount value to a Decimal, raising ValueError if it is invalid
+	date_formats: formats a date value can have, the format of a file is detected from its first row
+	encoding: encoding of the file
+	strip_null_bytes: whether the export contains null bytes that need to be removed
+"""
+
+import csv
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import frappe
+from frappe import _
+
+OUTPUT_HEADERS = ["Date", "Description", "Reference Number", "Deposit", "Withdrawal", "Bank Account"]
+# The Bank Transaction fields the OUTPUT_HEADERS columns are imported into
+OUTPUT_FIELDS = ["date", "description", "reference_number", "deposit", "withdrawal", "bank_account"]
+PARSE_BATCH_SIZE = 10000
+
+# Date formats that can be parsed with date.fromisoformat once the separator is replaced
+ISO_DATE_SEPARATORS = {"%Y-%m-%d": "-", "%Y/%m/%d": "/", "%Y.%m.%d": "."}
+
+_compiled_parsers = {}
+
+
+def parse_amount(value):
+	"""
+	Parse an amount exactly, e.g. '-1250.00', '-1 250.00', '1,250.00-'. Spaces and commas are
+	taken as thousands separators and a trailing minus as the sign.
+	"""
+	try:
+		amount = Decimal(value)
+	except (InvalidOperation, TypeError):
+		if not isinstance(value, str):
+			raise ValueError(value)
+
+		cleaned = value.replace(" ", "").replace("\xa0", "").replace(",", "")
+		if cleaned.endswith("-"):
+			cleaned = "-" + cleaned[:-1]
+		try:
+			amount = Decimal(cleaned)
+		except InvalidOperation:
+			raise ValueError(value)
+
+	if not amount.is_finite():
+		raise ValueError(value)
+
+	return amount
+
+
+def get_date_parser(date_format):
+	"""
+	Return a function converting a date value in the format to YYYY-MM-DD, raising ValueError if
+	it is invalid. Formats in ISO_DATE_SEPARATORS take the date.fromisoformat fast path first.
+	"""
+	separator = ISO_DATE_SEPARATORS.get(date_format)
+
+	def parse_date(value):
+		if not isinstance(value, str):
+			raise ValueError(value)
+
+		if separator:
+			try:
+				return date.fromisoformat(value.replace(separator, "-")).isoformat()
+			except ValueError:
+				pass
+
+		return datetime.strptime(value, date_format).strftime("%Y-%m-%d")
+
+	return parse_date
+
+
+FIRST_NATIONAL_BANK = frappe._dict(
+	{
+		"header_row": 2,
+		"expected_headers": ["Date", "SERVICE FEE", "Amount", "DESCRIPTION", "REFERENCE", "Balance"],
+		"columns": {"date": 0, "amount": 2, "description": 3, "reference": 4, "balance": 5},
+		"amount_parser": parse_amount,
+		"date_formats": ("%Y-%m-%d", "%Y/%m/%d"),
+		"encoding": "utf-8-sig",
+		"strip_null_bytes": True,
+	}
+)
+
+BANK_ZERO = frappe._dict(
+	{
+		"header_row": 0,
+		"expected_headers": [
+			"Date",
+			"Day",
+			"Time",
+			"Type",
+			"Description 1",
+			"Description 2",
+			"Fee",
+			"Amount",
+			"Balance",
+		],
+		"columns": {"date": 0, "amount": 7, "description": 4, "reference": 5, "balance": 8},
+		"amount_parser": parse_amount,
+		"date_formats": ("%Y-%m-%d", "%Y/%m/%d"),
+		"encoding": "utf-8-sig",
+		"strip_null_bytes": False,
+	}
+)
+
+
+class BankStatementParser:
+	"""
+	A bank statement parser compiled from a spec, see the module docstring
+	"""
+
+	def __init__(self, bank, spec):
+		self.bank = bank
+		self.header_row = spec.header_row
+		self.expected_headers = list(spec.expected_headers)
+		self.date_index = spec.columns["date"]
+		self.amount_index = spec.columns["amount"]
+		self.description_index = spec.columns["description"]
+		self.reference_index = spec.columns["reference"]
+		self.balance_index = spec.columns.get("balance")
+		self.parse_amount = spec.amount_parser
+		self.date_formats = tuple(spec.date_formats)
+		self.date_parsers = {
+			date_format: get_date_parser(date_format) for date_format in self.date_formats
+		}
+		self.encoding = spec.encoding or "utf-8-sig"
+		self.strip_null_bytes = bool(spec.strip_null_bytes)
+
+	def read(self, path):
+		"""
+		Yield the rows of the bank statement file, reading one line at a time.
+		Values are stripped and blank values are None, as with `read_csv_content`.
+		"""
+		with open(path, newline="", encoding=self.encoding) as f:
+			lines = (line.replace("\x00", "") for line in f) if self.strip_null_bytes else f
+			for row in csv.reader(lines):
+				yield [value.strip() or None for value in row]
+
+	def transform(self, rows, bank_account, fingerprint_index=None):
+		"""
+		Yield the rows in the format of the Bank Statement Import template, with the Amount column
+		split into Deposit and Withdrawal columns
+
+		Rows are parsed in batches of PARSE_BATCH_SIZE, a column at a time. The date format is
+		detected once, from the first row, and amounts are parsed as exact Decimals.
+
+		With a `BankStatementFingerprintIndex`, rows that were already imported are skipped and the
+		fingerprints of the other rows are recorded with the row of the import file they are written
+		to, with one lookup per batch.
+		"""
+		rows = iter(rows)
+		for row_num, row in enumerate(islice(rows, self.header_row + 1), start=-self.header_row):
+			if row_num == 0:
+				self.validate_headers(row)
+				yield OUTPUT_HEADERS
+
+		parse_date = None
+		first_row_num = 1
+		# Rows written to the import file after the header row
+		written = 0
+		while batch := list(islice(rows, PARSE_BATCH_SIZE)):
+			date_values = [row[self.date_index] for row in batch]
+			if not parse_date:
+				parse_date = self.date_parsers[self.detect_date_format(date_values[0], first_row_num)]
+
+			dates = self.parse_dates(parse_date, date_values, first_row_num)
+			amounts = self.parse_amounts([row[self.amount_index] for row in batch], first_row_num)
+
+			fingerprints = imported = None
+			if fingerprint_index:
+				fingerprints = [
+					fingerprint_index.get_fingerprint(
+						posting_date, amount_value, row[self.reference_index], self.get_balance(row)
+					)
+					for row, posting_date, amount_value in zip(batch, dates, amounts)
+				]
+				imported = fingerprint_index.get_imported(fingerprints)
+				recorded = []
+
+			for i, (row, posting_date, amount_value) in enumerate(zip(batch, dates, amounts)):
+				if fingerprints:
+					if fingerprints[i] in imported:
+						fingerprint_index.skip(first_row_num + i)
+						continue
+					# The row number in row_indexes of its Data Import Log, the header row being row 1
+					recorded.append((written + 2, posting_date, fingerprints[i]))
+
+				deposit, withdrawal = (0, 0)
+				if amount_value < 0:
+					withdrawal = amount_value * -1
+				else:
+					deposit = amount_value
+
+				written += 1
+				yield [
+					posting_date,
+					row[self.description_index],
+					row[self.reference_index],
+					deposit,
+					withdrawal,
+					bank_account,
+				]
+
+			if fingerprint_index:
+				fingerprint_index.record(recorded)
+
+			first_row_num += len(batch)
+
+	def get_balance(self, row):
+		"""
+		The running balance of the row for its fingerprint, as parsed amount if it is valid
+		"""
+		if self.balance_index is None or self.balance_index >= len(row):
+			return None
+
+		try:
+			return self.parse_amount(row[self.balance_index])
+		except ValueError:
+			return row[self.balance_index]
+
+	def validate_headers(self, row):
+		if row[: len(self.expected_headers)] != self.expected_headers:
+			frappe.throw(
+				_("Unexpected headers found in .csv file. Expected: {0} in row {1}").format(
+					", ".join(self.expected_headers), self.header_row + 1
+				)
+			)
+
+	def detect_date_format(self, value, row_num):
+		for date_format, parse_date in self.date_parsers.items():
+			try:
+				parse_date(value)
+				return date_format
+			except ValueError:
+				continue
+
+		frappe.throw(_("Invalid date value found in row {0}").format(row_num))
+
+	def parse_dates(self, parse_date, values, first_row_num):
+		"""
+		Parse a column of date values with the detected format, falling back to trying every date
+		format per value when some are in another format or invalid
+		"""
+		try:
+			return [parse_date(value) for value in values]
+		except ValueError:
+			return [
+				self.date_parsers[self.detect_date_format(value, row_num)](value)
+				for row_num, value in enumerate(values, start=first_row_num)
+			]
+
+	def parse_amounts(self, values, first_row_num):
+		parse_amount = self.parse_amount
+		try:
+			return [parse_amount(value) for value in values]
+		except ValueError:
+			for row_num, value in enumerate(values, start=first_row_num):
+				try:
+					parse_amount(value)
+				except ValueError:
+					frappe.throw(_("Invalid Amount value found in row {0}").format(row_num))
+
+
+def get_bank_statement_parser(bank):
+	"""
+	Return the compiled parser registered for the bank with the `bank_statement_parsers` hook,
+	or None if there is none. The last registered parser for a bank wins.
+	"""
+	parsers = frappe.get_hooks("bank_statement_parsers")
+	if not bank or not parsers.get(bank):
+		return None
+
+	spec_path = parsers[bank][-1]
+	if (bank, spec_path) not in _compiled_parsers:
+		_compiled_parsers[(bank, spec_path)] = BankStatementParser(bank, frappe.get_attr(spec_path))
+
+	return _compiled_parsers[(bank, spec_path)]
@@ -0,0 +1,91 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+import csv
+import json
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.core.doctype.data_import.importer import ImportFile
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+
+from csf_za.overrides.accounts.bank_statement_import import (
+	get_bank_transaction_values,
+	get_import_log_indexes,
+	import_bank_transactions_chunk,
+)
+from csf_za.overrides.accounts.bank_statement_parsers import OUTPUT_FIELDS, OUTPUT_HEADERS
+
+MODULE = "csf_za.overrides.accounts.bank_statement_import"
+
+
+class TestBankStatementImport(FrappeTestCase):
+	def test_chunk_values_match_importer(self):
+		"""
+		The chunk importer parses the rows of a derived import file as Frappe's Importer does, and
+		logs them with the same log_index and row_indexes
+		"""
+		rows = [
+			["2024-03-01", "Card purchase", "REF1", 0, "100.50", "Bank Account 1"],
+			["2024-03-02", "Deposit", "", "200", 0, "Bank Account 1"],
+		]
+		with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as f:
+			csv.writer(f).writerows([OUTPUT_HEADERS, *rows])
+		self.addCleanup(os.remove, f.name)
+
+		payloads = ImportFile(
+			"Bank Transaction", f.name, import_type="Insert New Records"
+		).get_payloads_for_import()
+
+		meta = frappe.get_meta("Bank Transaction")
+		for log_index, (row_num, row, payload) in enumerate(
+			zip((1, 2), rows, payloads, strict=True)
+		):
+			values = get_bank_transaction_values(meta, OUTPUT_FIELDS, [str(value) for value in row])
+			values["date"] = getdate(values["date"])
+			self.assertEqual(
+				values,
+				{
+					fieldname: getdate(value) if fieldname == "date" else value
+					for fieldname, value in payload.doc.items()
+					if fieldname in OUTPUT_FIELDS and value not in (None, "")
+				},
+			)
+			self.assertEqual(
+				get_import_log_indexes(row_num),
+				{
+					"log_index": log_index,
+					"row_indexes": json.dumps([row.row_number for row in payload.rows]),
+				},
+			)
+
+	def test_import_bank_transactions_chunk(self):
+		doc = MagicMock(submit_after_import=0)
+		doc.name = "BSI-1"
+		rows = [(row_num, ["2024-03-01", "Deposit", f"REF{row_num}"]) for row_num in (3, 4, 5)]
+
+		with patch(f"{MODULE}.frappe.get_doc", return_value=doc), patch(
+			f"{MODULE}.frappe.get_all", return_value=[3]
+		) as mock_get_all, patch(f"{MODULE}.frappe.get_meta"), patch(
+			f"{MODULE}.reserve_names", return_value=frappe._dict(prefix="BT-", digits=3, current=0)
+		), patch(
+			f"{MODULE}.frappe.db.commit"
+		), patch(
+			f"{MODULE}.read_import_rows", return_value=rows
+		), patch(
+			f"{MODULE}.import_bank_transaction", return_value={"success": 1}
+		) as mock_import, patch(
+			f"{MODULE}.insert_import_logs"
+		) as mock_insert_logs:
+			import_bank_transactions_chunk("BSI-1", ["date"], 3, 5, 5)
+
+		# Rows 3 to 5 are logged with log_index 2 to 4, row 4 was imported by an earlier run
+		self.assertEqual(mock_get_all.call_args.kwargs["filters"]["log_index"], ["between", [2, 4]])
+		self.assertEqual([call.args[1] for call in mock_import.call_args_list], ["BT-001", "BT-003"])
+		self.assertEqual(
+			[(log["log_index"], log["row_indexes"]) for log in mock_insert_logs.call_args.args[1]],
+			[(2, "[4]"), (4, "[6]")],
+		)
@@ -0,0 +1,25 @@
+import frappe
+
+# (doctype, fields, index name) of the composite indexes for the VAT return access paths
+VAT_RETURN_INDEXES = (
+	# `fetch_gl_entries`: account IN (tax accounts) AND posting_date BETWEEN ...
+	("GL Entry", ["account", "posting_date"], "account_posting_date_index"),
+	# The Transactions grid, the unclassified count, the classification totals and the
+	# Linked Transactions report: parent = ... AND classification = ... AND is_cancelled = 0
+	(
+		"Value-added Tax Return GL Entry",
+		["parent", "classification", "is_cancelled"],
+		"parent_classification_is_cancelled_index",
+	),
+	# `sync_gl_entries`: parent = ... AND gl_entry IN (...)
+	("Value-added Tax Return GL Entry", ["parent", "gl_entry"], "parent_gl_entry_index"),
+)
+
+
+def execute():
+	"""
+	Add the composite indexes the VAT return queries are tuned for. The Journal Entry Account and
+	Sales/Purchase Taxes and Charges lookups use the `parent` index every child table has.
+	"""
+	for doctype, fields, index_name in VAT_RETURN_INDEXES:
+		frappe.db.add_index(doctype, fields, index_name=index_name)
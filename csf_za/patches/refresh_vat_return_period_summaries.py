@@ -0,0 +1,13 @@
+import frappe
+
+from csf_za.tax_compliance.doctype.value_added_tax_return_period_summary.value_added_tax_return_period_summary import (
+	refresh_period_summary,
+)
+
+
+def execute():
+	"""
+	Summarise the Transactions of existing VAT returns for the Value-added Tax Analytics report
+	"""
+	for vat_return in frappe.get_all("Value-added Tax Return", fields=["name", "company"]):
+		refresh_period_summary(vat_return.name, vat_return.company)
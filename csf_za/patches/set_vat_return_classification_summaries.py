@@ -0,0 +1,15 @@
+import frappe
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	get_classification_totals_from_db,
+)
+
+
+def execute():
+	"""
+	Store the Classification Summary of existing VAT returns
+	"""
+	for vat_return in frappe.get_all("Value-added Tax Return", pluck="name"):
+		doc = frappe.get_doc("Value-added Tax Return", vat_return)
+		doc.refresh_classification_summary(get_classification_totals_from_db(vat_return))
+		doc.update_child_table("classification_summary")
@@ -0,0 +1,20 @@
+import frappe
+
+
+def execute():
+	"""
+	Submit or cancel the stored Transactions rows of existing submitted or cancelled VAT returns
+	"""
+	vat_return = frappe.qb.DocType("Value-added Tax Return")
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	(
+		frappe.qb.update(child)
+		.join(vat_return)
+		.on(vat_return.name == child.parent)
+		.set(child.docstatus, vat_return.docstatus)
+		.where(
+			(child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+			& (vat_return.docstatus != 0)
+		)
+	).run()
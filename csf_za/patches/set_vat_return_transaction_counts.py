@@ -0,0 +1,21 @@
+import frappe
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	get_classification_totals_from_db,
+)
+
+
+def execute():
+	"""
+	Store the Transactions counts of existing VAT returns, now that the Transactions are no longer
+	loaded with the document
+	"""
+	for vat_return in frappe.get_all("Value-added Tax Return", pluck="name"):
+		classification_totals = get_classification_totals_from_db(vat_return)
+		frappe.db.set_value(
+			"Value-added Tax Return",
+			vat_return,
+			"transactions_count",
+			sum(totals.count for totals in classification_totals.values()),
+			update_modified=False,
+		)
@@ -0,0 +1,168 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+"""
+Compare the rows transferred and the wall time of `ValueaddedTaxReturn.fetch_gl_entries` with the
+single 7-table join it replaced, on a synthetic ledger.
+
+	bench --site <site> execute csf_za.tax_compliance.benchmarks.gl_entry_retrieval.execute \\
+		--kwargs "{'company': 'Sun Power Pty Ltd', 'sales_invoices': 10000}"
+
+Recorded on 2026-10-18 with `sales_invoices=10000, journal_entries=10000` (21,100 GL Entries,
+50,000 Journal Entry legs, 2 tax rows per invoice). The SQL of both retrievals was replayed on an
+in-memory SQLite 3.40 copy of the synthetic ledger with the same indexes, not on MariaDB, so the
+wall times leave out the network and only the counts carry over to a site:
+
+	  joined:  1 queries, 72200 rows / 1371800 values transferred, best of 5: 0.909s
+	 batched: 23 queries, 82200 rows /  592100 values transferred, best of 5: 1.052s
+
+The batched retrieval returns one more row per Journal Entry (its GL Entry next to its legs), but
+less than half the values, as every row only carries the columns of its own table.
+"""
+
+import time
+from contextlib import contextmanager
+
+import frappe
+from pypika import Case
+
+from csf_za.tax_compliance.benchmarks.synthetic_ledger import synthetic_ledger
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	transform_gl_entries,
+)
+
+
+def execute(company, date_from="2024-03-01", date_to="2024-04-30", repeat=3, **ledger_kwargs):
+	with synthetic_ledger(company, date_from, date_to, **ledger_kwargs) as ledger:
+		vat_return = frappe.get_doc(
+			{
+				"doctype": "Value-added Tax Return",
+				"company": company,
+				"date_from": date_from,
+				"date_to": date_to,
+			}
+		)
+
+		results = frappe._dict({"ledger": ledger})
+		for label, fetch in (
+			("joined", lambda: fetch_gl_entries_with_joins(vat_return)),
+			("batched", vat_return.fetch_gl_entries),
+		):
+			results[label] = measure(fetch, repeat)
+
+		print(f"Synthetic ledger: {dict(ledger)}")
+		for label in ("joined", "batched"):
+			print(
+				f"{label:>8}: {results[label].queries} queries, {results[label].rows} rows / "
+				f"{results[label].values} values transferred, {results[label].vouchers} vouchers, "
+				f"best of {repeat}: {results[label].seconds:.3f}s"
+			)
+
+		return results
+
+
+def measure(fetch, repeat):
+	timings = []
+	for _ in range(repeat):
+		with count_rows_transferred() as counter:
+			start = time.perf_counter()
+			gl_entries = fetch()
+			timings.append(time.perf_counter() - start)
+
+	return frappe._dict(
+		{
+			"seconds": min(timings),
+			"queries": counter.queries,
+			"rows": counter.rows,
+			"values": counter.values,
+			"vouchers": len(transform_gl_entries(gl_entries)),
+		}
+	)
+
+
+@contextmanager
+def count_rows_transferred():
+	"""
+	Count the queries run, the rows they returned and the values (columns) in those rows while the
+	context is active
+	"""
+	counter = frappe._dict({"queries": 0, "rows": 0, "values": 0})
+	sql = frappe.db.sql
+
+	def counting_sql(*args, **kwargs):
+		result = sql(*args, **kwargs)
+		counter.queries += 1
+		counter.rows += len(result or [])
+		counter.values += sum(len(row) for row in result or [])
+		return result
+
+	frappe.db.sql = counting_sql
+	try:
+		yield counter
+	finally:
+		frappe.db.sql = sql
+
+
+def fetch_gl_entries_with_joins(vat_return):
+	"""
+	The GL Entry retrieval as it was before `fetch_gl_entries` split it into batched lookups
+	"""
+	vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", vat_return.company)
+
+	gle = frappe.qb.DocType("GL Entry")
+	je = frappe.qb.DocType("Journal Entry")
+	jea = frappe.qb.DocType("Journal Entry Account")
+	si = frappe.qb.DocType("Sales Invoice")
+	sitc = frappe.qb.DocType("Sales Taxes and Charges")
+	pi = frappe.qb.DocType("Purchase Invoice")
+	pitc = frappe.qb.DocType("Purchase Taxes and Charges")
+
+	tax_accounts = [row.account for row in vat_return_settings.tax_accounts]
+
+	query = (
+		frappe.qb.from_(gle)
+		.left_join(je)
+		.on(je.name == gle.voucher_no)
+		.left_join(jea)
+		.on(jea.parent == je.name)
+		.left_join(si)
+		.on((gle.voucher_type == "Sales Invoice") & (si.name == gle.voucher_no))
+		.left_join(sitc)
+		.on(sitc.parent == si.name)
+		.left_join(pi)
+		.on((gle.voucher_type == "Purchase Invoice") & (pi.name == gle.voucher_no))
+		.left_join(pitc)
+		.on(pitc.parent == pi.name)
+		.select(
+			gle.name,
+			gle.voucher_type,
+			gle.voucher_no,
+			gle.posting_date,
+			gle.is_cancelled,
+			gle.debit_in_account_currency.as_("general_ledger_debit"),
+			gle.credit_in_account_currency.as_("general_ledger_credit"),
+			je.total_debit.as_("journal_entry_total_debit"),
+			je.total_credit.as_("journal_entry_total_credit"),
+			je.docstatus.as_("journal_entry_docstatus"),
+			jea.account.as_("journal_entry_account"),
+			jea.debit.as_("journal_entry_account_debit"),
+			jea.credit.as_("journal_entry_account_credit"),
+			jea.idx.as_("journal_entry_account_idx"),
+			sitc.tax_amount.as_("sales_invoice_taxes_tax_amount"),
+			sitc.total.as_("sales_invoice_taxes_total"),
+			pitc.tax_amount.as_("purchase_invoice_taxes_tax_amount"),
+			pitc.total.as_("purchase_invoice_taxes_total"),
+			Case()
+			.when(gle.voucher_type == "Sales Invoice", si.taxes_and_charges)
+			.when(gle.voucher_type == "Purchase Invoice", pi.taxes_and_charges)
+			.else_(None)
+			.as_("taxes_and_charges_template"),
+		)
+		.where(
+			(gle.posting_date >= vat_return.date_from)
+			& (gle.posting_date <= vat_return.date_to)
+			& (gle.account.isin(tax_accounts))
+		)
+	)
+
+	return query.run(as_dict=True)
@@ -0,0 +1,226 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+"""
+Synthetic ledger for benchmarking the Value-added Tax Return.
+
+Rows are written straight to the database with `frappe.db.bulk_insert`, bypassing document
+validation, so a large ledger can be generated quickly. Callers are expected to roll back the
+transaction once done, see `synthetic_ledger`.
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+import frappe
+from frappe.utils import getdate
+
+BENCHMARK_PREFIX = "_BENCH"
+BENCHMARK_TAX_ACCOUNT = f"{BENCHMARK_PREFIX} VAT"
+BENCHMARK_OTHER_ACCOUNTS = [f"{BENCHMARK_PREFIX} Account {i}" for i in range(1, 11)]
+TAX_RATE = 15
+
+
+@contextmanager
+def synthetic_ledger(company, date_from, date_to, **kwargs):
+	"""
+	Generate a synthetic ledger for the company, yield the counts of generated records and roll
+	everything back on exit
+	"""
+	try:
+		set_benchmark_tax_account(company)
+		yield make_synthetic_ledger(company, date_from, date_to, **kwargs)
+	finally:
+		frappe.db.rollback()
+		frappe.clear_document_cache("Value-added Tax Return Settings", company)
+
+
+def set_benchmark_tax_account(company):
+	"""
+	Add BENCHMARK_TAX_ACCOUNT to the Tax Accounts of the company's Value-added Tax Return Settings
+	"""
+	if not frappe.db.exists("Value-added Tax Return Settings", company):
+		frappe.db.bulk_insert(
+			"Value-added Tax Return Settings",
+			["name", "company", "transaction_classification"],
+			[[company, company, "Taxes and Charges Templates"]],
+		)
+
+	frappe.db.bulk_insert(
+		"Value-added Tax Return Settings Account",
+		["name", "parent", "parenttype", "parentfield", "idx", "account"],
+		[
+			[
+				frappe.generate_hash(length=10),
+				company,
+				"Value-added Tax Return Settings",
+				"tax_accounts",
+				999,
+				BENCHMARK_TAX_ACCOUNT,
+			]
+		],
+	)
+	frappe.clear_document_cache("Value-added Tax Return Settings", company)
+
+
+def make_synthetic_ledger(
+	company,
+	date_from,
+	date_to,
+	sales_invoices=1000,
+	purchase_invoices=1000,
+	credit_notes=100,
+	journal_entries=200,
+	legs_per_journal_entry=5,
+	taxes_per_invoice=2,
+	cancelled=50,
+	sales_taxes_and_charges_template=None,
+	purchase_taxes_and_charges_template=None,
+	seed=0,
+):
+	"""
+	Insert Sales Invoices (and credit notes), Purchase Invoices and multi-leg Journal Entries with
+	their GL Entries in BENCHMARK_TAX_ACCOUNT. The first `cancelled` vouchers are marked as cancelled.
+	"""
+	rng = random.Random(seed)
+	date_from, date_to = getdate(date_from), getdate(date_to)
+	days = (date_to - date_from).days
+
+	def random_date():
+		return date_from + timedelta(days=rng.randint(0, days))
+
+	gl_entries = []
+
+	def add_gl_entry(voucher_type, voucher_no, posting_date, debit, credit):
+		gl_entries.append(
+			[
+				f"{BENCHMARK_PREFIX}-GLE-{len(gl_entries) + 1:08d}",
+				company,
+				BENCHMARK_TAX_ACCOUNT,
+				posting_date,
+				voucher_type,
+				voucher_no,
+				debit,
+				credit,
+				debit,
+				credit,
+				1 if len(gl_entries) < cancelled else 0,
+			]
+		)
+
+	for doctype, count, template in (
+		("Sales Invoice", sales_invoices + credit_notes, sales_taxes_and_charges_template),
+		("Purchase Invoice", purchase_invoices, purchase_taxes_and_charges_template),
+	):
+		is_sales = doctype == "Sales Invoice"
+		invoices, taxes = [], []
+		for i in range(count):
+			name = f"{BENCHMARK_PREFIX}-{'SINV' if is_sales else 'PINV'}-{i + 1:08d}"
+			posting_date = random_date()
+			net_total = rng.randint(100, 100000)
+			if is_sales and i >= sales_invoices:
+				net_total *= -1
+
+			invoices.append([name, company, posting_date, template, 1])
+
+			total = net_total
+			for idx in range(1, taxes_per_invoice + 1):
+				tax_amount = net_total * TAX_RATE / 100 if idx == 1 else net_total / 100
+				total += tax_amount
+				taxes.append(
+					[
+						f"{name}-{idx}",
+						name,
+						doctype,
+						"taxes",
+						idx,
+						BENCHMARK_TAX_ACCOUNT if idx == 1 else rng.choice(BENCHMARK_OTHER_ACCOUNTS),
+						tax_amount,
+						total,
+					]
+				)
+
+			vat = abs(net_total * TAX_RATE / 100)
+			if is_sales == (net_total > 0):
+				add_gl_entry(doctype, name, posting_date, 0, vat)
+			else:
+				add_gl_entry(doctype, name, posting_date, vat, 0)
+
+		frappe.db.bulk_insert(
+			doctype, ["name", "company", "posting_date", "taxes_and_charges", "docstatus"], invoices
+		)
+		frappe.db.bulk_insert(
+			"Sales Taxes and Charges" if is_sales else "Purchase Taxes and Charges",
+			["name", "parent", "parenttype", "parentfield", "idx", "account_head", "tax_amount", "total"],
+			taxes,
+		)
+
+	journals, legs = [], []
+	for i in range(journal_entries):
+		name = f"{BENCHMARK_PREFIX}-JV-{i + 1:08d}"
+		posting_date = random_date()
+
+		# One VAT transaction, padded with pairs of legs that cancel each other out
+		excl_tax = rng.randint(100, 100000)
+		tax = excl_tax * TAX_RATE / 100
+		journal_legs = [
+			(rng.choice(BENCHMARK_OTHER_ACCOUNTS), excl_tax, 0),
+			(BENCHMARK_TAX_ACCOUNT, tax, 0),
+			(rng.choice(BENCHMARK_OTHER_ACCOUNTS), 0, excl_tax + tax),
+		]
+		while len(journal_legs) + 2 <= legs_per_journal_entry:
+			amount = rng.randint(1, 100000)
+			journal_legs += [
+				(rng.choice(BENCHMARK_OTHER_ACCOUNTS), amount, 0),
+				(rng.choice(BENCHMARK_OTHER_ACCOUNTS), 0, amount),
+			]
+		rng.shuffle(journal_legs)
+
+		total = sum(debit for account, debit, credit in journal_legs)
+		journals.append([name, company, posting_date, total, total, 1])
+		for idx, (account, debit, credit) in enumerate(journal_legs, start=1):
+			legs.append(
+				[f"{name}-{idx}", name, "Journal Entry", "accounts", idx, account, debit, credit]
+			)
+		add_gl_entry("Journal Entry", name, posting_date, tax, 0)
+
+	frappe.db.bulk_insert(
+		"Journal Entry",
+		["name", "company", "posting_date", "total_debit", "total_credit", "docstatus"],
+		journals,
+	)
+	frappe.db.bulk_insert(
+		"Journal Entry Account",
+		["name", "parent", "parenttype", "parentfield", "idx", "account", "debit", "credit"],
+		legs,
+	)
+	frappe.db.bulk_insert(
+		"GL Entry",
+		[
+			"name",
+			"company",
+			"account",
+			"posting_date",
+			"voucher_type",
+			"voucher_no",
+			"debit",
+			"credit",
+			"debit_in_account_currency",
+			"credit_in_account_currency",
+			"is_cancelled",
+		],
+		gl_entries,
+	)
+
+	return frappe._dict(
+		{
+			"gl_entries": len(gl_entries),
+			"sales_invoices": sales_invoices,
+			"credit_notes": credit_notes,
+			"purchase_invoices": purchase_invoices,
+			"journal_entries": journal_entries,
+			"journal_entry_legs": len(legs),
+			"cancelled": min(cancelled, len(gl_entries)),
+		}
+	)
@@ -0,0 +1,182 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+"""
+Time each stage of the Value-added Tax Return pipeline on synthetic ledgers of increasing size,
+and emit the results as JSON so they can be compared between releases.
+
+	bench --site <site> execute csf_za.tax_compliance.benchmarks.vat_return_pipeline.execute \\
+		--kwargs "{'company': 'Sun Power Pty Ltd', 'output': '/tmp/vat_return_pipeline.json'}"
+
+Stages, each timed on its own:
+
+	get_gl_entries: the whitelisted `ValueaddedTaxReturn.get_gl_entries`, end to end
+	fetch_gl_entries: `ValueaddedTaxReturn.fetch_gl_entries`
+	transform_gl_entries: `transform_gl_entries` of the fetched GL Entries
+	process_gl_entries: `ValueaddedTaxReturn.process_gl_entries` of the fetched GL Entries
+	validate: `ValueaddedTaxReturn.validate` with the classified Transactions stored
+	linked_transactions_report: the first page of the Value-added Tax Return Linked Transactions
+		report, not cached
+	linked_transactions_report_grouped: the same, with 'Show all classifications'
+	linked_transactions_report_cached: the first page of the report, served from the cache
+
+The mix of vouchers is given as the share of the GL Entries of each voucher type, see LEDGER_MIX,
+or as counts with the `make_synthetic_ledger` arguments, which then have to add up to the GL rows.
+The ledger is generated with a fixed seed, so runs with the same arguments are comparable.
+"""
+
+import json
+import platform
+import time
+
+import frappe
+from frappe.utils import now_datetime
+
+import csf_za
+from csf_za.tax_compliance.benchmarks.synthetic_ledger import BENCHMARK_PREFIX, synthetic_ledger
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	clear_linked_transactions_cache,
+	transform_gl_entries,
+)
+from csf_za.tax_compliance.report.value_added_tax_return_linked_transactions.value_added_tax_return_linked_transactions import (
+	execute as linked_transactions_report,
+)
+
+GL_ROWS = (1000, 10000, 100000, 1000000)
+
+# Share of the GL Entries per voucher type, each voucher posts one GL Entry in the tax account
+LEDGER_MIX = {
+	"sales_invoices": 0.4,
+	"credit_notes": 0.05,
+	"purchase_invoices": 0.3,
+	"journal_entries": 0.25,
+}
+
+
+def execute(
+	company,
+	gl_rows=GL_ROWS,
+	date_from="2024-03-01",
+	date_to="2024-04-30",
+	repeat=3,
+	mix=None,
+	cancelled_share=0.02,
+	legs_per_journal_entry=5,
+	output=None,
+	**ledger_kwargs,
+):
+	results = {
+		"benchmark": "vat_return_pipeline",
+		"csf_za": csf_za.__version__,
+		"frappe": frappe.__version__,
+		"python": platform.python_version(),
+		"database": frappe.db.db_type,
+		"timestamp": now_datetime().isoformat(),
+		"repeat": repeat,
+		"runs": [],
+	}
+	for rows in gl_rows:
+		# Voucher counts given explicitly take precedence over the mix
+		counts = {
+			**get_ledger_counts(rows, mix or LEDGER_MIX, cancelled_share),
+			"legs_per_journal_entry": legs_per_journal_entry,
+			**ledger_kwargs,
+		}
+		with synthetic_ledger(company, date_from, date_to, **counts) as ledger:
+			assert (
+				ledger.gl_entries == rows
+			), f"The ledger for {rows:,} GL rows has {ledger.gl_entries:,} GL Entries"
+			timings = measure(company, date_from, date_to, rows, repeat)
+
+		results["runs"].append({"gl_rows": rows, "ledger": dict(ledger), "timings": timings})
+		print(
+			f"{rows:>9,} GL rows: "
+			+ ", ".join(f"{stage} {timing['best']:.3f}s" for stage, timing in timings.items())
+		)
+
+	if output:
+		with open(output, "w") as f:
+			json.dump(results, f, indent=1)
+
+	print(json.dumps(results, indent=1))
+	return results
+
+
+def get_ledger_counts(gl_rows, mix, cancelled_share):
+	"""
+	The `make_synthetic_ledger` voucher counts for a ledger of `gl_rows` GL Entries
+	"""
+	counts = {voucher_type: int(gl_rows * share) for voucher_type, share in mix.items()}
+	# Rounding leftovers go to the Sales Invoices
+	counts["sales_invoices"] += gl_rows - sum(counts.values())
+	counts["cancelled"] = int(gl_rows * cancelled_share)
+	return counts
+
+
+def measure(company, date_from, date_to, gl_rows, repeat):
+	vat_return = frappe.get_doc(
+		{
+			"doctype": "Value-added Tax Return",
+			"company": company,
+			"date_from": date_from,
+			"date_to": date_to,
+		}
+	)
+	# Stored without validation, to time validate on its own with the Transactions in place
+	vat_return.name = f"{BENCHMARK_PREFIX}-VAT-RETURN-{gl_rows}"
+	vat_return.db_insert()
+
+	gl_entries = vat_return.fetch_gl_entries()
+	vat_return.set_gl_entries(vat_return.process_gl_entries(copy_gl_entries(gl_entries)))
+
+	# As loaded for a save, so validate keeps the stored Transactions
+	vat_return = frappe.get_doc("Value-added Tax Return", vat_return.name)
+	vat_return.load_doc_before_save()
+
+	report_filters = frappe._dict({"vat_return": vat_return.name, "include_cancelled": 1})
+
+	def clear_report_cache():
+		clear_linked_transactions_cache(vat_return.name)
+		return []
+
+	return {
+		"get_gl_entries": time_stage(vat_return.get_gl_entries, repeat),
+		"fetch_gl_entries": time_stage(vat_return.fetch_gl_entries, repeat),
+		"transform_gl_entries": time_stage(lambda: transform_gl_entries(gl_entries), repeat),
+		"process_gl_entries": time_stage(
+			vat_return.process_gl_entries, repeat, setup=lambda: [copy_gl_entries(gl_entries)]
+		),
+		"validate": time_stage(vat_return.validate, repeat),
+		"linked_transactions_report": time_stage(
+			lambda: linked_transactions_report(report_filters), repeat, setup=clear_report_cache
+		),
+		"linked_transactions_report_grouped": time_stage(
+			lambda: linked_transactions_report(
+				frappe._dict(report_filters, show_all_classifications=1)
+			),
+			repeat,
+			setup=clear_report_cache,
+		),
+		"linked_transactions_report_cached": time_stage(
+			lambda: linked_transactions_report(report_filters), repeat
+		),
+	}
+
+
+def time_stage(stage, repeat, setup=None):
+	"""
+	Run the stage `repeat` times, with the arguments returned by `setup` which is not timed
+	"""
+	timings = []
+	for _ in range(repeat):
+		args = setup() if setup else []
+		start = time.perf_counter()
+		stage(*args)
+		timings.append(time.perf_counter() - start)
+
+	return {"best": min(timings), "mean": sum(timings) / len(timings), "runs": timings}
+
+
+def copy_gl_entries(gl_entries):
+	# process_gl_entries classifies the entries in place, every run starts from a fresh copy
+	return [frappe._dict(entry) for entry in gl_entries]
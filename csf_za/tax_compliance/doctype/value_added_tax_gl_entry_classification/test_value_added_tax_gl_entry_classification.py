@@ -0,0 +1,80 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification import (
+	classify_voucher_gl_entries,
+)
+
+MODULE = "csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification"
+VAT_RETURN_MODULE = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return"
+
+
+class TestValueaddedTaxGLEntryClassification(FrappeTestCase):
+	def test_classify_voucher_gl_entries(self):
+		voucher = frappe._dict(
+			doctype="Sales Invoice", name="SINV-1", company="Company 1", posting_date="2024-03-01"
+		)
+		classified_entries = [
+			frappe._dict(
+				name="GLE-1",
+				posting_date="2024-03-01",
+				voucher_type="Sales Invoice",
+				voucher_no="SINV-1",
+				general_ledger_credit=15,
+				classification="Output - E Exempt",
+				classification_debugging="🚀",
+				tax_amount=15,
+				incl_tax_amount=115,
+				is_cancelled=0,
+			)
+		]
+		vat_return = MagicMock()
+		vat_return.process_gl_entries.return_value = classified_entries
+
+		with patch(f"{MODULE}.classifies_gl_entries_at_posting", return_value=False), patch(
+			f"{MODULE}.get_vat_return"
+		) as mock_get_vat_return:
+			classify_voucher_gl_entries(voucher)
+		mock_get_vat_return.assert_not_called()
+
+		with patch(f"{MODULE}.classifies_gl_entries_at_posting", return_value=True), patch(
+			f"{MODULE}.get_vat_return", return_value=vat_return
+		), patch(f"{MODULE}.frappe.db") as mock_db:
+			classify_voucher_gl_entries(voucher)
+
+		vat_return.fetch_gl_entries.assert_called_once_with(voucher=("Sales Invoice", "SINV-1"))
+		mock_db.delete.assert_called_once_with(
+			"Value-added Tax GL Entry Classification",
+			{"voucher_type": "Sales Invoice", "voucher_no": "SINV-1"},
+		)
+		fields, values = mock_db.bulk_insert.call_args.args[1:3]
+		row = dict(zip(fields, values[0]))
+		self.assertEqual(row["name"], "GLE-1")
+		self.assertEqual(row["gl_entry"], "GLE-1")
+		self.assertEqual(row["company"], "Company 1")
+		self.assertEqual(row["classification"], "Output - E Exempt")
+		self.assertEqual(row["tax_account_credit"], 15)
+
+	def test_get_classified_gl_entries(self):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.company = "Company 1"
+		vat_return.date_from = "2024-03-01"
+		vat_return.date_to = "2024-04-30"
+
+		with patch(
+			f"{VAT_RETURN_MODULE}.classifies_gl_entries_at_posting", return_value=True
+		), patch(f"{VAT_RETURN_MODULE}.get_posted_gl_entries") as mock_posted, patch.object(
+			vat_return, "fetch_gl_entries"
+		) as mock_fetch:
+			gl_entries = vat_return.get_classified_gl_entries(modified_since="2024-04-01 00:00:00")
+
+		mock_fetch.assert_not_called()
+		mock_posted.assert_called_once_with(
+			"Company 1", "2024-03-01", "2024-04-30", modified_since="2024-04-01 00:00:00"
+		)
+		self.assertEqual(gl_entries, mock_posted.return_value)
@@ -0,0 +1,171 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+from datetime import date
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Max, Min
+from frappe.utils import create_batch, getdate, now_datetime
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	GL_ENTRIES_BATCH_SIZE,
+	GL_ENTRY_ROW_FIELDS,
+	get_gl_entry_row,
+)
+from csf_za.tax_compliance.doctype.value_added_tax_return_settings.value_added_tax_return_settings import (
+	classifies_gl_entries_at_posting,
+	enqueue_rebuild_gl_entry_classifications,
+)
+
+# Fields of Account the classification of Journal Entries depends on
+ACCOUNT_CLASSIFICATION_FIELDS = (
+	"custom_vat_return_debit_classification",
+	"custom_vat_return_credit_classification",
+)
+
+
+class ValueaddedTaxGLEntryClassification(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index(
+		"Value-added Tax GL Entry Classification", ["company", "posting_date", "classification"]
+	)
+
+
+def classify_voucher_gl_entries(doc, method=None):
+	"""
+	`doc_events` handler for vouchers of every doctype when they are submitted or cancelled.
+
+	If the company classifies at posting, the GL Entries of the voucher in the Tax Accounts are
+	classified with `ValueaddedTaxReturn.process_gl_entries` and stored, replacing those stored
+	when the voucher was submitted. A cancelled voucher stores its GL Entries as cancelled.
+
+	Ledger reposts (Repost Accounting Ledger, Repost Item Valuation) replace the GL Entries of
+	vouchers without submitting or cancelling them, so their classifications go stale until they
+	are rebuilt with `ValueaddedTaxReturnSettings.enqueue_rebuild_gl_entry_classifications`.
+	"""
+	company = doc.get("company")
+	if not doc.get("posting_date") or not classifies_gl_entries_at_posting(company):
+		return
+
+	vat_return = get_vat_return(company, doc.posting_date, doc.posting_date)
+	gl_entries = vat_return.fetch_gl_entries(voucher=(doc.doctype, doc.name))
+
+	frappe.db.delete(
+		"Value-added Tax GL Entry Classification",
+		{"voucher_type": doc.doctype, "voucher_no": doc.name},
+	)
+	insert_gl_entry_classifications(company, vat_return.process_gl_entries(gl_entries))
+
+
+def rebuild_account_gl_entry_classifications(doc, method=None):
+	"""
+	`doc_events` handler for Account: Journal Entries are classified with the classifications of
+	their Accounts, so the GL Entries of the company are classified again when these change
+	"""
+	if any(doc.has_value_changed(fieldname) for fieldname in ACCOUNT_CLASSIFICATION_FIELDS):
+		if classifies_gl_entries_at_posting(doc.company):
+			enqueue_rebuild_gl_entry_classifications(doc.company)
+
+
+def rebuild_gl_entry_classifications(company):
+	"""
+	Background job for `enqueue_rebuild_gl_entry_classifications`: replace the stored
+	classifications of the company, classifying the GL Entries in its Tax Accounts a year at a time.
+
+	The classifications of a year are deleted and inserted again in the same transaction, so the
+	stored classifications read by VAT returns are complete for every year during the rebuild.
+	"""
+	vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", company)
+	tax_accounts = [row.account for row in vat_return_settings.tax_accounts]
+
+	first_posting_date = last_posting_date = None
+	if tax_accounts:
+		gle = frappe.qb.DocType("GL Entry")
+		first_posting_date, last_posting_date = (
+			frappe.qb.from_(gle)
+			.select(Min(gle.posting_date), Max(gle.posting_date))
+			.where(gle.account.isin(tax_accounts))
+		).run()[0]
+
+	if not first_posting_date:
+		frappe.db.delete("Value-added Tax GL Entry Classification", {"company": company})
+		return
+
+	classification = frappe.qb.DocType("Value-added Tax GL Entry Classification")
+	first_year, last_year = getdate(first_posting_date).year, getdate(last_posting_date).year
+	for year in range(first_year, last_year + 1):
+		date_from, date_to = date(year, 1, 1), date(year, 12, 31)
+		vat_return = get_vat_return(company, date_from, date_to)
+		gl_entries = vat_return.process_gl_entries(vat_return.fetch_gl_entries())
+
+		(
+			frappe.qb.from_(classification)
+			.delete()
+			.where(
+				(classification.company == company)
+				& (classification.posting_date.between(date_from, date_to))
+			)
+		).run()
+		insert_gl_entry_classifications(company, gl_entries)
+		frappe.db.commit()
+
+	# Years without GL Entries in the Tax Accounts any more
+	(
+		frappe.qb.from_(classification)
+		.delete()
+		.where(
+			(classification.company == company)
+			& (
+				(classification.posting_date < date(first_year, 1, 1))
+				| (classification.posting_date > date(last_year, 12, 31))
+			)
+		)
+	).run()
+
+
+def get_vat_return(company, date_from, date_to):
+	"""
+	A Value-added Tax Return that is not saved, to fetch and classify GL Entries with
+	"""
+	return frappe.get_doc(
+		{
+			"doctype": "Value-added Tax Return",
+			"company": company,
+			"date_from": date_from,
+			"date_to": date_to,
+		}
+	)
+
+
+def insert_gl_entry_classifications(company, gl_entries):
+	"""
+	Store classified GL Entries, named after the GL Entry, with multi-row inserts of
+	GL_ENTRIES_BATCH_SIZE rows. GL Entries already stored, by a voucher posted while the
+	classifications are rebuilt, are left as they are.
+	"""
+	now = now_datetime()
+	user = frappe.session.user
+	fields = ["name", "company", "owner", "modified_by", "creation", "modified", *GL_ENTRY_ROW_FIELDS]
+	for batch in create_batch(gl_entries, GL_ENTRIES_BATCH_SIZE):
+		values = []
+		for entry in batch:
+			row = get_gl_entry_row(entry)
+			values.append(
+				[
+					entry.name,
+					company,
+					user,
+					user,
+					now,
+					now,
+					*(row[fieldname] for fieldname in GL_ENTRY_ROW_FIELDS),
+				]
+			)
+
+		frappe.db.bulk_insert(
+			"Value-added Tax GL Entry Classification", fields, values, ignore_duplicates=True
+		)
@@ -0,0 +1,116 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+TRACE_OFF = "Off"
+TRACE_SUMMARY = "Summary"
+TRACE_FULL = "Full"
+
+
+class ClassificationTrace:
+	"""
+	Structured record of how `ValueaddedTaxReturn.process_gl_entries` classified one voucher.
+
+	Events only keep references to the values involved, the `classification_debugging` text is
+	rendered from them when the transaction is stored. In 'Full' mode every step is kept. In
+	'Summary' mode only the rule that decided the classification is kept, and the steps are kept
+	for vouchers that end up unclassified, as those are the ones that need looking into.
+	"""
+
+	__slots__ = ("full", "events")
+
+	def __init__(self, mode=TRACE_FULL):
+		self.full = mode == TRACE_FULL
+		self.events = []
+
+	def step(self, event, **details):
+		"""
+		Record an intermediate step, dropped in 'Summary' mode once a rule classifies the voucher
+		"""
+		self.events.append((event, details))
+
+	def rule(self, event, **details):
+		"""
+		Record the rule that decided the classification. A rule that found no classification, e.g.
+		an Account without one, leaves the voucher unclassified.
+		"""
+		if not self.full and details.get("classification", True):
+			self.events.clear()
+		self.events.append((event, details))
+
+	def render(self):
+		return "\n".join(["🚀", *(EVENT_RENDERERS[event](**details) for event, details in self.events)])
+
+
+class NoClassificationTrace:
+	"""
+	Stand-in for `ClassificationTrace` in 'Off' mode, records nothing
+	"""
+
+	__slots__ = ()
+	full = False
+
+	def step(self, event, **details):
+		pass
+
+	def rule(self, event, **details):
+		pass
+
+	def render(self):
+		return None
+
+
+NO_TRACE = NoClassificationTrace()
+
+
+def get_classification_trace(mode):
+	"""
+	Return a new trace for one voucher for the given 'Classification Details' setting
+	"""
+	if mode == TRACE_OFF:
+		return NO_TRACE
+
+	return ClassificationTrace(mode or TRACE_SUMMARY)
+
+
+def get_leg_amount(leg):
+	return leg.journal_entry_account_credit or leg.journal_entry_account_debit
+
+
+def get_leg_rows(legs):
+	return [leg.journal_entry_account_idx for leg in legs]
+
+
+EVENT_RENDERERS = {
+	"invoice": lambda taxes_and_charges_template: (
+		"🚀 voucher_type is a 'Sales Invoice' or 'Purchase Invoice')"
+		f"\n🚀 taxes_and_charges_template = '{taxes_and_charges_template}'"
+	),
+	"template_classification": lambda classification: f"🚀 classification = {classification}",
+	"no_template": lambda: (
+		"🚀 No Taxes and Charges template on Invoice, or Taxes and Charges template is not set in"
+		" 'Value-added Return Settings'"
+	),
+	"journal_entry": lambda: "🚀 voucher_type is 'Journal Entry'",
+	"sars_payment": lambda filtered_out: (
+		f"🚀 all rows {get_leg_rows(filtered_out)} are contra entries, classified as 'SARS Payment/Receipt'"
+	),
+	"legs_filtered": lambda filtered_out, filtered_journal_entries: (
+		f"🚀 filtered_out = rows {get_leg_rows(filtered_out)}"
+		f"\n🚀 filtered_journal_entries = rows {get_leg_rows(filtered_journal_entries)}"
+	),
+	"legs_error": lambda error: f"🚀 {error}]'",
+	"legs_chosen": lambda tax_leg, incl_tax_leg, excl_tax_leg: "\n".join(
+		f"🚀 {name} = '{leg.journal_entry_account}': '{get_leg_amount(leg)}'"
+		for name, leg in (
+			("tax_leg", tax_leg),
+			("incl_tax_leg", incl_tax_leg),
+			("excl_tax_leg", excl_tax_leg),
+		)
+	),
+	"account_debit_classification": lambda account, classification: (
+		f"🚀 'Classify Debit entries...' setting for Account '{account}' = '{classification}'"
+	),
+	"account_credit_classification": lambda account, classification: (
+		f"🚀 'Classify Credit entries..' for Account '{account}' = '{classification}'"
+	),
+}
@@ -1,10 +1,25 @@
 # Copyright (c) 2024, Dirk van der Laarse and Contributors
 # See license.txt
 
+import random
 from unittest.mock import MagicMock, patch
 
 import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now_datetime
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.classification_trace import (
+	get_classification_trace,
+)
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	GL_ENTRY_ROW_FIELDS,
+	delete_missing_gl_entry_rows,
+	get_classification_totals,
+	insert_gl_entry_rows,
+	merge_gl_entries,
+	split_contra_legs,
+	transform_gl_entries,
+)
 
 
 class TestValueaddedTaxReturn(FrappeTestCase):
@@ -40,14 +55,13 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 
 		# Setup the object under test
 		vat_return = frappe.new_doc("Value-added Tax Return")
-		vat_return.gl_entries = mock_gl_entries
 		vat_return.acc_exceed_28_days = 50
 		vat_return.acc_exceed_28_days_percent = 10
 		vat_return.acc_not_exceed_28_days = 60
 		vat_return.TAX_RATE = 5
 
 		# Call the function under test
-		vat_return.refresh_output_tax_fields()
+		vat_return.refresh_output_tax_fields(get_classification_totals(mock_gl_entries))
 
 		# Verify calculations for each field
 		self.assertEqual(vat_return.standard_rate_main_excl, 100)
@@ -77,14 +91,13 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 
 		# Setup the object under test
 		vat_return = frappe.new_doc("Value-added Tax Return")
-		vat_return.gl_entries = mock_gl_entries
 		vat_return.total_output_tax = 2000
 		vat_return.change_in_use = 50
 		vat_return.bad_debts = 20
 		vat_return.other = 30
 
 		# Call the function under test
-		vat_return.refresh_input_tax_fields()
+		vat_return.refresh_input_tax_fields(get_classification_totals(mock_gl_entries))
 
 		# Verify calculations for each field
 		self.assertEqual(vat_return.capital_goods_supplied, 100)
@@ -94,6 +107,181 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 		self.assertEqual(vat_return.total_input_tax, 1100)  # 100+200+300+400+50+20+30
 		self.assertEqual(vat_return.total_vat_payable_refundable, 900)  # 2000 - 1100
 
+	def test_get_classification_totals(self):
+		gl_entries = [
+			frappe._dict(
+				classification="Output - A Standard rate (excl capital goods)",
+				tax_amount=15,
+				incl_tax_amount=115,
+				tax_account_debit=0,
+				tax_account_credit=15,
+			),
+			frappe._dict(
+				classification="Output - A Standard rate (excl capital goods)",
+				tax_amount=-15,
+				incl_tax_amount=-115,
+				tax_account_debit=15,
+				tax_account_credit=0,
+			),
+			frappe._dict(
+				classification="Input - B Capital goods imported",
+				tax_amount=30,
+				incl_tax_amount=230,
+				tax_account_debit=30,
+				tax_account_credit=0,
+			),
+			frappe._dict(classification=None, tax_amount=None, incl_tax_amount=None, is_cancelled=1),
+		]
+
+		totals = get_classification_totals(gl_entries)
+
+		standard_rate = totals["Output - A Standard rate (excl capital goods)"]
+		self.assertEqual(standard_rate.count, 2)
+		self.assertEqual(standard_rate.tax_amount, 0)
+		self.assertEqual(standard_rate.incl_tax_amount, 0)
+		self.assertEqual(standard_rate.tax_account_debit, 15)
+		self.assertEqual(standard_rate.tax_account_credit, 15)
+
+		capital_goods = totals["Input - B Capital goods imported"]
+		self.assertEqual(capital_goods.count, 1)
+		self.assertEqual(capital_goods.tax_amount, 30)
+		self.assertEqual(capital_goods.incl_tax_amount, 230)
+
+		self.assertEqual(totals[None].count, 1)
+		self.assertEqual(totals[None].tax_amount, 0)
+
+		# Classifications without rows read as zero
+		self.assertEqual(totals["Output - E Exempt"].count, 0)
+		self.assertEqual(totals["Output - E Exempt"].incl_tax_amount, 0)
+
+	def test_refresh_transaction_counts(self):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-1"
+
+		vat_return.refresh_transaction_counts(get_classification_totals([]))
+		self.assertEqual(vat_return.transactions_count, 0)
+
+		vat_return.refresh_transaction_counts(
+			get_classification_totals(
+				[
+					frappe._dict(classification="Output - E Exempt", tax_amount=15),
+					frappe._dict(classification=None, tax_amount=30),
+					frappe._dict(classification=None, tax_amount=30, is_cancelled=1),
+				]
+			)
+		)
+		self.assertEqual(vat_return.transactions_count, 3)
+
+	def test_refresh_classification_summary(self):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		classification_totals = get_classification_totals(
+			[
+				frappe._dict(classification="Output - E Exempt", tax_amount=15),
+				frappe._dict(classification=None, tax_amount=30),
+				frappe._dict(
+					classification="Output - A Standard rate (excl capital goods)",
+					tax_amount=-15,
+					tax_account_debit=15,
+					is_cancelled=1,
+				),
+			]
+		)
+		# Looked up without rows, read as zero
+		classification_totals["Input - B Capital goods imported"]
+
+		with patch(
+			"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.get_classification_options",
+			return_value=[
+				"",
+				"Output - A Standard rate (excl capital goods)",
+				"Output - E Exempt",
+				"Input - B Capital goods imported",
+			],
+		):
+			vat_return.refresh_classification_summary(classification_totals)
+
+		summary = vat_return.classification_summary
+		self.assertEqual(
+			[row.classification for row in summary],
+			[None, "Output - A Standard rate (excl capital goods)", "Output - E Exempt"],
+		)
+		self.assertEqual([row.transactions_count for row in summary], [1, 1, 1])
+		self.assertEqual([row.unclassified_count for row in summary], [1, 0, 0])
+		self.assertEqual([row.cancelled_count for row in summary], [0, 1, 0])
+		self.assertEqual([row.tax_amount for row in summary], [30, -15, 15])
+		self.assertEqual(summary[1].tax_account_debit, 15)
+
+	def test_on_submit(self):
+		module = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return"
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-1"
+		vat_return.append("classification_summary", {"classification": "Output - E Exempt"})
+
+		with patch(f"{module}.get_unclassified_vouchers") as mock_get_unclassified_vouchers, patch(
+			f"{module}.set_gl_entry_rows_docstatus"
+		) as mock_set_docstatus:
+			vat_return.on_submit()
+		mock_get_unclassified_vouchers.assert_not_called()
+		mock_set_docstatus.assert_called_once_with("VAT-RETURN-1", 1)
+
+		vat_return.append("classification_summary", {"classification": "", "unclassified_count": 3})
+		vouchers = [
+			frappe._dict(voucher_type="Sales Invoice", voucher_no="SINV-1"),
+			frappe._dict(voucher_type="Journal Entry", voucher_no="JV-1"),
+		]
+		with patch(
+			f"{module}.get_unclassified_vouchers", return_value=vouchers
+		) as mock_get_unclassified_vouchers, patch(
+			f"{module}.set_gl_entry_rows_docstatus"
+		) as mock_set_docstatus, self.assertRaises(
+			frappe.ValidationError
+		) as error:
+			vat_return.on_submit()
+
+		mock_get_unclassified_vouchers.assert_called_once_with("VAT-RETURN-1", limit=11)
+		mock_set_docstatus.assert_not_called()
+		message = str(error.exception)
+		self.assertIn("3", message)
+		self.assertIn("SINV-1", message)
+		self.assertIn("JV-1", message)
+		self.assertNotIn("...", message)
+
+	def test_after_insert(self):
+		module = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return"
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-1-1"
+		vat_return.amended_from = "VAT-RETURN-1"
+		vat_return.company = "Sun Power Pty Ltd"
+		vat_return.date_from = "2024-03-01"
+		vat_return.date_to = "2024-04-30"
+		vat_return.last_synced_on = "2024-05-01 00:00:00"
+		amended = frappe._dict(
+			company="Sun Power Pty Ltd", date_from="2024-03-01", date_to="2024-04-30"
+		)
+
+		with patch(f"{module}.frappe.db.get_value", return_value=amended), patch(
+			f"{module}.copy_gl_entry_rows"
+		) as mock_copy_rows, patch(f"{module}.get_classification_totals_from_db"), patch.object(
+			vat_return, "update_tax_fields"
+		) as mock_update_tax_fields:
+			vat_return.after_insert()
+
+		mock_copy_rows.assert_called_once_with("VAT-RETURN-1", vat_return)
+		mock_update_tax_fields.assert_called_once()
+		self.assertEqual(vat_return.last_synced_on, "2024-05-01 00:00:00")
+
+		# An amendment for another period starts without Transactions
+		amended.date_to = "2024-03-31"
+		with patch(f"{module}.frappe.db.get_value", return_value=amended), patch(
+			f"{module}.copy_gl_entry_rows"
+		) as mock_copy_rows, patch(f"{module}.get_classification_totals_from_db"), patch.object(
+			vat_return, "update_tax_fields"
+		):
+			vat_return.after_insert()
+
+		mock_copy_rows.assert_not_called()
+		self.assertIsNone(vat_return.last_synced_on)
+
 	@patch(
 		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.frappe.get_cached_doc"
 	)
@@ -101,19 +289,15 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.transform_gl_entries"
 	)
 	@patch(
-		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.frappe.get_cached_value"
+		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.get_account_classifications"
 	)
 	@patch(
-		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.VAT_RETURN_SETTING_FIELD_MAP",
-		[
-			{
-				"field_name": "vat_field",
-				"classification": "Standard VAT",
-				"reference_doctype": "Sales Invoice",
-			}
-		],
+		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.get_template_classifications",
+		lambda company: {("Sales Invoice", "VAT Template"): "Standard VAT"},
 	)
-	def test_process_gl_entries(self, mock_cached_value, mock_transform, mock_get_cached_doc):
+	def test_process_gl_entries(
+		self, mock_account_classifications, mock_transform, mock_get_cached_doc
+	):
 		"""
 		Test process_gl_entries function with:
 		        - SI-001: Sales Invoice
@@ -125,7 +309,7 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 		        - JE-003: Cancelled Journal Entry
 		"""
 		mock_settings = frappe._dict(
-			{"tax_accounts": [frappe._dict({"account": "VAT Account"})], "vat_field": "VAT Template"}
+			{"tax_accounts": [frappe._dict({"account": "VAT Account"})]}
 		)
 		mock_vouchers = frappe._dict(
 			{
@@ -267,7 +451,15 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 
 		mock_get_cached_doc.return_value = mock_settings
 		mock_transform.return_value = mock_vouchers
-		mock_cached_value.side_effect = lambda doctype, docname, fieldname: "Classified"
+		mock_account_classifications.side_effect = lambda accounts: {
+			account: frappe._dict(
+				{
+					"custom_vat_return_debit_classification": "Classified",
+					"custom_vat_return_credit_classification": "Classified",
+				}
+			)
+			for account in accounts
+		}
 
 		vat_return = frappe.new_doc("Value-added Tax Return")
 		results = vat_return.process_gl_entries([])  # input for your GL entries
@@ -311,3 +503,417 @@ class TestValueaddedTaxReturn(FrappeTestCase):
 		self.assertIsNone(results[6].classification)
 		self.assertIsNone(results[6].tax_amount)
 		self.assertIsNone(results[6].incl_tax_amount)
+
+		# Account classifications are fetched once, for the accounts of all Journal Entry legs
+		mock_account_classifications.assert_called_once_with(
+			accounts={"VAT Account", "Other Account", "Bank Account"}
+		)
+
+	@patch("csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.frappe.enqueue")
+	@patch(
+		"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.is_job_enqueued"
+	)
+	def test_enqueue_get_gl_entries(self, mock_is_job_enqueued, mock_enqueue):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-TEST"
+
+		# A job is started when none is running for this return
+		mock_is_job_enqueued.return_value = False
+		vat_return.enqueue_get_gl_entries()
+		mock_enqueue.assert_called_once()
+		self.assertEqual(
+			mock_enqueue.call_args.kwargs["job_id"], "vat_return_get_gl_entries::VAT-RETURN-TEST"
+		)
+		self.assertEqual(mock_enqueue.call_args.kwargs["vat_return"], "VAT-RETURN-TEST")
+
+		# A second job for the same return is refused
+		mock_enqueue.reset_mock()
+		mock_is_job_enqueued.return_value = True
+		self.assertRaises(frappe.ValidationError, vat_return.enqueue_get_gl_entries)
+		mock_enqueue.assert_not_called()
+
+	def test_merge_gl_entries(self):
+		gl_entries = [
+			frappe._dict(name="GLE-1", voucher_type="Sales Invoice", voucher_no="SI-001"),
+			frappe._dict(name="GLE-2", voucher_type="Purchase Invoice", voucher_no="PI-001"),
+			frappe._dict(name="GLE-3", voucher_type="Journal Entry", voucher_no="JE-001"),
+			frappe._dict(name="GLE-4", voucher_type="Payment Entry", voucher_no="PE-001"),
+		]
+		journal_entry_legs = {
+			"JE-001": [
+				frappe._dict(journal_entry_account="VAT Account", journal_entry_account_idx=1),
+				frappe._dict(journal_entry_account="Bank Account", journal_entry_account_idx=2),
+			]
+		}
+		invoice_taxes = {
+			"Sales Invoice": {
+				"SI-001": frappe._dict(
+					taxes_and_charges_template="VAT Template",
+					sales_invoice_taxes_tax_amount=15,
+					sales_invoice_taxes_total=115,
+				)
+			},
+			"Purchase Invoice": {},
+		}
+
+		merged_entries = merge_gl_entries(gl_entries, journal_entry_legs, invoice_taxes)
+		self.assertEqual(len(merged_entries), 5)
+
+		# One row per invoice GL Entry, with the invoice taxes
+		self.assertEqual(merged_entries[0].taxes_and_charges_template, "VAT Template")
+		self.assertEqual(merged_entries[0].sales_invoice_taxes_total, 115)
+		self.assertIsNone(merged_entries[1].taxes_and_charges_template)
+
+		# One row per Journal Entry leg
+		self.assertEqual(
+			[entry.journal_entry_account for entry in merged_entries[2:4]], ["VAT Account", "Bank Account"]
+		)
+		self.assertEqual({entry.name for entry in merged_entries[2:4]}, {"GLE-3"})
+
+		vouchers = transform_gl_entries(merged_entries)
+		self.assertEqual(list(vouchers), ["GLE-1", "GLE-2", "GLE-3", "GLE-4"])
+		self.assertEqual(len(vouchers["GLE-3"].linked_journal_entries), 2)
+
+	def test_split_contra_legs(self):
+		legs = [
+			frappe._dict(
+				journal_entry_account_idx=1,
+				journal_entry_account_debit=1000,
+				journal_entry_account_credit=0,
+			),
+			frappe._dict(
+				journal_entry_account_idx=2,
+				journal_entry_account_debit=0,
+				journal_entry_account_credit=1000,
+			),
+			frappe._dict(
+				journal_entry_account_idx=3,
+				journal_entry_account_debit=100,
+				journal_entry_account_credit=0,
+			),
+			frappe._dict(
+				journal_entry_account_idx=4,
+				journal_entry_account_debit=15,
+				journal_entry_account_credit=0,
+			),
+			frappe._dict(
+				journal_entry_account_idx=5,
+				journal_entry_account_debit=0,
+				journal_entry_account_credit=115,
+			),
+		]
+
+		filtered_out, remaining = split_contra_legs(legs)
+
+		self.assertEqual([leg.journal_entry_account_idx for leg in filtered_out], [2, 1])
+		self.assertEqual([leg.journal_entry_account_idx for leg in remaining], [3, 4, 5])
+
+	def test_split_contra_legs_matches_pairwise_scan(self):
+		"""
+		Compare split_contra_legs with the pairwise scan it replaced, on randomized journals
+		"""
+		rng = random.Random(20240601)
+		amounts = [0, 15, 100, 115, 1000, -15, -115]
+
+		for _ in range(2000):
+			legs = []
+			for idx in range(1, rng.randint(1, 12) + 1):
+				if rng.random() < 0.5:
+					debit, credit = rng.choice(amounts), 0
+				else:
+					debit, credit = 0, rng.choice(amounts)
+				legs.append(
+					frappe._dict(
+						journal_entry_account=f"Account {rng.randint(1, 4)}",
+						journal_entry_account_idx=idx,
+						journal_entry_account_debit=debit,
+						journal_entry_account_credit=credit,
+					)
+				)
+
+			expected_filtered_out, expected_remaining = pairwise_split_contra_legs(legs)
+			filtered_out, remaining = split_contra_legs(legs)
+
+			self.assertEqual(
+				[leg.journal_entry_account_idx for leg in filtered_out],
+				[leg.journal_entry_account_idx for leg in expected_filtered_out],
+				legs,
+			)
+			self.assertEqual(
+				[leg.journal_entry_account_idx for leg in remaining],
+				[leg.journal_entry_account_idx for leg in expected_remaining],
+				legs,
+			)
+
+	def test_classification_trace(self):
+		legs = [
+			frappe._dict(journal_entry_account_idx=1),
+			frappe._dict(journal_entry_account_idx=2),
+		]
+
+		def classify(trace):
+			trace.step("journal_entry")
+			trace.step("legs_filtered", filtered_out=legs, filtered_journal_entries=[])
+			trace.rule("sars_payment", filtered_out=legs)
+			return trace.render()
+
+		self.assertIsNone(classify(get_classification_trace("Off")))
+
+		summary = classify(get_classification_trace("Summary"))
+		self.assertEqual(summary.count("\n"), 1)
+		self.assertIn("'SARS Payment/Receipt'", summary)
+
+		full = classify(get_classification_trace("Full"))
+		self.assertIn("voucher_type is 'Journal Entry'", full)
+		self.assertIn("filtered_out = rows [1, 2]", full)
+		self.assertTrue(full.endswith(summary.split("\n")[-1]))
+
+		# The steps of a voucher that ends up unclassified are kept in Summary mode too
+		trace = get_classification_trace("Summary")
+		trace.step("journal_entry")
+		trace.step("legs_error", error="max() arg is an empty sequence")
+		unclassified = trace.render()
+		self.assertIn("voucher_type is 'Journal Entry'", unclassified)
+		self.assertIn("max() arg is an empty sequence", unclassified)
+
+		trace = get_classification_trace("Summary")
+		trace.step("journal_entry")
+		trace.rule("account_debit_classification", account="Bank Charges - TC", classification=None)
+		self.assertIn("voucher_type is 'Journal Entry'", trace.render())
+
+	def test_sync_gl_entries(self):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-1"
+		vat_return.last_synced_on = "2024-04-01 00:00:00"
+		existing_rows = {
+			"GLE-1": frappe._dict(name="row-1", gl_entry="GLE-1", classification="Output - E Exempt"),
+			"GLE-2": frappe._dict(
+				name="row-2", gl_entry="GLE-2", classification="Input - B Capital goods imported"
+			),
+		}
+
+		classified_entries = [
+			# Manually classified, not classified automatically
+			frappe._dict(name="GLE-1", tax_amount=30, classification=None, is_cancelled=0),
+			# Cancelled
+			frappe._dict(name="GLE-2", tax_amount=15, classification=None, is_cancelled=1),
+			# New
+			frappe._dict(
+				name="GLE-4", tax_amount=45, classification="Output - E Exempt", is_cancelled=0
+			),
+		]
+
+		module = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return"
+		with patch.object(vat_return, "fetch_gl_entries") as mock_fetch, patch.object(
+			vat_return, "process_gl_entries", return_value=classified_entries
+		), patch.object(vat_return, "update_tax_fields") as mock_update_tax_fields, patch(
+			f"{module}.get_existing_gl_entry_rows", return_value=existing_rows
+		) as mock_existing_rows, patch(
+			f"{module}.get_last_gl_entry_row_idx", return_value=3
+		), patch(
+			f"{module}.update_gl_entry_row"
+		) as mock_update_row, patch(
+			f"{module}.insert_gl_entry_rows"
+		) as mock_insert_rows, patch(
+			f"{module}.delete_missing_gl_entry_rows"
+		) as mock_delete_missing_rows, patch(
+			f"{module}.get_classification_totals_from_db"
+		) as mock_totals:
+			vat_return.sync_gl_entries()
+
+		mock_fetch.assert_called_once_with(modified_since="2024-04-01 00:00:00")
+		mock_existing_rows.assert_called_once_with("VAT-RETURN-1", ["GLE-1", "GLE-2", "GLE-4"])
+		self.assertNotEqual(vat_return.last_synced_on, "2024-04-01 00:00:00")
+
+		updated_rows = {call.args[0]: call.args[1] for call in mock_update_row.call_args_list}
+		self.assertEqual(updated_rows["row-1"]["classification"], "Output - E Exempt")
+		self.assertEqual(updated_rows["row-1"]["tax_amount"], 30)
+		self.assertIsNone(updated_rows["row-2"]["classification"])
+		self.assertEqual(updated_rows["row-2"]["is_cancelled"], 1)
+
+		mock_insert_rows.assert_called_once()
+		new_rows = mock_insert_rows.call_args.args[1]
+		self.assertEqual([row["gl_entry"] for row in new_rows], ["GLE-4"])
+		self.assertEqual(mock_insert_rows.call_args.kwargs["start_idx"], 4)
+		# Rows of GL Entries deleted by a repost are removed before the totals are recalculated
+		mock_delete_missing_rows.assert_called_once_with("VAT-RETURN-1")
+
+		mock_totals.assert_called_once_with("VAT-RETURN-1")
+		mock_update_tax_fields.assert_called_once_with(mock_totals.return_value)
+
+	def test_delete_missing_gl_entry_rows(self):
+		gl_entry = frappe.db.get_value("GL Entry", {}, "name")
+		if not gl_entry:
+			self.skipTest("No GL Entry in the test site")
+
+		vat_return = frappe._dict(
+			name="VAT-RETURN-MISSING", doctype="Value-added Tax Return", docstatus=0
+		)
+		insert_gl_entry_rows(
+			vat_return,
+			[
+				dict.fromkeys(GL_ENTRY_ROW_FIELDS, None) | {"gl_entry": gl_entry},
+				dict.fromkeys(GL_ENTRY_ROW_FIELDS, None) | {"gl_entry": "GLE-DELETED"},
+			],
+		)
+
+		delete_missing_gl_entry_rows(vat_return.name)
+
+		self.assertEqual(
+			frappe.get_all(
+				"Value-added Tax Return GL Entry",
+				filters={"parent": vat_return.name},
+				pluck="gl_entry",
+			),
+			[gl_entry],
+		)
+
+	def test_set_gl_entries(self):
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.name = "VAT-RETURN-1"
+		classified_entries = [
+			frappe._dict(name="GLE-1", tax_amount=15, classification="Output - E Exempt"),
+			frappe._dict(name="GLE-2", tax_amount=30, classification="Output - E Exempt"),
+		]
+
+		module = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return"
+		with patch.object(vat_return, "update_tax_fields") as mock_update_tax_fields, patch(
+			f"{module}.delete_gl_entry_rows"
+		) as mock_delete_rows, patch(f"{module}.insert_gl_entry_rows") as mock_insert_rows:
+			vat_return.set_gl_entries(classified_entries)
+
+		mock_delete_rows.assert_called_once_with("VAT-RETURN-1")
+		self.assertEqual(
+			[row["gl_entry"] for row in mock_insert_rows.call_args.args[1]], ["GLE-1", "GLE-2"]
+		)
+		classification_totals = mock_update_tax_fields.call_args.args[0]
+		self.assertEqual(classification_totals["Output - E Exempt"].tax_amount, 45)
+		self.assertEqual(classification_totals["Output - E Exempt"].count, 2)
+
+	def test_query_plans_use_indexes(self):
+		"""
+		The GL Entries query of the VAT return is served by the index of the
+		`add_vat_return_indexes` patch, instead of a full table scan
+		"""
+		seed_query_plan_rows_for(self)
+
+		vat_return = frappe.new_doc("Value-added Tax Return")
+		vat_return.date_from = "2024-03-01"
+		vat_return.date_to = "2024-04-30"
+
+		assert_query_uses_index(
+			self,
+			vat_return.get_gl_entries_query(["VAT - TC", "VAT Import - TC"]),
+			"tabGL Entry",
+			"account_posting_date_index",
+		)
+
+
+def explain(query):
+	return frappe.db.sql(f"EXPLAIN {query}", as_dict=True)
+
+
+def assert_query_uses_index(testcase, query, table, index_name):
+	"""
+	Fail the test when the query plan reads `table` with a full scan or another index
+	"""
+	plans = explain(query)
+	plan = next((row for row in plans if row.table == table), None)
+	testcase.assertIsNotNone(plan, f"{table} is not in the query plan: {plans}")
+	testcase.assertNotEqual(plan.type, "ALL", f"Full scan of {table}: {plan}")
+	testcase.assertEqual(plan.key, index_name, plan)
+
+
+def seed_query_plan_rows_for(testcase):
+	"""
+	Seed the query plan rows for the test, with fresh statistics of their tables, and delete them
+	once it is done. Skips the test on other databases than MariaDB.
+	"""
+	if frappe.db.db_type != "mariadb":
+		testcase.skipTest("Query plans are only checked on MariaDB")
+
+	seed_query_plan_rows()
+	# ANALYZE TABLE commits, hence a cleanup that deletes the rows again
+	testcase.addCleanup(delete_query_plan_rows)
+	for table in ("tabGL Entry", "tabValue-added Tax Return GL Entry"):
+		frappe.db.sql(f"ANALYZE TABLE `{table}`")
+
+
+# Rows seeded so the optimizer has a choice: most GL Entries of the tax accounts fall outside the
+# period, and most Transactions of the return have another classification
+QUERY_PLAN_SEED_ROWS = 2000
+QUERY_PLAN_SEED_PREFIX = "_Test Query Plan"
+
+
+def seed_query_plan_rows():
+	now = now_datetime()
+	accounts = ["VAT - TC", "VAT Import - TC", "Debtors - TC", "Sales - TC"]
+	frappe.db.bulk_insert(
+		"GL Entry",
+		["name", "account", "posting_date", "creation", "modified"],
+		[
+			[
+				f"{QUERY_PLAN_SEED_PREFIX} {i}",
+				accounts[i % len(accounts)],
+				add_days("2023-01-01", i % 365 if i % 100 else 430),
+				now,
+				now,
+			]
+			for i in range(QUERY_PLAN_SEED_ROWS)
+		],
+	)
+
+	for parent in ("VAT-RETURN-1", f"{QUERY_PLAN_SEED_PREFIX} Return"):
+		insert_gl_entry_rows(
+			frappe._dict(name=parent, doctype="Value-added Tax Return", docstatus=0),
+			[
+				dict.fromkeys(GL_ENTRY_ROW_FIELDS, None)
+				| {
+					"gl_entry": f"{QUERY_PLAN_SEED_PREFIX} {i}",
+					"classification": "Output - E Exempt"
+					if i % 100 == 0
+					else "Input - C Other goods supplied to you (excl capital goods)",
+					"is_cancelled": 0,
+				}
+				for i in range(QUERY_PLAN_SEED_ROWS)
+			],
+		)
+
+	frappe.db.commit()
+
+
+def delete_query_plan_rows():
+	frappe.db.delete("GL Entry", {"name": ["like", f"{QUERY_PLAN_SEED_PREFIX}%"]})
+	frappe.db.delete(
+		"Value-added Tax Return GL Entry",
+		{"gl_entry": ["like", f"{QUERY_PLAN_SEED_PREFIX}%"]},
+	)
+	frappe.db.commit()
+
+
+def pairwise_split_contra_legs(legs):
+	"""
+	The contra leg matching of process_gl_entries before split_contra_legs, used as reference
+	"""
+	# Originally unset, which raised an UnboundLocalError when the first leg had no debit or credit
+	contra_entry_with_same_amount = None
+
+	filtered_out = []
+	for journal_entry in legs:
+		if journal_entry not in filtered_out:
+			if journal_entry.journal_entry_account_debit != 0:
+				debit_amount = journal_entry.journal_entry_account_debit
+				contra_entry_with_same_amount = next(
+					(je for je in legs if je.journal_entry_account_credit == debit_amount),
+					None,
+				)
+			elif journal_entry.journal_entry_account_credit != 0:
+				credit_amount = journal_entry.journal_entry_account_credit
+				contra_entry_with_same_amount = next(
+					(je for je in legs if je.journal_entry_account_debit == credit_amount),
+					None,
+				)
+			if contra_entry_with_same_amount:
+				filtered_out += [contra_entry_with_same_amount, journal_entry]
+
+	return filtered_out, [leg for leg in legs if leg not in filtered_out]
@@ -4,59 +4,83 @@
 frappe.ui.form.on("Value-added Tax Return", {
 	refresh(frm) {
 		frm.trigger("set_intro");
+		frm.trigger("render_transactions");
 		
 		// Add custom button
-		if (!frm.doc.__islocal) {
+		if (!frm.doc.__islocal && frm.doc.docstatus === 0) {
 			frm.add_custom_button(__("Get transactions for period"), function() {
 				if (frm.is_dirty()) frappe.throw(__("Please save before proceeding."))
-				frappe.call({
-					method: "get_gl_entries",
-					doc: frm.doc,
-					freeze: true,
-					freeze_message: __("Retrieving GL Entries..."),
-					callback: function(r){
-						if (r.message) {
-							let response = r.message;
-							if(response) {
-								// Populate table with new results
-								frm.clear_table("gl_entries");
-								response.forEach((entry) => {
-									let row = frm.add_child("gl_entries");
-									row.gl_entry = entry.name;
-									row.posting_date = entry.posting_date
-									row.voucher_type = entry.voucher_type
-									row.voucher_no = entry.voucher_no
-									row.taxes_and_charges = entry.taxes_and_charges_template
-									row.tax_account_debit = entry.general_ledger_debit
-									row.tax_account_credit = entry.general_ledger_credit
-									row.classification = entry.classification
-									row.classification_debugging = entry.classification_debugging
-									row.tax_amount = entry.tax_amount
-									row.incl_tax_amount = entry.incl_tax_amount
-									row.is_cancelled = entry.is_cancelled
-								});
-								frm.refresh_field("gl_entries");
-								frm.get_field("gl_entries").tab.set_active();
-								frm.trigger("set_intro");
-								frappe.show_alert({ message: __('GL Entries have been retrieved'), indicator: 'green' });
-								frm.save();
-							}
-						}
-					}
+				frm.call("enqueue_get_gl_entries").then(() => {
+					frm.dashboard.show_progress(__("Retrieving GL Entries"), 0, __("Queued"));
 				});
 			});
+
+			if (frm.doc.last_synced_on) {
+				frm.add_custom_button(__("Sync changed transactions"), function() {
+					if (frm.is_dirty()) frappe.throw(__("Please save before proceeding."))
+					frm.call("enqueue_get_gl_entries", { incremental: 1 }).then(() => {
+						frm.dashboard.show_progress(__("Retrieving GL Entries"), 0, __("Queued"));
+					});
+				});
+			}
 		}
 	},
+	setup(frm) {
+		// Follow the progress of the background 'Get transactions for period' job
+		frappe.realtime.on("vat_return_gl_entries_progress", (data) => {
+			if (data.vat_return !== frm.doc.name) return;
+
+			const title = __("Retrieving GL Entries");
+			if (data.stage === "fetched") {
+				frm.dashboard.show_progress(title, 0, __("{0} GL Entries fetched", [data.fetched]));
+			}
+			else if (data.stage === "classified") {
+				frm.dashboard.show_progress(title, data.total ? data.classified / data.total * 50 : 50,
+					__("{0} of {1} GL Entries classified", [data.classified, data.total]));
+			}
+			else if (data.stage === "saved") {
+				frm.dashboard.show_progress(title, data.total ? 50 + data.saved / data.total * 50 : 100,
+					data.total
+						? __("{0} of {1} transactions saved", [data.saved, data.total])
+						: __("{0} transactions saved", [data.saved]));
+			}
+			else if (data.stage === "done") {
+				frm.dashboard.hide_progress(title);
+				frm.reload_doc().then(() => {
+					frm.get_field("transactions_html").tab.set_active();
+					frappe.show_alert({ message: __('GL Entries have been retrieved'), indicator: 'green' });
+				});
+			}
+			else if (data.stage === "failed") {
+				frm.dashboard.hide_progress(title);
+				frappe.show_alert({ message: __('Retrieving GL Entries failed, please check the Error Log'), indicator: 'red' });
+			}
+		});
+	},
 	set_intro(frm) {
-		// Set the intro message on the form to show unclassified transactions
-		const unclassified = frm.doc.gl_entries.filter((entry) => entry.classification.length === 0 && entry.is_cancelled === 0);
-		if (unclassified.length > 0) {
-			frm.set_intro(`<b>${unclassified.length}</b> ` + __("unclassified transactions"), 'orange');
+		// Set the intro message on the form to show unclassified transactions, counted per
+		// classification in the Classification Summary
+		const unclassified_count = (frm.doc.classification_summary || []).reduce(
+			(count, row) => count + (row.unclassified_count || 0), 0
+		);
+		if (unclassified_count > 0) {
+			frm.set_intro(`<b>${unclassified_count}</b> ` + __("unclassified transactions"), 'orange');
 		}
 		else {
 			frm.set_intro("");
 		}
 	},
+	render_transactions(frm) {
+		// The Transactions are not loaded with the document, the grid pages them from the server
+		if (frm.doc.__islocal) {
+			frm.get_field("transactions_html").$wrapper.empty();
+			return;
+		}
+		if (!frm.transactions_grid || frm.transactions_grid.frm !== frm) {
+			frm.transactions_grid = new VATReturnTransactionsGrid(frm, frm.get_field("transactions_html").$wrapper);
+		}
+		frm.transactions_grid.refresh();
+	},
 	date_from(frm) {
 		frm.trigger("clear_gl_entries_after_date_change");
 	},
@@ -64,13 +88,11 @@ frappe.ui.form.on("Value-added Tax Return", {
 		frm.trigger("clear_gl_entries_after_date_change");		
 	},
 	clear_gl_entries_after_date_change(frm) {
-		// Clear the Journal Entries table
-		if (frm.doc.gl_entries.length !== 0) {
+		// The Transactions are cleared when the document is saved with the new dates
+		if (frm.doc.transactions_count > 0) {
 			frappe.confirm(__('Changing dates will clear the Transactions table. Do you want to proceed?'),
 				() => {
 					// action to perform if Yes is selected
-					frm.clear_table("gl_entries");
-					frm.refresh_field("gl_entries");
 				}, () => {
 					// action to perform if No is selected
 					frm.reload_doc();
@@ -115,4 +137,187 @@ function route_to_report(docname, classification) {
 	};
 	frappe.set_route("query-report", "Value-added Tax Return Linked Transactions");
 
-}
\ No newline at end of file
+}
+
+const TRANSACTIONS_METHOD = "csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return";
+
+class VATReturnTransactionsGrid {
+	// A paged, read-mostly grid of the stored Transactions. Only the classification can be edited,
+	// the classification debugging is loaded when a row is expanded.
+	constructor(frm, $wrapper) {
+		this.frm = frm;
+		this.$wrapper = $wrapper;
+		this.start = 0;
+		this.page_length = 20;
+		this.filters = { classification: "", unclassified: 0 };
+		this.make();
+	}
+
+	make() {
+		this.$wrapper.html(`
+			<div class="vat-return-transactions">
+				<div class="row transactions-filters"></div>
+				<div class="table-responsive">
+					<table class="table table-bordered table-condensed">
+						<thead>
+							<tr>
+								<th>${__("Voucher Type")}</th>
+								<th>${__("Voucher No")}</th>
+								<th>${__("Posting Date")}</th>
+								<th class="text-right">${__("Tax Amount")}</th>
+								<th class="text-right">${__("Incl Tax Amount")}</th>
+								<th>${__("Classification")}</th>
+								<th></th>
+							</tr>
+						</thead>
+						<tbody></tbody>
+					</table>
+				</div>
+				<div class="flex justify-between align-center">
+					<span class="text-muted transactions-page-info"></span>
+					<div class="btn-group">
+						<button class="btn btn-default btn-xs transactions-prev">${__("Previous")}</button>
+						<button class="btn btn-default btn-xs transactions-next">${__("Next")}</button>
+					</div>
+				</div>
+			</div>
+		`);
+		this.$tbody = this.$wrapper.find("tbody");
+
+		this.ready = new Promise((resolve) => {
+			frappe.model.with_doctype("Value-added Tax Return GL Entry", () => {
+				this.classifications = frappe.meta.get_docfield(
+					"Value-added Tax Return GL Entry", "classification"
+				).options.split("\n");
+				this.make_filters();
+				resolve();
+			});
+		});
+
+		this.$wrapper.find(".transactions-prev").on("click", () => {
+			this.start = Math.max(this.start - this.page_length, 0);
+			this.refresh();
+		});
+		this.$wrapper.find(".transactions-next").on("click", () => {
+			if (this.start + this.page_length < this.total) {
+				this.start += this.page_length;
+				this.refresh();
+			}
+		});
+	}
+
+	make_filters() {
+		const $filters = this.$wrapper.find(".transactions-filters");
+		const make_control = (df) => {
+			const control = frappe.ui.form.make_control({
+				df: df,
+				parent: $("<div class='col-sm-4'>").appendTo($filters),
+				render_input: true,
+			});
+			control.refresh();
+			return control;
+		};
+
+		this.classification_filter = make_control({
+			fieldtype: "Select",
+			label: __("Classification"),
+			options: this.classifications,
+			change: () => this.set_filter("classification", this.classification_filter.get_value()),
+		});
+		this.unclassified_filter = make_control({
+			fieldtype: "Check",
+			label: __("Unclassified only"),
+			change: () => this.set_filter("unclassified", this.unclassified_filter.get_value()),
+		});
+	}
+
+	set_filter(key, value) {
+		if (this.filters[key] === value) return;
+		this.filters[key] = value;
+		this.start = 0;
+		this.refresh();
+	}
+
+	refresh() {
+		return this.ready.then(() => frappe.call({
+			method: `${TRANSACTIONS_METHOD}.get_gl_entry_rows`,
+			args: {
+				vat_return: this.frm.doc.name,
+				start: this.start,
+				page_length: this.page_length,
+				classification: this.filters.classification,
+				unclassified: this.filters.unclassified,
+			},
+		})).then((r) => {
+			this.total = r.message.total;
+			this.render_rows(r.message.rows);
+		});
+	}
+
+	render_rows(rows) {
+		this.$tbody.empty();
+		if (!rows.length) {
+			this.$tbody.html(`<tr><td colspan="7" class="text-muted text-center">${__("No transactions")}</td></tr>`);
+		}
+
+		const editable = this.frm.doc.docstatus === 0;
+		rows.forEach((row) => {
+			const $row = $(`
+				<tr class="${row.is_cancelled ? "text-muted" : ""}">
+					<td>${__(row.voucher_type)}</td>
+					<td><a href="/app/${frappe.router.slug(row.voucher_type)}/${encodeURIComponent(row.voucher_no)}">${frappe.utils.escape_html(row.voucher_no)}</a></td>
+					<td>${frappe.datetime.str_to_user(row.posting_date)}</td>
+					<td class="text-right">${format_currency(row.tax_amount)}</td>
+					<td class="text-right">${format_currency(row.incl_tax_amount)}</td>
+					<td class="transaction-classification"></td>
+					<td><button class="btn btn-xs btn-default transaction-details">${__("Details")}</button></td>
+				</tr>
+			`).appendTo(this.$tbody);
+
+			const $select = $("<select class='form-control input-xs'>")
+				.prop("disabled", !editable)
+				.appendTo($row.find(".transaction-classification"));
+			this.classifications.forEach((classification) => {
+				$("<option>").val(classification).text(__(classification) || "").appendTo($select);
+			});
+			$select.val(row.classification || "");
+			$select.on("change", () => this.set_classification(row, $select.val()));
+
+			$row.find(".transaction-details").on("click", () => this.toggle_details(row, $row));
+		});
+
+		const end = Math.min(this.start + this.page_length, this.total);
+		this.$wrapper.find(".transactions-page-info").text(
+			this.total ? __("{0} to {1} of {2}", [this.start + 1, end, this.total]) : ""
+		);
+		this.$wrapper.find(".transactions-prev").prop("disabled", this.start === 0);
+		this.$wrapper.find(".transactions-next").prop("disabled", end >= this.total);
+	}
+
+	toggle_details(row, $row) {
+		if ($row.next().hasClass("transaction-debugging")) {
+			$row.next().remove();
+			return;
+		}
+
+		const $details = $(`<tr class="transaction-debugging"><td colspan="7"><pre class="text-muted">${__("Loading...")}</pre></td></tr>`)
+			.insertAfter($row);
+		frappe.call({
+			method: `${TRANSACTIONS_METHOD}.get_gl_entry_row_debugging`,
+			args: { vat_return: this.frm.doc.name, row: row.name },
+		}).then((r) => {
+			$details.find("pre").text(r.message || __("No classification details"));
+		});
+	}
+
+	set_classification(row, classification) {
+		frappe.call({
+			method: `${TRANSACTIONS_METHOD}.set_gl_entry_row_classification`,
+			args: { vat_return: this.frm.doc.name, row: row.name, classification: classification },
+			freeze: true,
+		}).then(() => {
+			row.classification = classification;
+			this.frm.reload_doc();
+		});
+	}
+}
@@ -1,15 +1,34 @@
 # Copyright (c) 2024, Dirk van der Laarse and contributors
 # For license information, please see license.txt
 
+from collections import defaultdict
+
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from pypika import Case
+from frappe.query_builder.functions import Count, Max, Min, Sum
+from frappe.utils import cint, create_batch, get_link_to_form, getdate, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
 
+from csf_za.tax_compliance.doctype.value_added_tax_return.classification_trace import (
+	get_classification_trace,
+)
+from csf_za.tax_compliance.doctype.value_added_tax_return_period_summary.value_added_tax_return_period_summary import (
+	delete_period_summary,
+	refresh_period_summary,
+)
 from csf_za.tax_compliance.doctype.value_added_tax_return_settings.value_added_tax_return_settings import (
-	VAT_RETURN_SETTING_FIELD_MAP,
+	classifies_gl_entries_at_posting,
+	get_account_classifications,
+	get_template_classifications,
 )
 
+GL_ENTRIES_BATCH_SIZE = 1000
+GL_ENTRIES_JOB_TIMEOUT = 60 * 60
+GL_ENTRY_PAGE_LENGTH = 20
+UNCLASSIFIED_VOUCHERS_SHOWN = 10
+LINKED_TRANSACTIONS_CACHE_KEY = "vat_return_linked_transactions"
+
 
 class ValueaddedTaxReturn(Document):
 
@@ -19,71 +38,149 @@ class ValueaddedTaxReturn(Document):
 		"""
 		Called on save
 		"""
-		self.refresh_output_tax_fields()
-		self.refresh_input_tax_fields()
+		self.clear_gl_entries_after_period_change()
+
+		classification_totals = self.get_classification_totals()
+		self.refresh_classification_summary(classification_totals)
+		self.refresh_transaction_counts(classification_totals)
+		self.refresh_output_tax_fields(classification_totals)
+		self.refresh_input_tax_fields(classification_totals)
+		if not self.is_new():
+			refresh_period_summary(self.name, self.company)
 
-	def refresh_output_tax_fields(self):
+	def after_insert(self):
+		"""
+		An amendment starts with the stored Transactions of the return it amends, unless its company
+		or period differs
+		"""
+		if not self.amended_from:
+			return
+
+		amended = frappe.db.get_value(
+			"Value-added Tax Return",
+			self.amended_from,
+			["company", "date_from", "date_to"],
+			as_dict=True,
+		)
+		if (amended.company, getdate(amended.date_from), getdate(amended.date_to)) == (
+			self.company,
+			getdate(self.date_from),
+			getdate(self.date_to),
+		):
+			copy_gl_entry_rows(self.amended_from, self)
+		else:
+			self.last_synced_on = None
+
+		self.update_tax_fields(get_classification_totals_from_db(self.name))
+
+	def on_update(self):
+		clear_linked_transactions_cache(self.name)
+
+	def on_trash(self):
+		delete_gl_entry_rows(self.name)
+		delete_period_summary(self.name)
+		clear_linked_transactions_cache(self.name)
+
+	def clear_gl_entries_after_period_change(self):
+		"""
+		The stored Transactions no longer apply after a change of company or period, and a cleared
+		Transactions table needs a full sync again
+		"""
+		if not self.is_new() and any(
+			self.has_value_changed(fieldname) for fieldname in ("company", "date_from", "date_to")
+		):
+			delete_gl_entry_rows(self.name)
+			self.last_synced_on = None
+		elif not self.transactions_count:
+			self.last_synced_on = None
+
+	def get_classification_totals(self):
+		"""
+		Totals per classification of the stored Transactions, see `get_classification_totals`
+		"""
+		if self.is_new():
+			return get_classification_totals([])
+
+		return get_classification_totals_from_db(self.name)
+
+	def refresh_classification_summary(self, classification_totals):
+		"""
+		Set a Classification Summary row per classification with stored Transactions, in the order
+		of the classification options
+		"""
+		options = get_classification_options()
+		self.set("classification_summary", [])
+		for classification, totals in sorted(
+			classification_totals.items(),
+			key=lambda item: (
+				options.index(item[0] or "") if (item[0] or "") in options else len(options),
+				item[0] or "",
+			),
+		):
+			if not totals.count:
+				continue
+
+			self.append(
+				"classification_summary",
+				{
+					"classification": classification or None,
+					"transactions_count": totals.count,
+					"unclassified_count": totals.unclassified_count,
+					"cancelled_count": totals.cancelled_count,
+					"tax_account_debit": totals.tax_account_debit,
+					"tax_account_credit": totals.tax_account_credit,
+					"tax_amount": totals.tax_amount,
+					"incl_tax_amount": totals.incl_tax_amount,
+					"docstatus": self.docstatus,
+				},
+			)
+
+	def refresh_transaction_counts(self, classification_totals):
+		"""
+		Update the number of stored Transactions shown on the form. The unclassified Transactions
+		are counted per classification in the Classification Summary.
+		"""
+		self.transactions_count = sum(totals.count for totals in classification_totals.values())
+
+	def refresh_output_tax_fields(self, classification_totals=None):
 		"""
 		Recalculate output tax calculated fields
 		"""
+		if classification_totals is None:
+			classification_totals = self.get_classification_totals()
+
 		# Calculate field 1
-		self.standard_rate_main_excl = sum(
-			[
-				row.incl_tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - A Standard rate (excl capital goods)"
-			]
-		)
+		self.standard_rate_main_excl = classification_totals[
+			"Output - A Standard rate (excl capital goods)"
+		].incl_tax_amount
 
 		# Calculate field 4
-		self.standard_rate_main_incl = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - A Standard rate (excl capital goods)"
-			]
-		)
+		self.standard_rate_main_incl = classification_totals[
+			"Output - A Standard rate (excl capital goods)"
+		].tax_amount
 
 		# Calculate field 1a
-		self.standard_rate_capital_excl = sum(
-			[
-				row.incl_tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - B Standard rate (only capital goods)"
-			]
-		)
+		self.standard_rate_capital_excl = classification_totals[
+			"Output - B Standard rate (only capital goods)"
+		].incl_tax_amount
 
 		# Calculate field 4a
-		self.stardard_rate_total = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - B Standard rate (only capital goods)"
-			]
-		)
+		self.stardard_rate_total = classification_totals[
+			"Output - B Standard rate (only capital goods)"
+		].tax_amount
 
 		# Calculate field 2
-		self.zero_rate_main_excl = sum(
-			[
-				row.incl_tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - C Zero Rated (excl goods exported)"
-			]
-		)
+		self.zero_rate_main_excl = classification_totals[
+			"Output - C Zero Rated (excl goods exported)"
+		].incl_tax_amount
 
 		# Calculate field 2a
-		self.zero_rate_exported_excl = sum(
-			[
-				row.incl_tax_amount
-				for row in self.gl_entries
-				if row.classification == "Output - D Zero Rated (only goods exported)"
-			]
-		)
+		self.zero_rate_exported_excl = classification_totals[
+			"Output - D Zero Rated (only goods exported)"
+		].incl_tax_amount
 
 		# Calculate field 3
-		self.exempt_excl = sum(
-			[row.incl_tax_amount for row in self.gl_entries if row.classification == "Output - E Exempt"]
-		)
+		self.exempt_excl = classification_totals["Output - E Exempt"].incl_tax_amount
 
 		# Calculate field 6
 		self.acc_exceed_28_days_total = (
@@ -108,45 +205,30 @@ class ValueaddedTaxReturn(Document):
 			+ self.adj_other_incl
 		)
 
-	def refresh_input_tax_fields(self):
+	def refresh_input_tax_fields(self, classification_totals=None):
 		"""
 		Recalculate input tax calculated fields
 		"""
+		if classification_totals is None:
+			classification_totals = self.get_classification_totals()
+
 		# Calculate field 14
-		self.capital_goods_supplied = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Input - A Capital goods and/or services supplied to you (local)"
-			]
-		)
+		self.capital_goods_supplied = classification_totals[
+			"Input - A Capital goods and/or services supplied to you (local)"
+		].tax_amount
 
 		# Calculate field 14a
-		self.capital_goods_imported = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Input - B Capital goods imported"
-			]
-		)
+		self.capital_goods_imported = classification_totals["Input - B Capital goods imported"].tax_amount
 
 		# Calculate field 15
-		self.other_goods_supplied = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Input - C Other goods supplied to you (excl capital goods)"
-			]
-		)
+		self.other_goods_supplied = classification_totals[
+			"Input - C Other goods supplied to you (excl capital goods)"
+		].tax_amount
 
 		# Calculate field 15a
-		self.other_goods_imported = sum(
-			[
-				row.tax_amount
-				for row in self.gl_entries
-				if row.classification == "Input - D Other goods imported (excl capital goods)"
-			]
-		)
+		self.other_goods_imported = classification_totals[
+			"Input - D Other goods imported (excl capital goods)"
+		].tax_amount
 
 		# Calculate total input tax
 		self.total_input_tax = (
@@ -166,48 +248,202 @@ class ValueaddedTaxReturn(Document):
 		"""
 		Validate when document is submitted
 		"""
-		unclassified = [
-			row for row in self.gl_entries if not row.classification and not row.is_cancelled
-		]
-		if len(unclassified) > 0:
-			frappe.throw(
-				_("Please classify the {0} remaining unclassified transactions before submitting").format(
-					len(unclassified)
+		# Counted in the Classification Summary refreshed in validate, as the form intro does
+		unclassified = sum(cint(row.unclassified_count) for row in self.classification_summary)
+		if unclassified > 0:
+			message = _(
+				"Please classify the {0} remaining unclassified transactions before submitting"
+			).format(unclassified)
+			# One more than shown, to tell whether there are more
+			vouchers = get_unclassified_vouchers(self.name, limit=UNCLASSIFIED_VOUCHERS_SHOWN + 1)
+			if vouchers:
+				message += "<br><br>" + _("Unclassified transactions of:") + "<br>"
+				message += "<br>".join(
+					get_link_to_form(voucher.voucher_type, voucher.voucher_no)
+					for voucher in vouchers[:UNCLASSIFIED_VOUCHERS_SHOWN]
 				)
-			)
+				if len(vouchers) > UNCLASSIFIED_VOUCHERS_SHOWN:
+					message += "<br>..."
+
+			frappe.throw(message)
+
+		set_gl_entry_rows_docstatus(self.name, 1)
+
+	def on_cancel(self):
+		set_gl_entry_rows_docstatus(self.name, 2)
 
 	@frappe.whitelist()
 	def get_gl_entries(self):
 		"""
-		Retrieve journal entries for linked accounts
+		Retrieve and classify journal entries for linked accounts
 		"""
-		vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", self.company)
+		gl_entries = self.get_classified_gl_entries()
+		for entry in gl_entries:
+			entry.classification_debugging = render_classification_trace(entry)
+			entry.pop("classification_trace", None)
 
-		# Construct the query using Frappe query builder
-		gle = frappe.qb.DocType("GL Entry")
-		je = frappe.qb.DocType("Journal Entry")
-		jea = frappe.qb.DocType("Journal Entry Account")
-		si = frappe.qb.DocType("Sales Invoice")
-		sitc = frappe.qb.DocType("Sales Taxes and Charges")
-		pi = frappe.qb.DocType("Purchase Invoice")
-		pitc = frappe.qb.DocType("Purchase Taxes and Charges")
+		return gl_entries
+
+	@frappe.whitelist()
+	def enqueue_get_gl_entries(self, incremental=False):
+		"""
+		Retrieve, classify and store the journal entries for linked accounts in a background job.
+		Progress is published to the form with the 'vat_return_gl_entries_progress' realtime event.
+
+		With `incremental`, only GL Entries created or modified since the last sync are retrieved,
+		see `sync_gl_entries`.
+		"""
+		self.check_permission("write")
+		if self.docstatus != 0:
+			frappe.throw(_("Transactions can only be retrieved for draft returns"))
+
+		job_id = get_gl_entries_job_id(self.name)
+		if is_job_enqueued(job_id):
+			frappe.throw(_("Transactions for {0} are already being retrieved").format(self.name))
+
+		frappe.enqueue(
+			"csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return.get_gl_entries_in_background",
+			queue="long",
+			timeout=GL_ENTRIES_JOB_TIMEOUT,
+			job_id=job_id,
+			deduplicate=True,
+			now=frappe.flags.in_test,
+			vat_return=self.name,
+			incremental=cint(incremental),
+		)
+
+	def sync_gl_entries(self, progress_callback=None):
+		"""
+		Update the stored Transactions table with the GL Entries created or modified (including cancelled)
+		since `last_synced_on`: new GL Entries are inserted and existing rows are updated in place.
+		Manual classifications are kept unless the GL Entry was cancelled. Rows of GL Entries that no
+		longer exist, e.g. replaced by a ledger repost, are deleted.
+
+		The totals are recalculated from all stored rows in one aggregate query, see
+		`get_classification_totals_from_db`.
+		"""
+		synced_on = now_datetime()
+		gl_entries = self.get_classified_gl_entries(modified_since=self.last_synced_on)
+
+		existing_rows = get_existing_gl_entry_rows(self.name, [entry.name for entry in gl_entries])
+		new_rows = []
+		for count, entry in enumerate(gl_entries, start=1):
+			values = get_gl_entry_row(entry)
+			row = existing_rows.get(entry.name)
+			if row:
+				if not entry.is_cancelled and not entry.classification:
+					values["classification"] = row.classification
+				update_gl_entry_row(row.name, values)
+			else:
+				new_rows.append(values)
+
+			if progress_callback and count % GL_ENTRIES_BATCH_SIZE == 0:
+				progress_callback(count)
+
+		insert_gl_entry_rows(self, new_rows, start_idx=get_last_gl_entry_row_idx(self.name) + 1)
+		delete_missing_gl_entry_rows(self.name)
+
+		self.last_synced_on = synced_on
+		self.update_tax_fields(get_classification_totals_from_db(self.name))
 
+	def set_gl_entries(self, gl_entries, progress_callback=None):
+		"""
+		Replace the stored Transactions table with the classified entries, without loading or saving
+		the table through the document: stale rows are deleted in one statement and the new rows are
+		written with multi-row inserts of GL_ENTRIES_BATCH_SIZE rows
+		"""
+		synced_on = now_datetime()
+		delete_gl_entry_rows(self.name)
+
+		rows = [get_gl_entry_row(entry) for entry in gl_entries]
+		insert_gl_entry_rows(self, rows, progress_callback=progress_callback)
+
+		self.last_synced_on = synced_on
+		self.update_tax_fields(get_classification_totals(frappe._dict(row) for row in rows))
+
+	def update_tax_fields(self, classification_totals):
+		"""
+		Recalculate the tax fields from the given totals and store them, leaving the Transactions
+		table in the database untouched
+		"""
+		self.refresh_classification_summary(classification_totals)
+		self.refresh_transaction_counts(classification_totals)
+		self.refresh_output_tax_fields(classification_totals)
+		self.refresh_input_tax_fields(classification_totals)
+		self.modified = now_datetime()
+		self.modified_by = frappe.session.user
+		self.db_update()
+		self.update_child_table("classification_summary")
+		refresh_period_summary(self.name, self.company)
+		clear_linked_transactions_cache(self.name)
+		self.notify_update()
+
+	def publish_gl_entries_progress(self, stage, **kwargs):
+		"""
+		Notify the form of the progress of a background 'Get transactions for period' job
+		"""
+		frappe.publish_realtime(
+			"vat_return_gl_entries_progress",
+			{"vat_return": self.name, "stage": stage, **kwargs},
+			doctype=self.doctype,
+			docname=self.name,
+		)
+
+	def get_classified_gl_entries(self, modified_since=None):
+		"""
+		The classified GL Entries of the period, optionally only those modified after `modified_since`.
+
+		With 'Classify Transactions when Posted' in the settings these are the classifications stored
+		when the vouchers were posted (see `get_posted_gl_entries`), otherwise the GL Entries are
+		fetched and classified now.
+		"""
+		if classifies_gl_entries_at_posting(self.company):
+			return get_posted_gl_entries(
+				self.company, self.date_from, self.date_to, modified_since=modified_since
+			)
+
+		return self.process_gl_entries(self.fetch_gl_entries(modified_since=modified_since))
+
+	def fetch_gl_entries(self, modified_since=None, voucher=None):
+		"""
+		Retrieve journal entries for linked accounts, optionally only those modified after `modified_since`.
+		With `voucher`, given as (voucher_type, voucher_no), those of the voucher instead of the period.
+
+		The GL Entries are fetched on their own, followed by one batched lookup per voucher type
+		for the Journal Entry legs and the Sales/Purchase Invoice taxes. These are merged into one
+		row per GL Entry (one row per leg for Journal Entries), as expected by `transform_gl_entries`.
+		"""
+		vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", self.company)
 		tax_accounts = [row.account for row in vat_return_settings.tax_accounts]
 
+		# Execute the query and fetch the result as a list of dictionaries
+		gl_entries = self.get_gl_entries_query(
+			tax_accounts, modified_since=modified_since, voucher=voucher
+		).run(as_dict=True)
+
+		voucher_nos = defaultdict(set)
+		for entry in gl_entries:
+			voucher_nos[entry.voucher_type].add(entry.voucher_no)
+
+		return merge_gl_entries(
+			gl_entries,
+			journal_entry_legs=get_journal_entry_legs(voucher_nos["Journal Entry"]),
+			invoice_taxes={
+				"Sales Invoice": get_invoice_taxes("Sales Invoice", voucher_nos["Sales Invoice"]),
+				"Purchase Invoice": get_invoice_taxes(
+					"Purchase Invoice", voucher_nos["Purchase Invoice"]
+				),
+			},
+		)
+
+	def get_gl_entries_query(self, tax_accounts, modified_since=None, voucher=None):
+		"""
+		The GL Entries query of `fetch_gl_entries`. The period filter is served by the
+		(account, posting_date) index of the `add_vat_return_indexes` patch.
+		"""
+		gle = frappe.qb.DocType("GL Entry")
 		query = (
 			frappe.qb.from_(gle)
-			.left_join(je)
-			.on(je.name == gle.voucher_no)
-			.left_join(jea)
-			.on(jea.parent == je.name)
-			.left_join(si)
-			.on((gle.voucher_type == "Sales Invoice") & (si.name == gle.voucher_no))
-			.left_join(sitc)
-			.on(sitc.parent == si.name)
-			.left_join(pi)
-			.on((gle.voucher_type == "Purchase Invoice") & (pi.name == gle.voucher_no))
-			.left_join(pitc)
-			.on(pitc.parent == pi.name)
 			.select(
 				gle.name,
 				gle.voucher_type,
@@ -216,54 +452,57 @@ class ValueaddedTaxReturn(Document):
 				gle.is_cancelled,
 				gle.debit_in_account_currency.as_("general_ledger_debit"),
 				gle.credit_in_account_currency.as_("general_ledger_credit"),
-				je.total_debit.as_("journal_entry_total_debit"),
-				je.total_credit.as_("journal_entry_total_credit"),
-				je.docstatus.as_("journal_entry_docstatus"),
-				jea.account.as_("journal_entry_account"),
-				jea.debit.as_("journal_entry_account_debit"),
-				jea.credit.as_("journal_entry_account_credit"),
-				jea.idx.as_("journal_entry_account_idx"),
-				sitc.tax_amount.as_("sales_invoice_taxes_tax_amount"),
-				sitc.total.as_("sales_invoice_taxes_total"),
-				pitc.tax_amount.as_("purchase_invoice_taxes_tax_amount"),
-				pitc.total.as_("purchase_invoice_taxes_total"),
-				Case()
-				.when(gle.voucher_type == "Sales Invoice", si.taxes_and_charges)
-				.when(gle.voucher_type == "Purchase Invoice", pi.taxes_and_charges)
-				.else_(None)
-				.as_("taxes_and_charges_template"),
-			)
-			.where(
-				(gle.posting_date >= self.date_from)
-				& (gle.posting_date <= self.date_to)
-				& (gle.account.isin(tax_accounts))
 			)
+			.where(gle.account.isin(tax_accounts))
 		)
 
-		# Execute the query and fetch the result as a list of dictionaries
-		result = query.run(as_dict=True)
+		if voucher:
+			query = query.where((gle.voucher_type == voucher[0]) & (gle.voucher_no == voucher[1]))
+		else:
+			query = query.where((gle.posting_date >= self.date_from) & (gle.posting_date <= self.date_to))
 
-		return self.process_gl_entries(result)
+		if modified_since:
+			# Cancelling a voucher updates `modified` on its GL Entries too
+			query = query.where(gle.modified > modified_since)
 
-	def process_gl_entries(self, gl_entries):
+		return query
+
+	def process_gl_entries(self, gl_entries, progress_callback=None, trace_mode=None):
 		"""
 		Perform classification for each journal entry:
 		        - If it's linked to a Sales Invoice or Purchase Invoice, get the Taxes and Charges Template
 		          and determine the classification based on the maps in Value-add Tax Return Settings
 		        - Else, determine the VAT component and infer the classification based on the G/L Account settings
+
+		How each voucher was classified is recorded as a `classification_trace`, as detailed as
+		`trace_mode` or else the 'Classification Details' setting asks for (see `ClassificationTrace`).
+
+		`progress_callback(classified, total)` is called every GL_ENTRIES_BATCH_SIZE vouchers
 		"""
 		vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", self.company)
 		tax_accounts = [row.account for row in vat_return_settings.tax_accounts]
+		trace_mode = trace_mode or vat_return_settings.get("classification_trace")
 
-		# The field names on 'Value-added Tax Return Settings' correspond to classifications
-		# Create a dict of these fields' values and field names
-		taxes_and_charges_map = [
-			entry for entry in VAT_RETURN_SETTING_FIELD_MAP if vat_return_settings.get(entry["field_name"])
-		]
+		# Classification per (invoice doctype, Taxes and Charges Template)
+		template_classifications = get_template_classifications(self.company)
 
 		vouchers = transform_gl_entries(gl_entries)
 
-		for voucher_no, item in vouchers.items():
+		# Debit and credit classifications of every Account in the Journal Entry legs, in one query
+		account_classifications = get_account_classifications(
+			accounts={
+				leg.journal_entry_account
+				for item in vouchers.values()
+				if item.voucher.voucher_type == "Journal Entry"
+				for leg in item.linked_journal_entries
+				if leg.journal_entry_account
+			}
+		)
+
+		for count, (voucher_no, item) in enumerate(vouchers.items()):
+			if progress_callback and count and count % GL_ENTRIES_BATCH_SIZE == 0:
+				progress_callback(count, len(vouchers))
+
 			voucher = item.voucher
 
 			# Skip Cancelled GL Entries
@@ -272,7 +511,7 @@ class ValueaddedTaxReturn(Document):
 
 			voucher.tax_amount = voucher.general_ledger_debit or voucher.general_ledger_credit
 
-			voucher.classification_debugging = "🚀"
+			trace = voucher.classification_trace = get_classification_trace(trace_mode)
 			if voucher.voucher_type in ("Sales Invoice", "Purchase Invoice"):
 				voucher.incl_tax_amount = (
 					voucher.sales_invoice_taxes_total or voucher.purchase_invoice_taxes_total
@@ -282,39 +521,24 @@ class ValueaddedTaxReturn(Document):
 				if voucher.incl_tax_amount < 0 and voucher.tax_amount > 0:
 					voucher.tax_amount = voucher.tax_amount * -1
 
-				voucher.classification_debugging += (
-					"\n🚀 voucher_type is a 'Sales Invoice' or 'Purchase Invoice')"
-				)
-				voucher.classification_debugging += (
-					f"\n🚀 taxes_and_charges_template = '{voucher.taxes_and_charges_template}'"
-				)
+				trace.step("invoice", taxes_and_charges_template=voucher.taxes_and_charges_template)
 				if voucher.taxes_and_charges_template:
-					# Find the corresponding field name for the voucher's Taxes and Charges Template
-					settings_field = next(
-						(
-							field
-							for field in taxes_and_charges_map
-							if field["reference_doctype"] == voucher.voucher_type
-							and vat_return_settings.get(field["field_name"]) == voucher.taxes_and_charges_template
-						),
-						None,
+					# Find the corresponding classification for the voucher's Taxes and Charges Template
+					classification = template_classifications.get(
+						(voucher.voucher_type, voucher.taxes_and_charges_template)
 					)
 
-					voucher.classification_debugging += f"\n🚀 settings_field = {settings_field}"
-
-					# Get the corresponding classification for this field_name
-					if settings_field:
-						voucher.classification_debugging += (
-							f"\n🚀 classification = {settings_field['classification']}"
-						)
-
-						voucher.classification = settings_field["classification"]
+					if classification:
+						trace.rule("template_classification", classification=classification)
+						voucher.classification = classification
 						continue
+
+					trace.step("template_classification", classification=classification)
 				else:
-					voucher.classification_debugging += "\n🚀 No Taxes and Charges template on Invoice, or Taxes and Charges template is not set in 'Value-added Return Settings'"
+					trace.step("no_template")
 
 			if voucher.voucher_type == "Journal Entry":
-				voucher.classification_debugging += "\n🚀 voucher_type is 'Journal Entry'"
+				trace.step("journal_entry")
 				# Process pairs of Journal Entry Account child records
 				# E.g.
 				#
@@ -329,45 +553,19 @@ class ValueaddedTaxReturn(Document):
 				# Here we want to ignore transactions that has nothing to do with VAT.
 				# Thus, rows 1 and 2 should be filtered out.
 
-				filtered_out = []
-				for journal_entry in item.linked_journal_entries:
-					if journal_entry not in filtered_out:
-						if journal_entry.journal_entry_account_debit != 0:
-							debit_amount = journal_entry.journal_entry_account_debit
-							contra_entry_with_same_amount = next(
-								(
-									je
-									for je in item.linked_journal_entries
-									if je.journal_entry_account_credit == debit_amount
-								),
-								None,
-							)
-						elif journal_entry.journal_entry_account_credit != 0:
-							credit_amount = journal_entry.journal_entry_account_credit
-							contra_entry_with_same_amount = next(
-								(
-									je
-									for je in item.linked_journal_entries
-									if je.journal_entry_account_debit == credit_amount
-								),
-								None,
-							)
-						if contra_entry_with_same_amount:
-							filtered_out += [contra_entry_with_same_amount, journal_entry]
-
-				filtered_journal_entries = [
-					item for item in item.linked_journal_entries if item not in filtered_out
-				]
+				filtered_out, filtered_journal_entries = split_contra_legs(item.linked_journal_entries)
 
 				# If there are no entries remaining after filtering, assume it is an entry for SARS Payment/Receipt
 				if len(filtered_journal_entries) == 0 and len(filtered_out) > 0:
+					trace.rule("sars_payment", filtered_out=filtered_out)
 					voucher.classification = "SARS Payment/Receipt"
 					continue
 
-				voucher.classification_debugging += (
-					f"\n🚀 filtered_out = rows {[je.journal_entry_account_idx for je in filtered_out]}"
+				trace.step(
+					"legs_filtered",
+					filtered_out=filtered_out,
+					filtered_journal_entries=filtered_journal_entries,
 				)
-				voucher.classification_debugging += f"\n🚀 filtered_journal_entries = rows {[je.journal_entry_account_idx for je in filtered_journal_entries]}"
 
 				# Identify the tax, tax inclusive and tax exclusve components of manual Journal Entries
 				tax_leg = next(
@@ -385,35 +583,552 @@ class ValueaddedTaxReturn(Document):
 						key=lambda je: abs(je.journal_entry_account_credit or je.journal_entry_account_debit),
 					)
 				except ValueError as e:
-					voucher.classification_debugging += f"\n🚀 {e}]'"
+					trace.step("legs_error", error=e)
 
 				if all([tax_leg, incl_tax_leg, excl_tax_leg]):
-					voucher.classification_debugging += f"\n🚀 tax_leg = '{tax_leg.journal_entry_account}': '{tax_leg.journal_entry_account_credit or tax_leg.journal_entry_account_debit}'"
-					voucher.classification_debugging += f"\n🚀 incl_tax_leg = '{incl_tax_leg.journal_entry_account}': '{incl_tax_leg.journal_entry_account_credit or incl_tax_leg.journal_entry_account_debit}'"
-					voucher.classification_debugging += f"\n🚀 excl_tax_leg = '{excl_tax_leg.journal_entry_account}': '{excl_tax_leg.journal_entry_account_credit or excl_tax_leg.journal_entry_account_debit}'"
+					trace.step(
+						"legs_chosen",
+						tax_leg=tax_leg,
+						incl_tax_leg=incl_tax_leg,
+						excl_tax_leg=excl_tax_leg,
+					)
 
 					if excl_tax_leg.journal_entry_account_debit != 0:
-						voucher.classification = frappe.get_cached_value(
-							"Account", excl_tax_leg.journal_entry_account, "custom_vat_return_debit_classification"
-						)
+						voucher.classification = account_classifications.get(
+							excl_tax_leg.journal_entry_account, {}
+						).get("custom_vat_return_debit_classification")
 						voucher.incl_tax_amount = (
 							incl_tax_leg.journal_entry_account_credit or incl_tax_leg.journal_entry_account_debit
 						)
-						voucher.classification_debugging += f"\n🚀 'Classify Debit entries...' setting for Account '{excl_tax_leg.journal_entry_account}' = '{voucher.classification}'"
+						trace.rule(
+							"account_debit_classification",
+							account=excl_tax_leg.journal_entry_account,
+							classification=voucher.classification,
+						)
 						continue
 					elif excl_tax_leg.journal_entry_account_credit != 0:
-						voucher.classification = frappe.get_cached_value(
-							"Account", excl_tax_leg.journal_entry_account, "custom_vat_return_credit_classification"
-						)
+						voucher.classification = account_classifications.get(
+							excl_tax_leg.journal_entry_account, {}
+						).get("custom_vat_return_credit_classification")
 						voucher.incl_tax_amount = (
 							incl_tax_leg.journal_entry_account_credit or incl_tax_leg.journal_entry_account_debit
 						)
-						voucher.classification_debugging += f"\n🚀 'Classify Credit entries..' for Account '{excl_tax_leg.journal_entry_account}' = '{voucher.classification}'"
+						trace.rule(
+							"account_credit_classification",
+							account=excl_tax_leg.journal_entry_account,
+							classification=voucher.classification,
+						)
 						continue
 
+		if progress_callback:
+			progress_callback(len(vouchers), len(vouchers))
+
 		return [voucher.voucher for voucher in vouchers.values()]
 
 
+@frappe.whitelist()
+def get_gl_entry_rows(
+	vat_return,
+	start=0,
+	page_length=GL_ENTRY_PAGE_LENGTH,
+	classification=None,
+	unclassified=False,
+):
+	"""
+	Return a page of the stored Transactions of the VAT return for the Transactions grid,
+	without the `classification_debugging` text (see `get_gl_entry_row_debugging`)
+
+	Filter on `classification`, or with `unclassified` on the transactions still to be classified
+	"""
+	frappe.get_doc("Value-added Tax Return", vat_return).check_permission("read")
+
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	conditions = (
+		(child.parent == vat_return)
+		& (child.parenttype == "Value-added Tax Return")
+		& (child.parentfield == "gl_entries")
+	)
+	if cint(unclassified):
+		conditions &= (
+			(child.classification.isnull() | (child.classification == "")) & (child.is_cancelled == 0)
+		)
+	elif classification:
+		conditions &= child.classification == classification
+
+	rows = (
+		frappe.qb.from_(child)
+		.select(
+			child.name,
+			child.idx,
+			*(
+				getattr(child, fieldname)
+				for fieldname in GL_ENTRY_ROW_FIELDS
+				if fieldname != "classification_debugging"
+			),
+		)
+		.where(conditions)
+		.orderby(child.idx)
+		.limit(cint(page_length))
+		.offset(cint(start))
+	).run(as_dict=True)
+	total = frappe.qb.from_(child).select(Count("*")).where(conditions).run()[0][0]
+
+	return {"rows": rows, "total": total}
+
+
+@frappe.whitelist()
+def get_gl_entry_row_debugging(vat_return, row):
+	"""
+	Return the `classification_debugging` text of one stored Transactions row
+	"""
+	frappe.get_doc("Value-added Tax Return", vat_return).check_permission("read")
+	return frappe.db.get_value(
+		"Value-added Tax Return GL Entry",
+		{"name": row, "parent": vat_return, "parenttype": "Value-added Tax Return"},
+		"classification_debugging",
+	)
+
+
+@frappe.whitelist()
+def set_gl_entry_row_classification(vat_return, row, classification=None):
+	"""
+	Manually classify one stored Transactions row from the Transactions grid and update the tax fields
+	"""
+	doc = frappe.get_doc("Value-added Tax Return", vat_return)
+	doc.check_permission("write")
+	if doc.docstatus != 0:
+		frappe.throw(_("Transactions can only be classified on draft returns"))
+
+	if classification and classification not in get_classification_options():
+		frappe.throw(_("{0} is not a valid classification").format(classification))
+
+	if not frappe.db.exists(
+		"Value-added Tax Return GL Entry",
+		{"name": row, "parent": vat_return, "parenttype": "Value-added Tax Return"},
+	):
+		frappe.throw(_("Transaction {0} does not belong to {1}").format(row, vat_return))
+
+	update_gl_entry_row(row, {"classification": classification or None})
+	doc.update_tax_fields(get_classification_totals_from_db(vat_return))
+
+
+def get_gl_entries_job_id(vat_return):
+	return f"vat_return_get_gl_entries::{vat_return}"
+
+
+def get_gl_entries_in_background(vat_return, incremental=False):
+	"""
+	Background job for `ValueaddedTaxReturn.enqueue_get_gl_entries`
+	"""
+	doc = frappe.get_doc("Value-added Tax Return", vat_return)
+	try:
+		if incremental and doc.last_synced_on:
+			doc.sync_gl_entries(
+				progress_callback=lambda saved: doc.publish_gl_entries_progress("saved", saved=saved)
+			)
+		elif classifies_gl_entries_at_posting(doc.company):
+			classified_entries = get_posted_gl_entries(doc.company, doc.date_from, doc.date_to)
+			doc.publish_gl_entries_progress("fetched", fetched=len(classified_entries))
+			doc.set_gl_entries(
+				classified_entries,
+				progress_callback=lambda saved: doc.publish_gl_entries_progress(
+					"saved", saved=saved, total=len(classified_entries)
+				),
+			)
+		else:
+			gl_entries = doc.fetch_gl_entries()
+			doc.publish_gl_entries_progress("fetched", fetched=len(gl_entries))
+
+			classified_entries = doc.process_gl_entries(
+				gl_entries,
+				progress_callback=lambda classified, total: doc.publish_gl_entries_progress(
+					"classified", classified=classified, total=total
+				),
+			)
+			doc.set_gl_entries(
+				classified_entries,
+				progress_callback=lambda saved: doc.publish_gl_entries_progress(
+					"saved", saved=saved, total=len(classified_entries)
+				),
+			)
+	except Exception:
+		doc.publish_gl_entries_progress("failed")
+		raise
+
+	doc.publish_gl_entries_progress("done")
+
+
+def get_existing_gl_entry_rows(vat_return, gl_entries):
+	"""
+	Return the stored Transactions rows of the VAT return for the given GL Entries, with the GL Entry as key
+	"""
+	existing_rows = {}
+	for batch in create_batch(gl_entries, GL_ENTRIES_BATCH_SIZE):
+		for row in frappe.get_all(
+			"Value-added Tax Return GL Entry",
+			filters={
+				"parent": vat_return,
+				"parenttype": "Value-added Tax Return",
+				"parentfield": "gl_entries",
+				"gl_entry": ["in", batch],
+			},
+			fields=["name", "gl_entry", "classification"],
+		):
+			existing_rows[row.gl_entry] = row
+
+	return existing_rows
+
+
+def get_last_gl_entry_row_idx(vat_return):
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	last_idx = (
+		frappe.qb.from_(child)
+		.select(Max(child.idx))
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+		)
+	).run()
+	return cint(last_idx[0][0]) if last_idx else 0
+
+
+def delete_gl_entry_rows(vat_return):
+	"""
+	Delete the stored Transactions rows of the VAT return in one statement
+	"""
+	frappe.db.delete(
+		"Value-added Tax Return GL Entry",
+		{"parent": vat_return, "parenttype": "Value-added Tax Return", "parentfield": "gl_entries"},
+	)
+
+
+def delete_missing_gl_entry_rows(vat_return):
+	"""
+	Delete the stored Transactions rows of the VAT return whose GL Entry no longer exists. Ledger
+	reposts delete GL Entries and post new ones, which a sync of the changed GL Entries does not see.
+	"""
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	gle = frappe.qb.DocType("GL Entry")
+	missing_rows = (
+		frappe.qb.from_(child)
+		.left_join(gle)
+		.on(gle.name == child.gl_entry)
+		.select(child.name)
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+			& gle.name.isnull()
+		)
+	).run(pluck=True)
+
+	for batch in create_batch(missing_rows, GL_ENTRIES_BATCH_SIZE):
+		frappe.db.delete("Value-added Tax Return GL Entry", {"name": ["in", batch]})
+
+
+def set_gl_entry_rows_docstatus(vat_return, docstatus):
+	"""
+	Submit or cancel the stored Transactions rows with the VAT return, in one statement, as they
+	are not loaded with the document
+	"""
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	(
+		frappe.qb.update(child)
+		.set(child.docstatus, docstatus)
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+		)
+	).run()
+
+
+def copy_gl_entry_rows(source, vat_return):
+	"""
+	Insert the stored Transactions rows of the `source` VAT return for `vat_return`, in their order
+	"""
+	rows = frappe.get_all(
+		"Value-added Tax Return GL Entry",
+		filters={
+			"parent": source,
+			"parenttype": "Value-added Tax Return",
+			"parentfield": "gl_entries",
+		},
+		fields=list(GL_ENTRY_ROW_FIELDS),
+		order_by="idx",
+	)
+	insert_gl_entry_rows(vat_return, rows)
+
+
+def insert_gl_entry_rows(vat_return, rows, start_idx=1, progress_callback=None):
+	"""
+	Insert Transactions rows for the VAT return with multi-row inserts of GL_ENTRIES_BATCH_SIZE rows.
+	`progress_callback(inserted)` is called after every batch.
+	"""
+	now = now_datetime()
+	user = frappe.session.user
+	fields = [
+		"name",
+		"parent",
+		"parenttype",
+		"parentfield",
+		"idx",
+		"docstatus",
+		"owner",
+		"modified_by",
+		"creation",
+		"modified",
+		*GL_ENTRY_ROW_FIELDS,
+	]
+
+	inserted = 0
+	for batch in create_batch(rows, GL_ENTRIES_BATCH_SIZE):
+		values = []
+		for row in batch:
+			values.append(
+				[
+					frappe.generate_hash(length=10),
+					vat_return.name,
+					vat_return.doctype,
+					"gl_entries",
+					start_idx + inserted,
+					vat_return.docstatus,
+					user,
+					user,
+					now,
+					now,
+					*(row[fieldname] for fieldname in GL_ENTRY_ROW_FIELDS),
+				]
+			)
+			inserted += 1
+
+		frappe.db.bulk_insert("Value-added Tax Return GL Entry", fields, values)
+		if progress_callback:
+			progress_callback(inserted)
+
+
+def update_gl_entry_row(name, values):
+	frappe.db.set_value("Value-added Tax Return GL Entry", name, values, update_modified=False)
+
+
+GL_ENTRY_ROW_FIELDS = (
+	"gl_entry",
+	"posting_date",
+	"voucher_type",
+	"voucher_no",
+	"taxes_and_charges",
+	"tax_account_debit",
+	"tax_account_credit",
+	"classification",
+	"classification_debugging",
+	"tax_amount",
+	"incl_tax_amount",
+	"is_cancelled",
+)
+
+
+def get_gl_entry_row(entry):
+	"""
+	Map a classified GL Entry to a 'Value-added Tax Return GL Entry' row
+	"""
+	return {
+		"gl_entry": entry.name,
+		"posting_date": entry.posting_date,
+		"voucher_type": entry.voucher_type,
+		"voucher_no": entry.voucher_no,
+		"taxes_and_charges": entry.taxes_and_charges_template,
+		"tax_account_debit": entry.general_ledger_debit,
+		"tax_account_credit": entry.general_ledger_credit,
+		"classification": entry.classification,
+		"classification_debugging": render_classification_trace(entry),
+		"tax_amount": entry.tax_amount,
+		"incl_tax_amount": entry.incl_tax_amount,
+		"is_cancelled": entry.is_cancelled,
+	}
+
+
+def get_posted_gl_entries(company, date_from, date_to, modified_since=None):
+	"""
+	The GL Entries of the company in the period as classified when their vouchers were posted, see
+	`classify_voucher_gl_entries`, in the shape `process_gl_entries` returns them. This is a range
+	scan of the (company, posting_date, classification) index.
+	"""
+	posted = frappe.qb.DocType("Value-added Tax GL Entry Classification")
+	query = (
+		frappe.qb.from_(posted)
+		.select(
+			posted.gl_entry.as_("name"),
+			posted.posting_date,
+			posted.voucher_type,
+			posted.voucher_no,
+			posted.taxes_and_charges.as_("taxes_and_charges_template"),
+			posted.tax_account_debit.as_("general_ledger_debit"),
+			posted.tax_account_credit.as_("general_ledger_credit"),
+			posted.classification,
+			posted.classification_debugging,
+			posted.tax_amount,
+			posted.incl_tax_amount,
+			posted.is_cancelled,
+		)
+		.where(
+			(posted.company == company)
+			& (posted.posting_date >= date_from)
+			& (posted.posting_date <= date_to)
+		)
+	)
+
+	if modified_since:
+		query = query.where(posted.modified > modified_since)
+
+	return query.run(as_dict=True)
+
+
+def render_classification_trace(entry):
+	"""
+	The `classification_debugging` text of a classified GL Entry
+	"""
+	if entry.classification_trace:
+		return entry.classification_trace.render()
+
+	return entry.classification_debugging
+
+
+def get_journal_entry_legs(journal_entries):
+	"""
+	Retrieve the Journal Entry Account rows of the given Journal Entries, in batches of
+	GL_ENTRIES_BATCH_SIZE, as a dict with the Journal Entry name as key and its legs in idx order
+	"""
+	je = frappe.qb.DocType("Journal Entry")
+	jea = frappe.qb.DocType("Journal Entry Account")
+
+	journal_entry_legs = defaultdict(list)
+	for batch in create_batch(sorted(journal_entries), GL_ENTRIES_BATCH_SIZE):
+		legs = (
+			frappe.qb.from_(jea)
+			.join(je)
+			.on(je.name == jea.parent)
+			.select(
+				jea.parent,
+				je.total_debit.as_("journal_entry_total_debit"),
+				je.total_credit.as_("journal_entry_total_credit"),
+				je.docstatus.as_("journal_entry_docstatus"),
+				jea.account.as_("journal_entry_account"),
+				jea.debit.as_("journal_entry_account_debit"),
+				jea.credit.as_("journal_entry_account_credit"),
+				jea.idx.as_("journal_entry_account_idx"),
+			)
+			.where(jea.parent.isin(batch))
+			.orderby(jea.parent)
+			.orderby(jea.idx)
+		).run(as_dict=True)
+
+		for leg in legs:
+			journal_entry_legs[leg.pop("parent")].append(leg)
+
+	return journal_entry_legs
+
+
+def get_invoice_taxes(doctype, invoices):
+	"""
+	Retrieve the Taxes and Charges Template and the first tax row of the given Sales or Purchase
+	Invoices, in batches of GL_ENTRIES_BATCH_SIZE, as a dict with the invoice name as key
+	"""
+	prefix = "sales_invoice_taxes" if doctype == "Sales Invoice" else "purchase_invoice_taxes"
+	invoice = frappe.qb.DocType(doctype)
+	taxes = frappe.qb.DocType(
+		"Sales Taxes and Charges" if doctype == "Sales Invoice" else "Purchase Taxes and Charges"
+	)
+
+	# Only the first tax row (lowest idx) is joined, the others are not used for classification
+	other_taxes = taxes.as_("other_taxes")
+	first_tax_idx = (
+		frappe.qb.from_(other_taxes)
+		.select(Min(other_taxes.idx))
+		.where(other_taxes.parent == invoice.name)
+	)
+
+	invoice_taxes = {}
+	for batch in create_batch(sorted(invoices), GL_ENTRIES_BATCH_SIZE):
+		rows = (
+			frappe.qb.from_(invoice)
+			.left_join(taxes)
+			.on((taxes.parent == invoice.name) & (taxes.idx == first_tax_idx))
+			.select(
+				invoice.name,
+				invoice.taxes_and_charges.as_("taxes_and_charges_template"),
+				taxes.tax_amount.as_(f"{prefix}_tax_amount"),
+				taxes.total.as_(f"{prefix}_total"),
+			)
+			.where(invoice.name.isin(batch))
+		).run(as_dict=True)
+
+		for row in rows:
+			invoice_taxes[row.pop("name")] = row
+
+	return invoice_taxes
+
+
+def merge_gl_entries(gl_entries, journal_entry_legs, invoice_taxes):
+	"""
+	Combine GL Entries with the legs of their Journal Entry, or the taxes of their Sales or Purchase
+	Invoice, into one flat row per GL Entry (one row per leg for Journal Entries)
+	"""
+	merged_entries = []
+	for entry in gl_entries:
+		if entry.voucher_type == "Journal Entry":
+			legs = journal_entry_legs.get(entry.voucher_no)
+			if legs:
+				merged_entries += [frappe._dict({**entry, **leg}) for leg in legs]
+				continue
+		elif entry.voucher_type in invoice_taxes:
+			entry.update(invoice_taxes[entry.voucher_type].get(entry.voucher_no) or {})
+
+		merged_entries.append(entry)
+
+	return merged_entries
+
+
+def split_contra_legs(legs):
+	"""
+	Split the legs of a Journal Entry into legs that are offset by a contra leg of the same amount,
+	and the remaining legs.
+
+	Each leg with a debit (or credit) is paired with the first leg, in idx order, that has a credit
+	(or debit) of the same amount. Debit and credit amounts are indexed up front, so this is O(n)
+	in the number of legs. Legs are tracked by their position, since distinct legs can compare equal.
+
+	Returns (filtered_out, remaining), where `filtered_out` lists the legs in the order they were paired
+	"""
+	first_leg_by_credit = {}
+	first_leg_by_debit = {}
+	for position, leg in enumerate(legs):
+		first_leg_by_credit.setdefault(leg.journal_entry_account_credit, position)
+		first_leg_by_debit.setdefault(leg.journal_entry_account_debit, position)
+
+	filtered_out = []
+	paired = set()
+	contra = None
+	for position, leg in enumerate(legs):
+		if position in paired:
+			continue
+
+		# A leg without debit and credit keeps the contra leg of the previous leg
+		if leg.journal_entry_account_debit != 0:
+			contra = first_leg_by_credit.get(leg.journal_entry_account_debit)
+		elif leg.journal_entry_account_credit != 0:
+			contra = first_leg_by_debit.get(leg.journal_entry_account_credit)
+
+		if contra is not None:
+			filtered_out += [contra, position]
+			paired.update((contra, position))
+
+	return (
+		[legs[position] for position in filtered_out],
+		[leg for position, leg in enumerate(legs) if position not in paired],
+	)
+
+
 def transform_gl_entries(gl_entries):
 	"""
 	Transform flat list of entries to a dict with voucher_no as key
@@ -466,3 +1181,130 @@ def transform_gl_entries(gl_entries):
 		].append(entry)
 
 	return vouchers
+
+
+def get_classification_totals(gl_entries):
+	"""
+	Walk the given Transactions rows once and total them per classification
+	        E.g.
+
+	        {
+	                "Output - A Standard rate (excl capital goods)": {
+	                        "tax_amount": 150,
+	                        "incl_tax_amount": 1150,
+	                        "tax_account_debit": 0,
+	                        "tax_account_credit": 150,
+	                        "count": 2,
+	                        "unclassified_count": 0,
+	                        "cancelled_count": 0,
+	                }
+	        }
+
+	Classifications without rows read as zero totals, so callers can look up any classification.
+	"""
+	classification_totals = defaultdict(
+		lambda: frappe._dict(
+			{
+				"tax_amount": 0,
+				"incl_tax_amount": 0,
+				"tax_account_debit": 0,
+				"tax_account_credit": 0,
+				"count": 0,
+				"unclassified_count": 0,
+				"cancelled_count": 0,
+			}
+		)
+	)
+	for row in gl_entries:
+		totals = classification_totals[row.classification]
+		totals.tax_amount += row.tax_amount or 0
+		totals.incl_tax_amount += row.incl_tax_amount or 0
+		totals.tax_account_debit += row.tax_account_debit or 0
+		totals.tax_account_credit += row.tax_account_credit or 0
+		totals.count += 1
+		if row.get("is_cancelled"):
+			totals.cancelled_count += 1
+		elif not row.classification:
+			totals.unclassified_count += 1
+
+	return classification_totals
+
+
+def get_linked_transactions_cache_key_prefix(vat_return):
+	return f"{LINKED_TRANSACTIONS_CACHE_KEY}::{vat_return}::"
+
+
+def clear_linked_transactions_cache(vat_return):
+	"""
+	Evict the pages of the Value-added Tax Return Linked Transactions report cached for the
+	VAT return
+	"""
+	frappe.cache.delete_keys(get_linked_transactions_cache_key_prefix(vat_return))
+
+
+def get_unclassified_vouchers(vat_return, limit=UNCLASSIFIED_VOUCHERS_SHOWN):
+	"""
+	The first `limit` vouchers, by posting date, with stored Transactions of the VAT return that
+	are not cancelled and not yet classified. Served by the (parent, classification, is_cancelled)
+	index, without loading the other Transactions.
+	"""
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	return (
+		frappe.qb.from_(child)
+		.select(child.voucher_type, child.voucher_no, child.posting_date)
+		.distinct()
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+			& (child.classification.isnull() | (child.classification == ""))
+			& (child.is_cancelled == 0)
+		)
+		.orderby(child.posting_date)
+		.orderby(child.voucher_no)
+		.limit(limit)
+	).run(as_dict=True)
+
+
+def get_classification_totals_from_db(vat_return):
+	"""
+	Same as `get_classification_totals`, aggregated in the database from the stored Transactions rows
+	"""
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	rows = (
+		frappe.qb.from_(child)
+		.select(
+			child.classification,
+			Sum(child.tax_amount).as_("tax_amount"),
+			Sum(child.incl_tax_amount).as_("incl_tax_amount"),
+			Sum(child.tax_account_debit).as_("tax_account_debit"),
+			Sum(child.tax_account_credit).as_("tax_account_credit"),
+			Count("*").as_("count"),
+			Sum(child.is_cancelled).as_("cancelled_count"),
+		)
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+		)
+		.groupby(child.classification)
+	).run(as_dict=True)
+
+	classification_totals = get_classification_totals([])
+	for row in rows:
+		classification = row.pop("classification") or None
+		totals = classification_totals[classification]
+		for key, value in row.items():
+			totals[key] += value or 0
+		if not classification:
+			totals.unclassified_count += (row.count or 0) - (row.cancelled_count or 0)
+
+	return classification_totals
+
+
+def get_classification_options():
+	"""
+	The classification options of the Transactions, "" being the unclassified Transactions
+	"""
+	meta = frappe.get_meta("Value-added Tax Return GL Entry")
+	return meta.get_options("classification").split("\n")
@@ -0,0 +1,56 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+from datetime import date
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from csf_za.tax_compliance.doctype.value_added_tax_return_period_summary.value_added_tax_return_period_summary import (
+	refresh_period_summary,
+)
+
+MODULE = "csf_za.tax_compliance.doctype.value_added_tax_return_period_summary.value_added_tax_return_period_summary"
+
+
+class TestValueaddedTaxReturnPeriodSummary(FrappeTestCase):
+	def test_refresh_period_summary(self):
+		totals = [
+			frappe._dict(
+				year=2024,
+				month=3,
+				classification="Output - E Exempt",
+				transactions_count=2,
+				tax_account_debit=None,
+				tax_account_credit=30,
+				tax_amount=30,
+				incl_tax_amount=230,
+			),
+			frappe._dict(
+				year=2024,
+				month=4,
+				classification="",
+				transactions_count=1,
+				tax_account_debit=15,
+				tax_account_credit=None,
+				tax_amount=-15,
+				incl_tax_amount=-115,
+			),
+		]
+
+		with patch(f"{MODULE}.frappe.qb") as mock_qb, patch(f"{MODULE}.frappe.db") as mock_db:
+			query = mock_qb.from_.return_value.select.return_value.where.return_value
+			query.groupby.return_value.run.return_value = totals
+			refresh_period_summary("VAT-RETURN-1", "Company 1")
+
+		mock_db.delete.assert_called_once_with(
+			"Value-added Tax Return Period Summary", {"vat_return": "VAT-RETURN-1"}
+		)
+		fields, values = mock_db.bulk_insert.call_args.args[1:3]
+		rows = [dict(zip(fields, row)) for row in values]
+		self.assertEqual([row["month"] for row in rows], [date(2024, 3, 1), date(2024, 4, 1)])
+		self.assertEqual([row["classification"] for row in rows], ["Output - E Exempt", None])
+		self.assertEqual([row["tax_account_debit"] for row in rows], [0, 15])
+		self.assertEqual({row["vat_return"] for row in rows}, {"VAT-RETURN-1"})
+		self.assertEqual({row["company"] for row in rows}, {"Company 1"})
@@ -0,0 +1,8 @@
+// Copyright (c) 2024, Dirk van der Laarse and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Value-added Tax Return Period Summary", {
+// 	refresh(frm) {
+
+// 	},
+// });
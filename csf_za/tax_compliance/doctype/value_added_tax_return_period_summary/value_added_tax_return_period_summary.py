@@ -0,0 +1,98 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+from datetime import date
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Count, Extract, Sum
+from frappe.utils import now_datetime
+from pypika import DatePart
+
+SUMMARY_FIELDS = (
+	"transactions_count",
+	"tax_account_debit",
+	"tax_account_credit",
+	"tax_amount",
+	"incl_tax_amount",
+)
+
+
+class ValueaddedTaxReturnPeriodSummary(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Value-added Tax Return Period Summary", ["company", "month"])
+
+
+def refresh_period_summary(vat_return, company):
+	"""
+	Replace the summary of the VAT return with the totals of its stored Transactions per month and
+	classification, aggregated in the database with one query
+	"""
+	child = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	rows = (
+		frappe.qb.from_(child)
+		.select(
+			Extract(DatePart.year, child.posting_date).as_("year"),
+			Extract(DatePart.month, child.posting_date).as_("month"),
+			child.classification,
+			Count("*").as_("transactions_count"),
+			Sum(child.tax_account_debit).as_("tax_account_debit"),
+			Sum(child.tax_account_credit).as_("tax_account_credit"),
+			Sum(child.tax_amount).as_("tax_amount"),
+			Sum(child.incl_tax_amount).as_("incl_tax_amount"),
+		)
+		.where(
+			(child.parent == vat_return)
+			& (child.parenttype == "Value-added Tax Return")
+			& (child.parentfield == "gl_entries")
+		)
+		.groupby(
+			Extract(DatePart.year, child.posting_date),
+			Extract(DatePart.month, child.posting_date),
+			child.classification,
+		)
+	).run(as_dict=True)
+
+	delete_period_summary(vat_return)
+	if not rows:
+		return
+
+	now = now_datetime()
+	user = frappe.session.user
+	frappe.db.bulk_insert(
+		"Value-added Tax Return Period Summary",
+		[
+			"name",
+			"vat_return",
+			"company",
+			"month",
+			"classification",
+			"owner",
+			"modified_by",
+			"creation",
+			"modified",
+			*SUMMARY_FIELDS,
+		],
+		[
+			[
+				frappe.generate_hash(length=10),
+				vat_return,
+				company,
+				date(int(row.year), int(row.month), 1),
+				row.classification or None,
+				user,
+				user,
+				now,
+				now,
+				*(row[fieldname] or 0 for fieldname in SUMMARY_FIELDS),
+			]
+			for row in rows
+		],
+	)
+
+
+def delete_period_summary(vat_return):
+	frappe.db.delete("Value-added Tax Return Period Summary", {"vat_return": vat_return})
@@ -1,9 +1,85 @@
 # Copyright (c) 2024, Dirk van der Laarse and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from csf_za.tax_compliance.doctype.value_added_tax_return_settings.value_added_tax_return_settings import (
+	ValueaddedTaxReturnSettings,
+	build_template_classifications,
+)
+
 
 class TestValueaddedTaxReturnSettings(FrappeTestCase):
-	pass
+	@patch(
+		"csf_za.tax_compliance.doctype.value_added_tax_return_settings.value_added_tax_return_settings.frappe.get_cached_doc"
+	)
+	def test_build_template_classifications(self, mock_get_cached_doc):
+		mock_get_cached_doc.return_value = frappe._dict(
+			{
+				"standard_rate_non_capital": "Standard VAT - SP",
+				"exempt": "Exempt - SP",
+				"input_goods_local": "Standard VAT - SP",
+				"additional_templates": [
+					frappe._dict(
+						{
+							"classification": "Output - A Standard rate (excl capital goods)",
+							"taxes_and_charges_template": "Standard VAT (Branch) - SP",
+						}
+					),
+					frappe._dict(
+						{
+							"classification": "Output - E Exempt",
+							"taxes_and_charges_template": "Standard VAT - SP",
+						}
+					),
+				],
+			}
+		)
+
+		self.assertEqual(
+			build_template_classifications("Sun Power Pty Ltd"),
+			{
+				("Sales Invoice", "Standard VAT - SP"): "Output - A Standard rate (excl capital goods)",
+				("Sales Invoice", "Exempt - SP"): "Output - E Exempt",
+				(
+					"Purchase Invoice",
+					"Standard VAT - SP",
+				): "Input - C Other goods supplied to you (excl capital goods)",
+				(
+					"Sales Invoice",
+					"Standard VAT (Branch) - SP",
+				): "Output - A Standard rate (excl capital goods)",
+			},
+		)
+
+	def test_gl_entry_classifications_changed(self):
+		def get_settings(**kwargs):
+			return ValueaddedTaxReturnSettings(
+				{
+					"doctype": "Value-added Tax Return Settings",
+					"company": "Sun Power Pty Ltd",
+					"classify_at_posting": 1,
+					"transaction_classification": "Taxes and Charges Templates",
+					"standard_rate_non_capital": "Standard VAT - SP",
+					"tax_accounts": [{"account": "VAT - SP"}],
+					**kwargs,
+				}
+			)
+
+		settings = get_settings()
+		self.assertTrue(settings.gl_entry_classifications_changed())
+
+		settings._doc_before_save = get_settings()
+		self.assertFalse(settings.gl_entry_classifications_changed())
+
+		settings._doc_before_save = get_settings(classification_trace="Full")
+		self.assertFalse(settings.gl_entry_classifications_changed())
+
+		settings._doc_before_save = get_settings(exempt="Exempt - SP")
+		self.assertTrue(settings.gl_entry_classifications_changed())
+
+		settings._doc_before_save = get_settings(tax_accounts=[{"account": "Input VAT - SP"}])
+		self.assertTrue(settings.gl_entry_classifications_changed())
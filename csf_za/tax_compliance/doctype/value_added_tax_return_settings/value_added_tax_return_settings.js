@@ -10,6 +10,14 @@ frappe.ui.form.on("Value-added Tax Return Settings", {
 			frm.trigger("auto_set_tax_accounts");
 		}
 
+		if (!frm.doc.__islocal && frm.doc.classify_at_posting) {
+			frm.add_custom_button(__("Rebuild Classifications"), function() {
+				if (frm.is_dirty()) frappe.throw(__("Please save before proceeding."))
+				frm.call("enqueue_rebuild_gl_entry_classifications").then(() => {
+					frappe.show_alert(__("Classifying the transactions posted so far in the background"));
+				});
+			});
+		}
 	},
 	set_intro_text(frm){
 		intro_text = `
@@ -168,6 +176,13 @@ frappe.ui.form.on("Value-added Tax Return Settings", {
 				};
 			});
 		});
+		frm.set_query("taxes_and_charges_template", "additional_templates", () => {
+			return {
+				filters: {
+					company: ["=", frm.doc.company],
+				},
+			};
+		});
 	},
 	transaction_classification(frm) {
 		if (frm.doc.transaction_classification) {
@@ -205,3 +220,17 @@ frappe.ui.form.on("Value-added Tax Return Settings", {
 			});		
 	}
 });
+
+frappe.ui.form.on("Value-added Tax Return Settings Template", {
+	classification(frm, cdt, cdn) {
+		// Output classifications map Sales templates, Input classifications map Purchase templates
+		const row = locals[cdt][cdn];
+		const template_doctype = row.classification.startsWith("Output")
+			? "Sales Taxes and Charges Template"
+			: "Purchase Taxes and Charges Template";
+		if (row.template_doctype !== template_doctype) {
+			frappe.model.set_value(cdt, cdn, "template_doctype", template_doctype);
+			frappe.model.set_value(cdt, cdn, "taxes_and_charges_template", "");
+		}
+	}
+});
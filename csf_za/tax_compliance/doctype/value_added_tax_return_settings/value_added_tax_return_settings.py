@@ -1,8 +1,19 @@
 # Copyright (c) 2024, Dirk van der Laarse and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
+from frappe import _
 from frappe.model.document import Document
+from frappe.utils import cint
+
+TEMPLATE_CLASSIFICATIONS_CACHE_KEY = "vat_return_template_classifications"
+GL_ENTRY_CLASSIFICATIONS_JOB_TIMEOUT = 4 * 60 * 60
+
+# Taxes and Charges Template doctype and invoice doctype per classification direction
+TEMPLATE_DOCTYPES = {
+	"Output": ("Sales Taxes and Charges Template", "Sales Invoice"),
+	"Input": ("Purchase Taxes and Charges Template", "Purchase Invoice"),
+}
 
 VAT_RETURN_SETTING_FIELD_MAP = [
 	{
@@ -54,4 +65,180 @@ VAT_RETURN_SETTING_FIELD_MAP = [
 
 
 class ValueaddedTaxReturnSettings(Document):
-	pass
+	def validate(self):
+		for row in self.additional_templates:
+			row.template_doctype = get_template_doctypes(row.classification)[0]
+
+	def on_update(self):
+		clear_template_classifications_cache(self.name)
+		if self.classify_at_posting and self.gl_entry_classifications_changed():
+			enqueue_rebuild_gl_entry_classifications(self.name)
+
+	def on_trash(self):
+		clear_template_classifications_cache(self.name)
+
+	@frappe.whitelist()
+	def enqueue_rebuild_gl_entry_classifications(self):
+		"""
+		Classify the GL Entries posted so far again in the background, e.g. after a ledger repost
+		replaced GL Entries without submitting or cancelling their vouchers
+		"""
+		self.check_permission("write")
+		if not self.classify_at_posting:
+			frappe.throw(_("Transactions are not classified when posted for {0}").format(self.name))
+
+		enqueue_rebuild_gl_entry_classifications(self.name)
+
+	def gl_entry_classifications_changed(self):
+		"""
+		Whether a setting the stored GL Entry classifications depend on changed with this save
+		"""
+		doc_before_save = self.get_doc_before_save()
+		if not doc_before_save:
+			return True
+
+		fieldnames = [
+			"classify_at_posting",
+			"transaction_classification",
+			*(entry["field_name"] for entry in VAT_RETURN_SETTING_FIELD_MAP),
+		]
+		if any(self.has_value_changed(fieldname) for fieldname in fieldnames):
+			return True
+
+		tables = {
+			"tax_accounts": ("account",),
+			"additional_templates": ("classification", "taxes_and_charges_template"),
+		}
+		return any(
+			get_table_values(self, table, fields) != get_table_values(doc_before_save, table, fields)
+			for table, fields in tables.items()
+		)
+
+
+def get_table_values(doc, table, fields):
+	return [tuple(row.get(field) for field in fields) for row in doc.get(table) or []]
+
+
+def get_template_doctypes(classification):
+	"""
+	Return the (Taxes and Charges Template doctype, invoice doctype) for a classification
+	"""
+	return TEMPLATE_DOCTYPES[classification.split(" - ")[0]]
+
+
+def get_template_classifications(company):
+	"""
+	Return the classification per (invoice doctype, Taxes and Charges Template) for the company,
+	cached until its Value-added Tax Return Settings are saved
+	        E.g.
+
+	        {
+	                ("Sales Invoice", "South Africa Tax - SP"): "Output - A Standard rate (excl capital goods)",
+	                ("Purchase Invoice", "South Africa Tax - SP"): "Input - C Other goods supplied to you (excl capital goods)",
+	        }
+	"""
+	return frappe.cache.hget(
+		TEMPLATE_CLASSIFICATIONS_CACHE_KEY,
+		company,
+		lambda: build_template_classifications(company),
+	)
+
+
+def build_template_classifications(company):
+	vat_return_settings = frappe.get_cached_doc("Value-added Tax Return Settings", company)
+
+	# The field names on 'Value-added Tax Return Settings' correspond to classifications.
+	# When a template is mapped more than once, the first classification wins.
+	template_classifications = {}
+	for entry in VAT_RETURN_SETTING_FIELD_MAP:
+		template = vat_return_settings.get(entry["field_name"])
+		if template:
+			template_classifications.setdefault(
+				(entry["reference_doctype"], template), entry["classification"]
+			)
+
+	for row in vat_return_settings.get("additional_templates") or []:
+		reference_doctype = get_template_doctypes(row.classification)[1]
+		template_classifications.setdefault(
+			(reference_doctype, row.taxes_and_charges_template), row.classification
+		)
+
+	return template_classifications
+
+
+def get_account_classifications(company=None, accounts=None):
+	"""
+	Return the Accounts of a company, or the given Accounts, with their debit and credit classifications
+	for manual Journal Entries, in one query
+	        E.g.
+
+	        {
+	                "Bank Charges - SP": {
+	                        "name": "Bank Charges - SP",
+	                        "company": "Sun Power Pty Ltd",
+	                        "account_type": "Expense Account",
+	                        "custom_vat_return_debit_classification": "Input - C Other goods supplied to you (excl capital goods)",
+	                        "custom_vat_return_credit_classification": None,
+	                }
+	        }
+	"""
+	filters = {}
+	if company:
+		filters["company"] = company
+	if accounts is not None:
+		if not accounts:
+			return {}
+		filters["name"] = ["in", list(accounts)]
+
+	return {
+		account.name: account
+		for account in frappe.get_all(
+			"Account",
+			filters=filters,
+			fields=[
+				"name",
+				"company",
+				"account_type",
+				"custom_vat_return_debit_classification",
+				"custom_vat_return_credit_classification",
+			],
+			order_by="name",
+		)
+	}
+
+
+def classifies_gl_entries_at_posting(company):
+	"""
+	Whether the GL Entries of the company are classified when their vouchers are posted, see
+	`value_added_tax_gl_entry_classification`
+	"""
+	if not company:
+		return False
+
+	return bool(
+		cint(
+			frappe.db.get_value(
+				"Value-added Tax Return Settings", company, "classify_at_posting", cache=True
+			)
+		)
+	)
+
+
+def enqueue_rebuild_gl_entry_classifications(company):
+	"""
+	Classify the GL Entries of the company posted so far again in a background job, as the settings
+	they were classified with have changed
+	"""
+	frappe.enqueue(
+		"csf_za.tax_compliance.doctype.value_added_tax_gl_entry_classification.value_added_tax_gl_entry_classification.rebuild_gl_entry_classifications",
+		queue="long",
+		timeout=GL_ENTRY_CLASSIFICATIONS_JOB_TIMEOUT,
+		job_id=f"vat_gl_entry_classifications_rebuild::{company}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+		company=company,
+	)
+
+
+def clear_template_classifications_cache(company):
+	frappe.cache.hdel(TEMPLATE_CLASSIFICATIONS_CACHE_KEY, company)
@@ -0,0 +1,14 @@
+// Copyright (c) 2024, Dirk van der Laarse and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Account Classifications for VAT Return"] = {
+	"filters": [
+		{
+			"fieldname": "company",
+			"label": __("Company"),
+			"fieldtype": "Link",
+			"options": "Company",
+			"reqd": 1
+		},
+	],
+};
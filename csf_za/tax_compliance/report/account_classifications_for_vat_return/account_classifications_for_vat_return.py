@@ -0,0 +1,55 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+from frappe import _
+
+from csf_za.tax_compliance.doctype.value_added_tax_return_settings.value_added_tax_return_settings import (
+	get_account_classifications,
+)
+
+
+def execute(filters=None):
+	columns, data = get_columns(filters), get_data(filters)
+	return columns, data
+
+
+def get_columns(filters):
+	columns = [
+		{
+			"fieldname": "company",
+			"label": _("Company"),
+			"fieldtype": "Link",
+			"options": "Company",
+			"width": 150,
+		},
+		{
+			"fieldname": "name",
+			"label": _("Account Name"),
+			"fieldtype": "Link",
+			"options": "Account",
+			"width": 300,
+		},
+		{
+			"fieldname": "account_type",
+			"label": _("Account Type"),
+			"fieldtype": "Data",
+			"width": 150,
+		},
+		{
+			"fieldname": "custom_vat_return_debit_classification",
+			"label": _("Debit Classification"),
+			"fieldtype": "Data",
+			"width": 300,
+		},
+		{
+			"fieldname": "custom_vat_return_credit_classification",
+			"label": _("Credit Classification"),
+			"fieldtype": "Data",
+			"width": 300,
+		},
+	]
+	return columns
+
+
+def get_data(filters):
+	return list(get_account_classifications(company=filters.get("company")).values())
@@ -0,0 +1,44 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from csf_za.tax_compliance.report.value_added_tax_analytics.value_added_tax_analytics import (
+	add_year_over_year,
+)
+
+
+class TestValueaddedTaxAnalytics(FrappeTestCase):
+	def test_add_year_over_year(self):
+		data = [get_summary_row("2024-03-01", 30), get_summary_row("2024-04-01", 10)]
+		previous_year = [get_summary_row("2023-03-01", 20), get_summary_row("2023-05-01", -5)]
+
+		add_year_over_year(data, previous_year, add_missing=True)
+
+		march, april, may = data
+		self.assertEqual(march.previous_year_tax_amount, 20)
+		self.assertEqual(march.tax_amount_change, 10)
+		self.assertEqual(march.tax_amount_change_percentage, 50)
+		self.assertEqual(march.incl_tax_amount_change, 100)
+		self.assertEqual(april.previous_year_tax_amount, 0)
+		self.assertIsNone(april.tax_amount_change_percentage)
+		# Totals of a year earlier without any this year
+		self.assertEqual(str(may.period), "2024-05-01")
+		self.assertEqual(may.tax_amount, 0)
+		self.assertEqual(may.tax_amount_change, 5)
+		self.assertEqual(may.tax_amount_change_percentage, 100)
+
+
+def get_summary_row(period, tax_amount, classification="Output - E Exempt"):
+	"""
+	A row of the period summaries the report totals, with the tax inclusive amount 10 times the
+	tax amount
+	"""
+	return frappe._dict(
+		company="Company 1",
+		period=period,
+		classification=classification,
+		tax_amount=tax_amount,
+		incl_tax_amount=tax_amount * 10,
+	)
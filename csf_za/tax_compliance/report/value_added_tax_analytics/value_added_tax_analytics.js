@@ -0,0 +1,43 @@
+// Copyright (c) 2024, Dirk van der Laarse and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Value-added Tax Analytics"] = {
+	"filters": [
+		{
+			"fieldname": "company",
+			"label": __("Company"),
+			"fieldtype": "MultiSelectList",
+			get_data: function(txt) {
+				return frappe.db.get_link_options("Company", txt);
+			}
+		},
+		{
+			"fieldname": "from_date",
+			"label": __("From Date"),
+			"fieldtype": "Date",
+			"default": frappe.datetime.add_months(frappe.datetime.get_today(), -12),
+			"reqd": 1
+		},
+		{
+			"fieldname": "to_date",
+			"label": __("To Date"),
+			"fieldtype": "Date",
+			"default": frappe.datetime.get_today(),
+			"reqd": 1
+		},
+		{
+			"fieldname": "group_by",
+			"label": __("Group By"),
+			"fieldtype": "Select",
+			"options": "Month\nValue-added Tax Return",
+			"default": "Month"
+		},
+		{
+			"fieldname": "include_draft_returns",
+			"label": __("Include Draft Returns"),
+			"description": __("Draft returns overlapping a submitted return are left out"),
+			"default": 0,
+			"fieldtype": "Check"
+		},
+	],
+};
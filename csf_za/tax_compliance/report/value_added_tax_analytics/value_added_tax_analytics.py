@@ -0,0 +1,272 @@
+# Copyright (c) 2024, Dirk van der Laarse and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.query_builder.functions import Sum
+from frappe.utils import add_years, get_first_day, getdate
+from pypika import Criterion
+from pypika.terms import ExistsCriterion
+
+from csf_za.tax_compliance.doctype.value_added_tax_return_period_summary.value_added_tax_return_period_summary import (
+	SUMMARY_FIELDS,
+)
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	if getdate(filters.from_date) > getdate(filters.to_date):
+		frappe.throw(_("From Date must be before To Date"))
+
+	columns, data = get_columns(filters), get_data(filters)
+	return columns, data
+
+
+def get_columns(filters):
+	columns = [
+		{
+			"fieldname": "company",
+			"label": _("Company"),
+			"fieldtype": "Link",
+			"options": "Company",
+			"width": 200,
+		},
+	]
+	if filters.get("group_by") == "Value-added Tax Return":
+		columns += [
+			{
+				"fieldname": "vat_return",
+				"label": _("VAT Return"),
+				"fieldtype": "Link",
+				"options": "Value-added Tax Return",
+				"width": 250,
+			},
+			{
+				"fieldname": "period",
+				"label": _("Date From"),
+				"fieldtype": "Date",
+				"width": 100,
+			},
+			{
+				"fieldname": "date_to",
+				"label": _("Date To"),
+				"fieldtype": "Date",
+				"width": 100,
+			},
+		]
+	else:
+		columns.append(
+			{
+				"fieldname": "period",
+				"label": _("Month"),
+				"fieldtype": "Date",
+				"width": 100,
+			}
+		)
+
+	columns += [
+		{
+			"fieldname": "classification",
+			"label": _("Classification"),
+			"fieldtype": "Data",
+			"width": 300,
+		},
+		{
+			"fieldname": "transactions_count",
+			"label": _("Transactions"),
+			"fieldtype": "Int",
+			"width": 100,
+		},
+		{
+			"fieldname": "tax_amount",
+			"label": _("Tax Amount"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+		{
+			"fieldname": "previous_year_tax_amount",
+			"label": _("Tax Amount Previous Year"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+		{
+			"fieldname": "tax_amount_change",
+			"label": _("Tax Amount Change"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+		{
+			"fieldname": "tax_amount_change_percentage",
+			"label": _("Tax Amount Change (%)"),
+			"fieldtype": "Percent",
+			"width": 100,
+		},
+		{
+			"fieldname": "incl_tax_amount",
+			"label": _("Incl. Tax Amount"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+		{
+			"fieldname": "previous_year_incl_tax_amount",
+			"label": _("Incl. Tax Amount Previous Year"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+		{
+			"fieldname": "incl_tax_amount_change",
+			"label": _("Incl. Tax Amount Change"),
+			"fieldtype": "Currency",
+			"width": 120,
+		},
+	]
+	return columns
+
+
+def get_data(filters):
+	"""
+	The classification totals per month or per VAT return in the period, next to those of the same
+	period a year earlier. Read from the Value-added Tax Return Period Summary, never from the
+	Transactions of the returns.
+	"""
+	data = get_summary(filters, filters.from_date, filters.to_date)
+	previous_year = get_summary(
+		filters, add_years(filters.from_date, -1), add_years(filters.to_date, -1)
+	)
+	# Per VAT return, returns of a year earlier have no return of this year to be shown with
+	add_year_over_year(
+		data, previous_year, add_missing=filters.get("group_by") != "Value-added Tax Return"
+	)
+
+	# Ordered by company, period and classification, in the order of the classification options
+	classifications = get_classifications()
+	data.sort(
+		key=lambda row: (
+			row.company,
+			row.period,
+			classifications.index(row.classification or "")
+			if (row.classification or "") in classifications
+			else len(classifications),
+			row.classification or "",
+		)
+	)
+	for row in data:
+		row.classification = row.classification or _("Unclassified")
+
+	return data
+
+
+def get_summary(filters, from_date, to_date):
+	"""
+	The totals per company, month or VAT return, and classification. Per VAT return, the returns
+	starting in the period with all their months.
+
+	Draft returns are included on request, except those overlapping a submitted return of the
+	company, so a period is not counted twice.
+	"""
+	summary = frappe.qb.DocType("Value-added Tax Return Period Summary")
+	vat_return = frappe.qb.DocType("Value-added Tax Return")
+
+	if filters.get("include_draft_returns"):
+		submitted_return = frappe.qb.DocType("Value-added Tax Return").as_("submitted_return")
+		overlapping_submitted_return = ExistsCriterion(
+			frappe.qb.from_(submitted_return)
+			.select(submitted_return.name)
+			.where(
+				(submitted_return.docstatus == 1)
+				& (submitted_return.company == vat_return.company)
+				& (submitted_return.date_from <= vat_return.date_to)
+				& (submitted_return.date_to >= vat_return.date_from)
+			)
+		)
+		conditions = [
+			(vat_return.docstatus == 1)
+			| ((vat_return.docstatus == 0) & overlapping_submitted_return.negate())
+		]
+	else:
+		conditions = [vat_return.docstatus == 1]
+	if filters.get("company"):
+		companies = filters.company
+		conditions.append(
+			summary.company.isin(companies if isinstance(companies, list) else [companies])
+		)
+
+	query = (
+		frappe.qb.from_(summary)
+		.inner_join(vat_return)
+		.on(vat_return.name == summary.vat_return)
+		.select(
+			summary.company,
+			summary.classification,
+			*(Sum(getattr(summary, fieldname)).as_(fieldname) for fieldname in SUMMARY_FIELDS),
+		)
+	)
+	if filters.get("group_by") == "Value-added Tax Return":
+		conditions.append(
+			vat_return.date_from.between(get_first_day(from_date), getdate(to_date))
+		)
+		query = query.select(
+			vat_return.name.as_("vat_return"),
+			vat_return.date_from.as_("period"),
+			vat_return.date_to,
+		).groupby(
+			summary.company,
+			vat_return.name,
+			vat_return.date_from,
+			vat_return.date_to,
+			summary.classification,
+		)
+	else:
+		conditions.append(summary.month.between(get_first_day(from_date), getdate(to_date)))
+		query = query.select(summary.month.as_("period")).groupby(
+			summary.company, summary.month, summary.classification
+		)
+
+	return query.where(Criterion.all(conditions)).run(as_dict=True)
+
+
+def add_year_over_year(data, previous_year, add_missing=False):
+	"""
+	Set the totals of the same company, classification and period a year earlier on each row of
+	`data`, with the change since then. With `add_missing`, totals of a year earlier without a row
+	in `data` are added as rows with zero totals.
+	"""
+	previous_year_totals = {
+		(row.company, getdate(add_years(row.period, 1)), row.classification): row
+		for row in previous_year
+	}
+	if add_missing:
+		keys = {(row.company, getdate(row.period), row.classification) for row in data}
+		data += [
+			frappe._dict(
+				{
+					"company": key[0],
+					"period": key[1],
+					"classification": key[2],
+					**{fieldname: 0 for fieldname in SUMMARY_FIELDS},
+				}
+			)
+			for key in previous_year_totals
+			if key not in keys
+		]
+
+	for row in data:
+		previous = previous_year_totals.get(
+			(row.company, getdate(row.period), row.classification), {}
+		)
+		for fieldname in ("tax_amount", "incl_tax_amount"):
+			row[f"previous_year_{fieldname}"] = previous.get(fieldname) or 0
+			row[f"{fieldname}_change"] = (row[fieldname] or 0) - row[f"previous_year_{fieldname}"]
+
+		if row.previous_year_tax_amount:
+			row.tax_amount_change_percentage = (
+				row.tax_amount_change / abs(row.previous_year_tax_amount) * 100
+			)
+
+
+def get_classifications():
+	"""
+	The classification options, "" being the unclassified Transactions
+	"""
+	meta = frappe.get_meta("Value-added Tax Return Period Summary")
+	return meta.get_options("classification").split("\n")
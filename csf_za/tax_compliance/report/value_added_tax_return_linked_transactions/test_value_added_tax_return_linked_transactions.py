@@ -0,0 +1,98 @@
+# Copyright (c) 2024, Dirk van der Laarse and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.test_value_added_tax_return import (
+	assert_query_uses_index,
+	seed_query_plan_rows_for,
+)
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	get_classification_totals,
+)
+from csf_za.tax_compliance.report.value_added_tax_return_linked_transactions.value_added_tax_return_linked_transactions import (
+	get_query,
+	group_by_classification,
+)
+
+CLASSIFICATIONS = [
+	"",
+	"Output - A Standard rate (excl capital goods)",
+	"Output - C Zero Rated (excl goods exported)",
+	"Output - E Exempt",
+]
+
+
+class TestValueaddedTaxReturnLinkedTransactions(FrappeTestCase):
+	def setUp(self):
+		# Ordered as the report query orders them, a classification that is no longer an option last
+		self.data = [
+			frappe._dict(voucher_no="SINV-1", classification=None, tax_amount=5),
+			frappe._dict(voucher_no="SINV-2", classification="Output - E Exempt", tax_amount=10),
+			frappe._dict(voucher_no="SINV-3", classification="Output - E Exempt", tax_amount=20),
+			frappe._dict(voucher_no="SINV-4", classification="Output - E Exempt", tax_amount=30),
+			frappe._dict(voucher_no="SINV-5", classification="Output - Z Retired", tax_amount=40),
+		]
+		self.subtotals = get_classification_totals(
+			frappe._dict(row, classification=row.classification or "") for row in self.data
+		)
+
+	def test_group_by_classification(self):
+		output = list(group_by_classification(self.data, self.subtotals, CLASSIFICATIONS))
+
+		self.assertEqual(
+			[row.get("voucher_no") or row.get("name") for row in output if row],
+			[
+				"Unclassified",
+				"SINV-1",
+				"Total",
+				"Output - A Standard rate (excl capital goods)",
+				"Total",
+				"Output - C Zero Rated (excl goods exported)",
+				"Total",
+				"Output - E Exempt",
+				"SINV-2",
+				"SINV-3",
+				"SINV-4",
+				"Total",
+				"Output - Z Retired",
+				"SINV-5",
+				"Total",
+			],
+		)
+		totals = [row["tax_amount"] for row in output if row.get("name") == "Total"]
+		self.assertEqual(totals, [5, 0, 0, 60, 40])
+
+	def test_group_by_classification_pages(self):
+		"""
+		The pages of the report, put together, are the report on one page
+		"""
+		report = list(group_by_classification(self.data, self.subtotals, CLASSIFICATIONS))
+
+		for page_length in range(1, len(self.data) + 1):
+			pages = []
+			for start in range(0, len(self.data), page_length):
+				end = start + page_length
+				pages += group_by_classification(
+					self.data[start:end],
+					self.subtotals,
+					CLASSIFICATIONS,
+					previous_row=self.data[start - 1] if start else None,
+					next_row=self.data[end] if end < len(self.data) else None,
+				)
+			self.assertEqual(pages, report, f"{page_length} Transactions per page")
+
+	def test_query_plan_uses_index(self):
+		"""
+		The report query is served by the index of the `add_vat_return_indexes` patch, instead of
+		a full table scan
+		"""
+		seed_query_plan_rows_for(self)
+
+		assert_query_uses_index(
+			self,
+			get_query({"vat_return": "VAT-RETURN-1", "classification": "Output - E Exempt"}),
+			"tabValue-added Tax Return GL Entry",
+			"parent_classification_is_cancelled_index",
+		)
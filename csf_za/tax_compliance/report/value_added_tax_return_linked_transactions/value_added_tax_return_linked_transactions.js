@@ -21,7 +21,7 @@ frappe.query_reports["Value-added Tax Return Linked Transactions"] = {
 			"label": __("Show all Classifications"),
 			"fieldtype": "Check",
 			on_change: function() {
-				frappe.query_report.set_filter_value('classification', "");
+				frappe.query_report.set_filter_value({classification: "", page: 1});
 			}
 		},
 		{
@@ -30,5 +30,21 @@ frappe.query_reports["Value-added Tax Return Linked Transactions"] = {
 			"default": 0,
 			"fieldtype": "Check"
 		},
+		{
+			"fieldname": "page",
+			"label": __("Page"),
+			"fieldtype": "Int",
+			"default": 1
+		},
+		{
+			"fieldname": "page_length",
+			"label": __("Transactions per Page"),
+			"fieldtype": "Select",
+			"options": "500\n1000\n5000\n20000",
+			"default": "1000",
+			on_change: function() {
+				frappe.query_report.set_filter_value("page", 1);
+			}
+		},
 	],
 };
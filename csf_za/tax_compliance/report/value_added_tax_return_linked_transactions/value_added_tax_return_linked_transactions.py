@@ -1,14 +1,53 @@
 # Copyright (c) 2024, Dirk van der Laarse and contributors
 # For license information, please see license.txt
 
+import hashlib
+import json
+import math
+from itertools import groupby
+
 import frappe
 from frappe import _
-from pypika import Criterion
+from frappe.query_builder.functions import Sum
+from frappe.utils import cint
+from pypika import Case, Criterion
+
+from csf_za.tax_compliance.doctype.value_added_tax_return.value_added_tax_return import (
+	get_classification_totals,
+	get_linked_transactions_cache_key_prefix,
+)
+
+PAGE_LENGTH = 1000
+MAX_PAGE_LENGTH = 20000
+REPORT_CACHE_TTL = 60 * 60
+# The filters a page of the report depends on, see `get_cache_key`
+CACHED_FILTERS = (
+	"classification",
+	"include_cancelled",
+	"show_all_classifications",
+	"page",
+	"page_length",
+)
 
 
 def execute(filters=None):
-	columns, data = get_columns(filters), get_data(filters)
-	return columns, data
+	"""
+	A page of the Transactions of the VAT return, cached per VAT return, filters and the `modified`
+	timestamp of the VAT return. The cached pages of a VAT return are evicted when it is saved, see
+	`clear_linked_transactions_cache`.
+	"""
+	filters = frappe._dict(filters or {})
+	modified = frappe.db.get_value("Value-added Tax Return", filters.get("vat_return"), "modified")
+	if not modified:
+		return get_columns(filters), []
+
+	cache_key = get_cache_key(filters, modified)
+	page = frappe.cache.get_value(cache_key)
+	if page is None:
+		page = get_page(filters)
+		frappe.cache.set_value(cache_key, page, expires_in_sec=REPORT_CACHE_TTL)
+
+	return get_columns(filters), page["data"], get_page_message(filters, page)
 
 
 def get_columns(filters):
@@ -85,28 +124,92 @@ def get_columns(filters):
 	return columns
 
 
-def get_data(filters):
-	vat_return = filters.get("vat_return")
-	classification = filters.get("classification")
-	show_all_classifications = filters.get("show_all_classifications")
-	include_cancelled = filters.get("include_cancelled")
+def get_cache_key(filters, modified):
+	cached_filters = json.dumps(
+		{fieldname: filters.get(fieldname) for fieldname in CACHED_FILTERS},
+		sort_keys=True,
+		default=str,
+	)
+	filters_hash = hashlib.md5(cached_filters.encode()).hexdigest()
+	prefix = get_linked_transactions_cache_key_prefix(filters.get("vat_return"))
+	return f"{prefix}{modified}::{filters_hash}"
 
-	vtr = frappe.qb.DocType("Value-added Tax Return")
-	vtre = frappe.qb.DocType("Value-added Tax Return GL Entry")
 
-	extra_criterions = []
-	if classification:
-		extra_criterions.append(vtre.classification == classification)
-	if not include_cancelled:
-		extra_criterions.append(vtre.is_cancelled == 0)
+def get_page_length(filters):
+	return min(cint(filters.get("page_length")) or PAGE_LENGTH, MAX_PAGE_LENGTH)
+
+
+def get_page(filters):
+	"""
+	The rows of the requested page and the number of Transactions over all pages.
+
+	Pages are LIMIT/OFFSET slices of the ordered Transactions. With 'Show all classifications', the
+	Transactions just before and after the page are fetched as well, so a classification running over
+	several pages gets its header row on the page of its first Transaction and its subtotal on the
+	page of its last.
+	"""
+	page_length = get_page_length(filters)
+	start = (max(cint(filters.get("page")), 1) - 1) * page_length
+	total = get_count(filters)
+
+	if not filters.get("show_all_classifications"):
+		data = get_query(filters).limit(page_length).offset(start).run(as_dict=True)
+		return {"data": data, "start": start, "total": total}
+
+	classifications = get_classifications()
+	offset = max(start - 1, 0)
+	rows = (
+		get_query(filters, classifications)
+		.limit(page_length + 1 + (start - offset))
+		.offset(offset)
+		.run(as_dict=True)
+	)
+	previous_row = rows.pop(0) if start and rows else None
+	next_row = rows.pop() if len(rows) > page_length else None
+	if start and not rows:
+		return {"data": [], "start": start, "total": total}
+
+	data = list(
+		group_by_classification(
+			rows,
+			get_subtotals(filters),
+			classifications,
+			previous_row=previous_row,
+			next_row=next_row,
+		)
+	)
+	return {"data": data, "start": start, "total": total}
+
+
+def get_page_message(filters, page):
+	if not page["total"]:
+		return None
+
+	page_length = get_page_length(filters)
+	if page["start"] >= page["total"]:
+		return _("No Transactions on this page, there are {0} Transactions in {1} pages").format(
+			page["total"], math.ceil(page["total"] / page_length)
+		)
+
+	return _("Showing Transactions {0} to {1} of {2}").format(
+		page["start"] + 1, min(page["start"] + page_length, page["total"]), page["total"]
+	)
+
+
+def get_query(filters, classifications=None):
+	"""
+	The Transactions of the VAT return, served by the (parent, classification, is_cancelled) index
+	of the `add_vat_return_indexes` patch, ordered by posting date and voucher. With
+	`classifications`, ordered by classification in that order first.
+	"""
+	vtre = frappe.qb.DocType("Value-added Tax Return GL Entry")
 
-	# Construct the query using Frappe query builder
+	# Construct the query using Frappe query builder. The rows are selected by `parent` directly,
+	# without a join on the VAT return, so the filters all fall on the index.
 	query = (
-		frappe.qb.from_(vtr)
-		.join(vtre)
-		.on(vtre.parent == vtr.name)
+		frappe.qb.from_(vtre)
 		.select(
-			vtr.name,
+			vtre.parent.as_("name"),
 			vtre.gl_entry,
 			vtre.voucher_type,
 			vtre.voucher_no,
@@ -119,47 +222,177 @@ def get_data(filters):
 			vtre.classification,
 			vtre.is_cancelled,
 		)
-		.where(vtr.name == vat_return)
-		.where(Criterion.all(extra_criterions))
+		.where(get_conditions(vtre, filters))
 	)
 
-	# Execute the query and fetch the result as a list of dictionaries
-	result = query.run(as_dict=True)
+	if classifications:
+		query = query.orderby(get_classification_position(vtre, classifications)).orderby(
+			vtre.classification
+		)
+
+	# The row name breaks ties, so the Transactions have the same order on every page
+	return query.orderby(vtre.posting_date).orderby(vtre.voucher_no).orderby(vtre.name)
+
 
-	if show_all_classifications:
-		return group_by_classification(result)
-	else:
-		return result
+def get_count(filters):
+	"""
+	The number of Transactions matching the filters, from the Classification Summary of the return
+	"""
+	return sum(
+		row.transactions_count - (0 if filters.get("include_cancelled") else row.cancelled_count)
+		for row in get_classification_summary(filters)
+	)
 
 
-def group_by_classification(data):
-	""" """
-	meta = frappe.get_meta("Value-added Tax Return GL Entry", cached=False)
-	classification_field = next(
-		(field for field in meta.fields if field.fieldname == "classification")
+def get_classification_summary(filters):
+	"""
+	The Classification Summary rows of the VAT return, of the filtered classification only if there
+	is one
+	"""
+	summary = frappe.get_all(
+		"Value-added Tax Return Classification Summary",
+		filters={
+			"parent": filters.get("vat_return"),
+			"parenttype": "Value-added Tax Return",
+			"parentfield": "classification_summary",
+		},
+		fields=[
+			"classification",
+			"transactions_count",
+			"cancelled_count",
+			"tax_amount",
+			"incl_tax_amount",
+			"tax_account_debit",
+			"tax_account_credit",
+		],
 	)
-	classifications = classification_field.options.split("\n")
+	if filters.get("classification"):
+		return [row for row in summary if row.classification == filters.get("classification")]
 
-	grouped_data = {classification: [] for classification in classifications}
-	output_data = []
-	for row in data:
-		grouped_data[row.classification].append(row)
+	return summary
 
-	for classification in grouped_data.keys():
-		output_data.append({"name": classification if classification else "Unclassified"})
-		sorted_chunk = sorted(grouped_data[classification], key=lambda x: (x.posting_date, x.voucher_no))
-		output_data += sorted_chunk
 
-		# Add subtotal row per classification
-		output_data.append(
-			{
-				"name": "Total",
-				"tax_account_debit": sum([row["tax_account_debit"] for row in sorted_chunk]),
-				"tax_account_credit": sum([row["tax_account_credit"] for row in sorted_chunk]),
-				"tax_amount": sum([row["tax_amount"] for row in sorted_chunk]),
-				"incl_tax_amount": sum([row["incl_tax_amount"] for row in sorted_chunk]),
-			}
+def get_subtotals(filters):
+	"""
+	Totals of the Transactions per classification, with "" as the classification of unclassified
+	Transactions. Including cancelled Transactions these are the totals of the Classification
+	Summary, otherwise they are summed in the database.
+	"""
+	subtotals = get_classification_totals([])
+	if filters.get("include_cancelled"):
+		for row in get_classification_summary(filters):
+			totals = subtotals[row.classification or ""]
+			totals.tax_amount += row.tax_amount or 0
+			totals.incl_tax_amount += row.incl_tax_amount or 0
+			totals.tax_account_debit += row.tax_account_debit or 0
+			totals.tax_account_credit += row.tax_account_credit or 0
+
+		return subtotals
+
+	vtre = frappe.qb.DocType("Value-added Tax Return GL Entry")
+	rows = (
+		frappe.qb.from_(vtre)
+		.select(
+			vtre.classification,
+			Sum(vtre.tax_amount).as_("tax_amount"),
+			Sum(vtre.incl_tax_amount).as_("incl_tax_amount"),
+			Sum(vtre.tax_account_debit).as_("tax_account_debit"),
+			Sum(vtre.tax_account_credit).as_("tax_account_credit"),
 		)
-		output_data.append({})
+		.where(get_conditions(vtre, filters))
+		.groupby(vtre.classification)
+	).run(as_dict=True)
+
+	for row in rows:
+		totals = subtotals[row.pop("classification") or ""]
+		for key, value in row.items():
+			totals[key] += value or 0
+
+	return subtotals
+
+
+def get_conditions(vtre, filters):
+	conditions = [
+		vtre.parent == filters.get("vat_return"),
+		vtre.parenttype == "Value-added Tax Return",
+		vtre.parentfield == "gl_entries",
+	]
+	if filters.get("classification"):
+		conditions.append(vtre.classification == filters.get("classification"))
+	if not filters.get("include_cancelled"):
+		conditions.append(vtre.is_cancelled == 0)
+
+	return Criterion.all(conditions)
 
-	return output_data
+
+def get_classifications():
+	"""
+	The classification options, "" being the unclassified Transactions
+	"""
+	return frappe.get_meta("Value-added Tax Return GL Entry").get_options("classification").split("\n")
+
+
+def get_classification_position(vtre, classifications):
+	"""
+	Position of the classification of a Transaction among the `classifications`, unknown
+	classifications coming last
+	"""
+	position = Case()
+	for idx, classification in enumerate(classifications):
+		if classification:
+			position = position.when(vtre.classification == classification, idx)
+		else:
+			position = position.when(vtre.classification.isnull() | (vtre.classification == ""), idx)
+
+	return position.else_(len(classifications))
+
+
+def group_by_classification(data, subtotals, classifications, previous_row=None, next_row=None):
+	"""
+	Yield a header row, the Transactions, a subtotal row and a blank row per classification in one
+	pass over `data`, which is ordered by classification as `get_query` orders it.
+
+	Every classification option is shown, followed by the classifications of Transactions that are
+	no longer an option. For a page of the Transactions, `previous_row` and `next_row` are the
+	Transactions just before and after the page: a classification continued from the previous page
+	gets no header row, one continued on the next page no subtotal, and the classifications without
+	Transactions are shown on the page of the next classification that has them.
+	"""
+	rows_by_classification = {
+		classification: list(rows)
+		for classification, rows in groupby(data, key=lambda row: row.classification or "")
+	}
+	options = set(classifications)
+	# As `get_query` orders them, by name after the options
+	unknown = sorted({*subtotals, *rows_by_classification}.difference(options))
+	order = [*classifications, *unknown]
+
+	first = 0
+	if previous_row:
+		first = order.index(previous_row.classification or "")
+		if not data or (data[0].classification or "") != order[first]:
+			first += 1
+
+	last = len(order) - 1
+	if next_row and data:
+		last = order.index(data[-1].classification or "")
+
+	for classification in order[first : last + 1]:
+		if not previous_row or classification != (previous_row.classification or ""):
+			yield {"name": classification or "Unclassified"}
+
+		yield from rows_by_classification.get(classification, [])
+
+		if next_row and classification == (next_row.classification or ""):
+			continue
+
+		# Add subtotal row per classification
+		totals = subtotals[classification]
+		yield {
+			"name": "Total",
+			"tax_account_debit": totals.tax_account_debit,
+			"tax_account_credit": totals.tax_account_credit,
+			"tax_amount": totals.tax_amount,
+			"incl_tax_amount": totals.incl_tax_amount,
+		}
+		yield {}